@@ -7,8 +7,12 @@ import datetime
 import threading
 import re
 import ssl
+import wave
+import shutil
+import subprocess
 import urllib3
-from flask import Flask, render_template, request, jsonify, send_file, url_for
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, send_file, url_for, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import yt_dlp
 import docx
@@ -16,11 +20,14 @@ from docx.shared import Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import traceback
 from config import config as app_config
+from transcript_cache import TranscriptCache, hash_bytes, hash_file
+from task_store import create_task_store
+from job_runner import JobQueue
+from session_reaper import SessionReaper
 import magic
 from langdetect import detect, LangDetectException
 from pydub import AudioSegment
-from pydub.silence import detect_silence
-import requests
+from audio_vad import detect_silence, detect_nonsilent
 
 # Отключаем проверку SSL сертификатов
 ssl._create_default_https_context = ssl._create_unverified_context
@@ -38,6 +45,23 @@ app.config['UPLOAD_FOLDER'] = config.UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = config.MAX_CONTENT_LENGTH
 app.config['SESSION_EXPIRY'] = config.SESSION_EXPIRY
 app.config['WHISPER_SERVICE_URL'] = config.WHISPER_SERVICE_URL
+app.config['TASK_EVENTS_KEEPALIVE'] = config.TASK_EVENTS_KEEPALIVE
+app.config['WHISPER_STREAM_URL'] = config.WHISPER_STREAM_URL
+app.config['WHISPER_SERVICE_URLS'] = config.WHISPER_SERVICE_URLS
+app.config['PARALLEL_MIN_DURATION'] = config.PARALLEL_MIN_DURATION
+app.config['PARALLEL_CHUNK_SECONDS'] = config.PARALLEL_CHUNK_SECONDS
+app.config['PARALLEL_CHUNK_OVERLAP_MS'] = config.PARALLEL_CHUNK_OVERLAP_MS
+app.config['PARALLEL_JOBS_PER_SERVICE'] = config.PARALLEL_JOBS_PER_SERVICE
+app.config['TASK_STORE_URL'] = config.TASK_STORE_URL
+app.config['TASK_TTL'] = config.TASK_TTL
+app.config['JOB_RUNNER'] = config.JOB_RUNNER
+app.config['JOB_QUEUE_PATH'] = config.JOB_QUEUE_PATH
+app.config['JOB_RUNNER_THREADS'] = config.JOB_RUNNER_THREADS
+app.config['BATCH_MAX_ITEMS'] = config.BATCH_MAX_ITEMS
+app.config['BATCH_CONCURRENCY'] = config.BATCH_CONCURRENCY
+app.config['YOUTUBE_PIPELINE'] = config.YOUTUBE_PIPELINE
+app.config['YOUTUBE_PIPELINE_CHUNK_SECONDS'] = config.YOUTUBE_PIPELINE_CHUNK_SECONDS
+app.config['VIDEO_INFO_TTL'] = config.VIDEO_INFO_TTL
 
 # Создание папки для загрузок, если её нет
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -46,9 +70,50 @@ os.makedirs(os.path.join(tempfile.gettempdir(), 'transcripts'), exist_ok=True)
 # Разрешенные расширения файлов
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg', 'flac', 'm4a', 'aac', 'opus', 'webm'}
 
-# Словарь для хранения статусов задач и сессий
-task_status = {}
-sessions = {}
+# Канонический формат аудио для Whisper: 16 кГц, моно, 16-bit PCM
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_SAMPLE_WIDTH = 2
+
+# Хранилища статусов задач и сессий (общие для всех воркеров при SQLite или Redis).
+# Значения - копии: изменения вносятся через update/append, а не правкой словаря
+task_status = create_task_store(app.config['TASK_STORE_URL'], 'task', app.config['TASK_TTL'])
+sessions = create_task_store(app.config['TASK_STORE_URL'], 'session', app.config['SESSION_EXPIRY'])
+batches = create_task_store(app.config['TASK_STORE_URL'], 'batch', app.config['TASK_TTL'])
+# Сведения о видео по ссылке (заполняются при проверке ссылки и используются при загрузке)
+video_info_cache = create_task_store(app.config['TASK_STORE_URL'], 'video_info',
+                                     app.config['VIDEO_INFO_TTL'])
+
+# Фоновое удаление истекших сессий и их DOCX-файлов
+session_reaper = SessionReaper(
+    sessions,
+    os.path.join(tempfile.gettempdir(), 'transcripts'),
+    app.config['SESSION_EXPIRY']
+)
+session_reaper.start()
+
+# Очередь фоновых задач для процесса job_runner.py (в режиме 'thread' не используется)
+job_queue = JobQueue(app.config['JOB_QUEUE_PATH']) if app.config['JOB_RUNNER'] == 'queue' else None
+if job_queue is not None and app.config['TASK_STORE_URL'].startswith('memory://'):
+    print("Внимание: при JOB_RUNNER=queue статусы задач из job_runner.py не видны с TASK_STORE_URL=memory://")
+
+# Кэш готовых транскрипций: повторная загрузка того же файла или ссылки не запускает модель
+transcript_cache = TranscriptCache(
+    config.TRANSCRIPT_CACHE_DIR,
+    config.TRANSCRIPT_CACHE_MAX_BYTES
+) if config.TRANSCRIPT_CACHE_ENABLED else None
+
+
+def start_job(name, *args):
+    """
+    Запуск фоновой задачи из JOB_FUNCTIONS
+
+    В режиме 'queue' задача ставится в очередь процесса job_runner.py и не
+    зависит от воркера, принявшего запрос; аргументы должны сериализоваться в JSON.
+    """
+    if job_queue is not None:
+        job_queue.put(name, args)
+    else:
+        threading.Thread(target=JOB_FUNCTIONS[name], args=args, daemon=True).start()
 
 
 def generate_task_id():
@@ -73,187 +138,110 @@ def format_time(seconds):
     return f"{minutes:02d}:{seconds:02d}"
 
 
-def check_and_convert_audio_channels(file_path, status_callback=None):
+def is_canonical_wav(file_path):
+    """Проверка, что файл уже является WAV 16 кГц моно 16-bit PCM"""
+    try:
+        with wave.open(file_path, 'rb') as wav_file:
+            return (wav_file.getnchannels() == 1
+                    and wav_file.getsampwidth() == AUDIO_SAMPLE_WIDTH
+                    and wav_file.getframerate() == AUDIO_SAMPLE_RATE
+                    and wav_file.getcomptype() == 'NONE')
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+def decode_audio_to_pcm(file_path):
     """
-    Проверяет количество каналов в аудиофайле и при необходимости конвертирует в моно
-    Использует ffmpeg напрямую для более надежной обработки
+    Однократное декодирование аудиофайла в 16 кГц моно PCM (s16le)
+
+    Для файлов, уже находящихся в каноническом формате, данные читаются
+    напрямую без запуска ffmpeg.
+
+    Returns:
+        bytes с сырыми PCM-данными
+    """
+    if is_canonical_wav(file_path):
+        with wave.open(file_path, 'rb') as wav_file:
+            return wav_file.readframes(wav_file.getnframes())
+
+    cmd = [
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', file_path,
+        '-vn',
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ac', '1', '-ar', str(AUDIO_SAMPLE_RATE),
+        'pipe:1'
+    ]
+    result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stdout
+
+
+def write_pcm_to_wav(pcm_data, output_path):
+    """Сохранение сырых PCM-данных в WAV без повторного кодирования"""
+    with wave.open(output_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(AUDIO_SAMPLE_WIDTH)
+        wav_file.setframerate(AUDIO_SAMPLE_RATE)
+        wav_file.writeframes(pcm_data)
+    return output_path
+
+
+def preprocess_audio(file_path, status_callback=None):
     """
+    Единый этап подготовки аудио: одно декодирование в 16 кГц моно PCM
+
+    Декодированный буфер используется повторно для проверки речи и громкости,
+    а на сервер транскрипции отправляется уже канонический WAV, который
+    сервис не конвертирует повторно.
+
+    Returns:
+        Кортеж (путь к подготовленному WAV, AudioSegment с PCM-данными или None)
+    """
+    if status_callback:
+        status_callback(8, "Декодирование аудио в формат 16 кГц моно...")
+
     try:
-        import subprocess
-        import json
-        
-        if status_callback:
-            status_callback(8, "Проверка аудиофайла...")
-        
-        # Используем ffprobe для получения информации о файле
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_streams', file_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        info = json.loads(result.stdout)
-        
-        # Определяем, есть ли аудио поток и сколько каналов
-        audio_stream = None
-        for stream in info.get('streams', []):
-            if stream.get('codec_type') == 'audio':
-                audio_stream = stream
-                break
-        
-        if not audio_stream:
-            if status_callback:
-                status_callback(10, "Предупреждение: аудио поток не найден в файле")
-            return file_path
-        
-        channels = audio_stream.get('channels', 0)
-        
-        # Если уже моно, просто возвращаем путь к файлу
-        if channels == 1:
-            if status_callback:
-                status_callback(10, "Файл уже в монофоническом формате")
-            return file_path
-        
-        # Конвертируем в моно, если больше одного канала
-        if channels > 1:
-            if status_callback:
-                status_callback(9, f"Файл имеет {channels} каналов. Конвертация в моно...")
-            
-            output_path = f"{file_path}.mono.wav"
-            cmd = [
-                'ffmpeg', '-y', '-i', file_path, 
-                '-ac', '1', '-ar', '16000', 
-                '-vn', '-acodec', 'pcm_s16le', output_path
-            ]
-            
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            if status_callback:
-                status_callback(10, "Файл успешно преобразован в монофонический формат")
-            
-            return output_path
-        
-        # По умолчанию возвращаем исходный файл
-        return file_path
-    
+        pcm_data = decode_audio_to_pcm(file_path)
     except Exception as e:
-        print(f"Ошибка при проверке/конвертации аудио: {e}")
+        error_details = e.stderr.decode(errors='ignore') if getattr(e, 'stderr', None) else str(e)
+        print(f"Ошибка при декодировании аудио: {error_details}")
         if status_callback:
-            status_callback(10, f"Предупреждение: {str(e)}. Используем исходный файл.")
-        return file_path
+            status_callback(10, "Не удалось декодировать аудио, файл будет отправлен как есть")
+        return file_path, None
 
+    if is_canonical_wav(file_path):
+        prepared_path = file_path
+    else:
+        prepared_path = write_pcm_to_wav(pcm_data, f"{file_path}.mono.wav")
 
-def prepare_audio_for_transcription(file_path, status_callback=None):
-    """Подготовка аудиофайла для транскрипции: конвертация в подходящий формат"""
-    try:
-        if status_callback:
-            status_callback(5, "Анализ аудиофайла...")
-        
-        # Получаем расширение файла
-        file_ext = os.path.splitext(file_path)[1].lower()
-        output_path = f"{file_path}.mono.wav"
-        
-        try:
-            if status_callback:
-                status_callback(8, "Преобразование аудио в оптимальный формат...")
-            
-            # Загружаем аудио с помощью pydub
-            try:
-                from pydub import AudioSegment
-                
-                if file_ext == '.mp3':
-                    audio = AudioSegment.from_mp3(file_path)
-                elif file_ext == '.m4a':
-                    audio = AudioSegment.from_file(file_path, format="m4a")
-                elif file_ext == '.ogg':
-                    audio = AudioSegment.from_ogg(file_path)
-                elif file_ext == '.flac':
-                    audio = AudioSegment.from_file(file_path, format="flac")
-                elif file_ext == '.webm':
-                    audio = AudioSegment.from_file(file_path, format="webm")
-                elif file_ext == '.opus':
-                    audio = AudioSegment.from_file(file_path, format="opus")
-                elif file_ext == '.wav':
-                    audio = AudioSegment.from_wav(file_path)
-                else:
-                    audio = AudioSegment.from_file(file_path)
-                
-                # Всегда преобразуем в моно, независимо от исходного формата
-                audio = audio.set_channels(1)  # 1 канал (моно)
-                audio = audio.set_sample_width(2)  # 16 bit
-                audio = audio.set_frame_rate(16000)  # 16 kHz частота дискретизации
-                
-                # Сохраняем в моно WAV
-                audio.export(output_path, format="wav")
-                
-                if status_callback:
-                    status_callback(10, "Аудио успешно преобразовано в формат WAV mono для распознавания")
-                
-                return output_path
-            except ImportError:
-                # Если pydub не установлен, используем ffmpeg
-                raise ImportError("pydub не установлен, используем ffmpeg")
-                
-        except Exception as e:
-            print(f"Ошибка при конвертации аудио: {e}")
-            traceback.print_exc()
-            if status_callback:
-                status_callback(10, f"Ошибка конвертации: {str(e)}. Попытка конвертации с другими параметрами.")
-            
-            # Попытка аварийной конвертации через ffmpeg
-            try:
-                import subprocess
-                cmd = [
-                    'ffmpeg', '-y', '-i', file_path, 
-                    '-ac', '1', '-ar', '16000', 
-                    '-vn', '-acodec', 'pcm_s16le', output_path
-                ]
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                
-                if status_callback:
-                    status_callback(10, "Аудио успешно преобразовано через ffmpeg")
-                
-                return output_path
-            except Exception as e2:
-                print(f"Ошибка при использовании ffmpeg: {e2}")
-                if status_callback:
-                    status_callback(10, f"Ошибка резервной конвертации: {str(e2)}. Используем исходный файл.")
-                return file_path
-    
-    except ImportError:
-        # Если pydub не установлен
-        print("Предупреждение: библиотека pydub не установлена. Используем ffmpeg напрямую.")
-        try:
-            # Попытка использовать ffmpeg напрямую
-            import subprocess
-            output_path = f"{file_path}.mono.wav"
-            cmd = [
-                'ffmpeg', '-y', '-i', file_path, 
-                '-ac', '1', '-ar', '16000', 
-                '-vn', '-acodec', 'pcm_s16le', output_path
-            ]
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            if status_callback:
-                status_callback(10, "Аудио успешно преобразовано через ffmpeg")
-            
-            return output_path
-        except Exception as e:
-            print(f"Ошибка при использовании ffmpeg: {e}")
-            return file_path
+    audio = AudioSegment(
+        data=pcm_data,
+        sample_width=AUDIO_SAMPLE_WIDTH,
+        frame_rate=AUDIO_SAMPLE_RATE,
+        channels=1
+    )
+
+    if status_callback:
+        status_callback(10, "Аудио успешно преобразовано в формат WAV mono для распознавания")
 
+    return prepared_path, audio
+
+
+def check_audio_for_speech(file_path, status_callback=None, audio=None):
+    """
+    Проверка аудиофайла на наличие речи и шумов
 
-def check_audio_for_speech(file_path, status_callback=None):
-    """Проверка аудиофайла на наличие речи и шумов"""
+    Если передан уже декодированный AudioSegment, файл повторно не читается.
+    """
     try:
         if status_callback:
             status_callback(12, "Проверка аудио на наличие речи...")
-        
+
         try:
             from pydub import AudioSegment
-            from pydub.silence import detect_nonsilent
-            
-            audio = AudioSegment.from_file(file_path)
+
+            if audio is None:
+                audio = AudioSegment.from_file(file_path)
             
             # Проверяем на наличие не-тишины
             non_silent_parts = detect_nonsilent(audio, min_silence_len=500, silence_thresh=-40)
@@ -321,33 +309,48 @@ def detect_speaker_names(transcript):
     return transcript
 
 
-def detect_audio_language(file_path):
-    """Определение языка аудио с улучшенной логикой"""
-    try:
-        # Сначала проверяем, указан ли язык в метаданных или имени файла
-        basename = os.path.basename(file_path).lower()
-        
-        # Проверка на явные указания языка в имени файла
-        if any(lang in basename for lang in ['рус', 'rus', 'russian', '.ru']):
-            return 'ru-RU'
-        if any(lang in basename for lang in ['eng', 'english', '.en']):
-            return 'en-US'
-        
-        # По умолчанию для большинства случаев используем русский язык
-        return 'ru-RU'  # Всегда возвращаем русский язык по умолчанию
-    except Exception as e:
-        print(f"Ошибка при определении языка аудио: {e}")
-        return 'ru-RU'  # В случае ошибки также используем русский
+# Коды языков интерфейса по кодам Whisper
+WHISPER_TO_LANGUAGE_CODE = {
+    'ru': 'ru-RU',
+    'en': 'en-US',
+    'uk': 'uk-UA',
+    'be': 'be-BY',
+    'kk': 'kk-KZ',
+    'de': 'de-DE',
+    'fr': 'fr-FR',
+    'es': 'es-ES',
+    'it': 'it-IT',
+    'zh': 'zh-CN',
+    'ja': 'ja-JP'
+}
+
+
+def detect_audio_language(language_code, result_info):
+    """
+    Язык записи для сессии и документа
+    
+    Если пользователь выбрал 'auto', берется язык, определенный сервисом
+    Whisper по первым 30 с записи; иначе - выбранный язык.
+    """
+    if language_code != 'auto':
+        return language_code
+    detected = (result_info or {}).get('language')
+    if not detected:
+        return 'ru-RU'
+    probability = result_info.get('language_probability')
+    print(f"Определен язык записи: {detected}" + (f" (вероятность {probability:.2f})" if probability else ""))
+    return WHISPER_TO_LANGUAGE_CODE.get(detected, detected)
 
 
 def split_audio_on_silence(file_path, min_silence_len=700, silence_thresh=-40, 
                          min_segment_len=45000, max_segment_len=55000,
-                         pause_search_start=50000, pause_search_end=58000):
+                         pause_search_start=50000, pause_search_end=58000, audio=None):
     """
     Разделяет аудиофайл на сегменты с интеллектуальным поиском пауз.
 
     Args:
         file_path: путь к аудиофайлу
+        audio: уже декодированный AudioSegment (файл тогда не читается)
         min_silence_len: минимальная длина тишины (мс)
         silence_thresh: порог тишины (дБ)
         min_segment_len: минимальная длина сегмента (мс)
@@ -359,7 +362,8 @@ def split_audio_on_silence(file_path, min_silence_len=700, silence_thresh=-40,
         Список кортежей (начало, конец) для каждого сегмента в миллисекундах
     """
     try:
-        audio = AudioSegment.from_file(file_path)
+        if audio is None:
+            audio = AudioSegment.from_file(file_path)
         audio_len = len(audio)
         segments = []
         start = 0
@@ -400,49 +404,467 @@ def split_audio_on_silence(file_path, min_silence_len=700, silence_thresh=-40,
         return [(0, audio_len)] if 'audio_len' in locals() else []
 
 
+def parse_time(time_str):
+    """Разбор таймкода ММ:СС (минуты могут быть больше 59) в секунды"""
+    try:
+        minutes, seconds = map(int, time_str.split(':'))
+        return minutes * 60 + seconds
+    except (AttributeError, ValueError):
+        return 0
+
+
+def _normalize_word(word):
+    return word.strip('.,!?…;:«»"()-').lower()
+
+
+def trim_repeated_words(previous_text, text, max_words=20):
+    """
+    Удаление в начале text слов, повторяющих конец previous_text
+    
+    На стыке фрагментов одна фраза может попасть в оба: сравниваются последние
+    слова предыдущего сегмента с первыми словами следующего (не меньше двух слов,
+    без учета регистра и пунктуации).
+    """
+    previous_words = [_normalize_word(word) for word in previous_text.split()]
+    words = text.split()
+    for count in range(min(len(previous_words), len(words), max_words), 1, -1):
+        if [_normalize_word(word) for word in words[:count]] == previous_words[-count:]:
+            return ' '.join(words[count:])
+    return text
+
+
+def match_chunk_speakers(merged, segments, offset, own_start):
+    """
+    Соответствие номеров говорящих фрагмента номерам в уже склеенной части
+    
+    Сервис нумерует говорящих в каждом фрагменте заново, поэтому без сопоставления
+    "Говорящий 1" и "Говорящий 2" менялись бы местами на стыках. Сегменты фрагмента
+    из области перекрытия (до own_start, мс) сравниваются с сегментами склеенной
+    части, начинающимися не дальше секунды от них; каждому номеру фрагмента
+    достается номер, с которым он совпал чаще всего.
+    """
+    votes = {}
+    for segment in segments:
+        start = offset + parse_time(segment.get('start_time', '00:00'))
+        if start >= own_start // 1000:
+            break
+        speaker = segment.get('speaker')
+        if not speaker:
+            continue
+        for previous in reversed(merged):
+            previous_start = parse_time(previous['start_time'])
+            if previous_start < start - 1:
+                break
+            if abs(previous_start - start) <= 1 and previous.get('speaker'):
+                counts = votes.setdefault(speaker, {})
+                counts[previous['speaker']] = counts.get(previous['speaker'], 0) + 1
+                break
+    
+    mapping = {speaker: max(counts, key=counts.get) for speaker, counts in votes.items()}
+    # Номера, не встретившиеся в перекрытии, занимают освободившиеся (1 <-> 2 меняются местами)
+    chunk_speakers = {segment.get('speaker') for segment in segments if segment.get('speaker')}
+    free = sorted(chunk_speakers - set(mapping.values()))
+    for speaker in sorted(chunk_speakers - set(mapping)):
+        if speaker in mapping.values() and free:
+            mapping[speaker] = free.pop(0)
+        else:
+            mapping[speaker] = speaker
+    return mapping
+
+
+def merge_chunk_transcripts(chunk_results, chunk_bounds):
+    """
+    Склейка транскрипций фрагментов в один список сегментов на общей шкале времени
+    
+    Фрагменты перекрываются; сегмент из области перекрытия остается только
+    у фрагмента, которому принадлежит его время начала. На стыке номера
+    говорящих фрагмента приводятся к уже склеенной части (match_chunk_speakers),
+    а слова, повторяющие конец предыдущего сегмента, удаляются.
+    
+    Args:
+        chunk_results: списки сегментов {'speaker', 'text', 'start_time'} с таймкодами от начала фрагмента
+        chunk_bounds: для каждого фрагмента (начало файла фрагмента, собственное начало, собственный конец) в мс
+    """
+    merged = []
+    for segments, (file_start, own_start, own_end) in zip(chunk_results, chunk_bounds):
+        offset = file_start / 1000
+        speakers = match_chunk_speakers(merged, segments, offset, own_start) if merged else {}
+        at_seam = bool(merged)
+        for segment in segments:
+            start = offset + parse_time(segment.get('start_time', '00:00'))
+            # Таймкоды округлены вниз до секунды, поэтому границы сравниваем в целых секундах
+            if start < own_start // 1000 or start >= own_end / 1000:
+                continue
+            text = segment.get('text', '').strip()
+            if at_seam and text:
+                at_seam = False
+                text = trim_repeated_words(merged[-1]['text'], text)
+                if not text:
+                    continue
+            if merged and text and text == merged[-1]['text']:
+                continue
+            merged_segment = dict(segment, text=text, start_time=format_time(start))
+            if segment.get('speaker') in speakers:
+                merged_segment['speaker'] = speakers[segment['speaker']]
+            merged.append(merged_segment)
+    return merged
+
+
+def use_parallel_transcription(audio):
+    """
+    Распознавать ли запись фрагментами параллельно (transcribe_in_parallel)
+    
+    Только для записей длиннее PARALLEL_MIN_DURATION и только при нескольких
+    репликах: на одной реплике фрагменты лишь соревнуются за тот же GPU и
+    добавляют стыки, на которых возможны ошибки распознавания.
+    """
+    return (len(app.config['WHISPER_SERVICE_URLS']) > 1 and audio is not None
+            and len(audio) > app.config['PARALLEL_MIN_DURATION'] * 1000)
+
+
+def transcribe_in_parallel(prepared_path, audio, language_code, enable_timestamps, status_callback=None,
+                           segment_callback=None, result_info=None):
+    """
+    Параллельное распознавание длинной записи фрагментами на нескольких репликах Whisper
+    
+    Запись делится по паузам (split_audio_on_silence) на фрагменты около
+    PARALLEL_CHUNK_SECONDS с небольшим перекрытием; фрагменты распределяются
+    по репликам из WHISPER_SERVICE_URLS по кругу, результаты склеиваются по
+    порядку со сдвигом таймкодов. В result_info попадают сведения о первом
+    фрагменте (при language_code='auto' язык определяется для каждого фрагмента),
+    а в 'model' - все модели, распознававшие фрагменты.
+    """
+    chunk_ms = app.config['PARALLEL_CHUNK_SECONDS'] * 1000
+    overlap_ms = app.config['PARALLEL_CHUNK_OVERLAP_MS']
+    
+    boundaries = split_audio_on_silence(
+        prepared_path,
+        min_segment_len=int(chunk_ms * 0.9),
+        max_segment_len=int(chunk_ms * 1.1),
+        pause_search_start=int(chunk_ms * 0.9),
+        pause_search_end=int(chunk_ms * 1.1),
+        audio=audio
+    )
+    audio_len = len(audio)
+    
+    # Фрагменты с перекрытием сохраняются отдельными WAV без перекодирования
+    bytes_per_ms = AUDIO_SAMPLE_RATE * AUDIO_SAMPLE_WIDTH // 1000
+    chunks = []
+    for index, (own_start, own_end) in enumerate(boundaries):
+        file_start = max(own_start - overlap_ms, 0)
+        file_end = min(own_end + overlap_ms, audio_len)
+        chunk_path = write_pcm_to_wav(
+            audio.raw_data[file_start * bytes_per_ms:file_end * bytes_per_ms],
+            f"{prepared_path}.part{index}.wav"
+        )
+        chunks.append((chunk_path, (file_start, own_start, own_end)))
+    
+    total = len(chunks)
+    print(f"Запись {audio_len / 1000:.0f} с разделена на {total} фрагментов, "
+          f"реплик: {len(app.config['WHISPER_SERVICE_URLS'])}")
+    if status_callback:
+        status_callback(30, f"Запись разделена на {total} фрагментов для параллельного распознавания")
+    
+    return transcribe_chunks(chunks, language_code, enable_timestamps, status_callback=status_callback,
+                             segment_callback=segment_callback, result_info=result_info, expected_total=total)
+
+
+def transcribe_chunks(chunks, language_code, enable_timestamps, status_callback=None, segment_callback=None,
+                      result_info=None, expected_total=1):
+    """
+    Распознавание фрагментов записи на репликах Whisper по мере их поступления
+    
+    chunks - итерируемое из пар (путь к WAV фрагмента, (начало файла, собственное
+    начало, собственный конец) в мс). Каждый фрагмент отправляется на распознавание,
+    как только получен, поэтому генератор фрагментов (например, потоковая загрузка)
+    работает одновременно с распознаванием уже полученных. Файлы фрагментов
+    удаляются. expected_total - ожидаемое число фрагментов для расчета прогресса.
+    """
+    service_urls = app.config['WHISPER_SERVICE_URLS']
+    
+    bounds = []
+    progress = []
+    completed = []
+    pending_segments = []
+    chunk_infos = []
+    emitted_upto = 0  # промежуточные сегменты отдаются строго по порядку фрагментов
+    lock = threading.Lock()
+    
+    def emit_in_order():
+        nonlocal emitted_upto
+        while emitted_upto < len(bounds):
+            if pending_segments[emitted_upto] and segment_callback:
+                segment_callback(pending_segments[emitted_upto])
+            pending_segments[emitted_upto] = []
+            if not completed[emitted_upto]:
+                break
+            emitted_upto += 1
+    
+    def run_chunk(index, chunk_path):
+        file_start, own_start, own_end = bounds[index]
+        offset = file_start / 1000
+        
+        def update_chunk_status(percent, message):
+            with lock:
+                progress[index] = percent
+                total = max(len(bounds), expected_total)
+                overall = 30 + int(sum(progress) / total * 0.6)
+                done = sum(completed)
+            if status_callback:
+                status_callback(overall, f"Распознано фрагментов: {done} из {total}")
+        
+        def add_chunk_segments(segments):
+            shifted = []
+            for segment in segments:
+                start = segment['start'] + offset
+                if own_start / 1000 <= start < own_end / 1000:
+                    shifted.append(dict(segment, start=start, end=segment['end'] + offset,
+                                        start_time=format_time(start)))
+            with lock:
+                pending_segments[index].extend(shifted)
+                emit_in_order()
+        
+        service_url = service_urls[index % len(service_urls)]
+        try:
+            result = transcribe_with_whisper_api(
+                chunk_path,
+                language_code=language_code,
+                enable_timestamps=True,
+                status_callback=update_chunk_status,
+                segment_callback=add_chunk_segments,
+                service_url=service_url,
+                result_info=chunk_infos[index]
+            )
+            if is_error_result(result):
+                # Одна повторная попытка на другой реплике
+                retry_url = service_urls[(index + 1) % len(service_urls)]
+                print(f"Фрагмент {index} не распознан на {service_url}: {result}; повтор на {retry_url}")
+                result = transcribe_with_whisper_api(
+                    chunk_path,
+                    language_code=language_code,
+                    enable_timestamps=True,
+                    status_callback=update_chunk_status,
+                    service_url=retry_url,
+                    result_info=chunk_infos[index]
+                )
+        finally:
+            with lock:
+                completed[index] = True
+                progress[index] = 100
+                emit_in_order()
+            try:
+                os.remove(chunk_path)
+            except OSError:
+                pass
+        return result
+    
+    workers = max(1, len(service_urls) * app.config['PARALLEL_JOBS_PER_SERVICE'])
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for chunk_path, chunk_bounds in chunks:
+                with lock:
+                    index = len(bounds)
+                    bounds.append(chunk_bounds)
+                    progress.append(0)
+                    completed.append(False)
+                    pending_segments.append([])
+                    chunk_infos.append({})
+                futures.append((executor.submit(run_chunk, index, chunk_path), chunk_path))
+        except BaseException:
+            # Источник фрагментов упал: неначатые фрагменты не распознаем, их файлы удаляем
+            for future, chunk_path in futures:
+                if future.cancel() and os.path.exists(chunk_path):
+                    os.remove(chunk_path)
+            raise
+        results = [future.result() for future, _ in futures]
+    
+    if result_info is not None and chunk_infos:
+        result_info.update(chunk_infos[0])
+        # Фрагменты могли попасть на разные модели (быструю - под нагрузкой)
+        models = {info['model'] for info in chunk_infos if info.get('model')}
+        if models:
+            result_info['model'] = ', '.join(sorted(models))
+    
+    for result in results:
+        if is_error_result(result):
+            return result
+    
+    chunk_results = [result if isinstance(result, list) else [] for result in results]
+    merged = merge_chunk_transcripts(chunk_results, bounds)
+    if enable_timestamps:
+        return merged
+    return ' '.join(segment['text'] for segment in merged if segment['text'])
+
+
+def is_error_result(transcript):
+    """Результат транскрипции является сообщением об ошибке, а не текстом"""
+    return isinstance(transcript, str) and transcript.startswith("Ошибка")
+
+
+def is_cacheable_result(transcript, result_info):
+    """
+    Результат можно сохранить в кэш под ключом основной модели (WHISPER_MODEL_NAME)
+    
+    Сервис может распознать запись быстрой моделью (короткие записи, нагрузка);
+    такой результат не кэшируется, иначе он отдавался бы на последующие запросы
+    вместо результата основной модели. Если сервис не сообщил модель, считается,
+    что работала основная.
+    """
+    if not transcript or is_error_result(transcript):
+        return False
+    return (result_info or {}).get('model') in (None, app.config['WHISPER_MODEL_NAME'])
+
+
+def get_media_cache_id(url):
+    """
+    Идентификатор видео для кэша без обращения к сети: ключ экстрактора yt-dlp и ID видео
+    
+    Returns:
+        Строка вида 'Youtube:dQw4w9WgXcQ' или None, если ID не удалось определить
+    """
+    try:
+        for extractor in yt_dlp.extractor.gen_extractor_classes():
+            if extractor.ie_key() == 'Generic' or not extractor.suitable(url):
+                continue
+            media_id = extractor.get_temp_id(url)
+            if media_id:
+                return f"{extractor.ie_key()}:{media_id}"
+    except Exception as e:
+        print(f"Не удалось определить ID видео: {e}")
+    return None
+
+
+def get_link_cache_key(url, language_code, enable_timestamps, output='transcript'):
+    """
+    Ключ кэша для ссылки: ID видео, формат загрузки, модель и параметры распознавания
+    
+    output различает обработанную транскрипцию (/link) и сырой ответ сервиса (/transcribe_youtube).
+    """
+    if transcript_cache is None:
+        return None
+    media_id = get_media_cache_id(url)
+    if not media_id:
+        return None
+    return TranscriptCache.make_key(
+        media_id,
+        format='bestaudio/wav',
+        model=app.config['WHISPER_MODEL_NAME'],
+        language=language_code,
+        timestamps=bool(enable_timestamps),
+        output=output
+    )
+
+
 # Импорт whisper_client для взаимодействия с новым сервисом
-from whisper_client import transcribe_with_whisper_api
+from whisper_client import transcribe_with_whisper_api, wait_for_task, get_client
+
+def prepare_transcription(file_path, language_code, enable_timestamps, update_status, result_info):
+    """
+    Подготовка записи к распознаванию: конвертация, поиск в кэше и проверка на речь
+    
+    Возвращает (prepared_file_path, audio, cache_key, ready_result). ready_result -
+    готовая транскрипция из кэша или сообщение об отсутствии речи: распознавать
+    запись не нужно, подготовленный файл уже удален. Иначе ready_result = None.
+    """
+    update_status(10, "Подготовка аудиофайла...")
+    prepared_file_path, audio = preprocess_audio(file_path, update_status)
+
+    # Поиск готового результата по хэшу декодированного PCM
+    cache_key = None
+    if transcript_cache is not None:
+        content_hash = hash_bytes(audio.raw_data) if audio is not None else hash_file(prepared_file_path)
+        cache_key = TranscriptCache.make_key(
+            content_hash,
+            model=app.config['WHISPER_MODEL_NAME'],
+            language=language_code,
+            timestamps=bool(enable_timestamps)
+        )
+        cached = transcript_cache.get(cache_key)
+        if cached is not None:
+            if prepared_file_path != file_path and os.path.exists(prepared_file_path):
+                os.remove(prepared_file_path)
+            update_status(95, "Результат найден в кэше")
+            result_info['language'] = cached.get('language')
+            return prepared_file_path, audio, cache_key, cached['transcript']
+
+    # Проверка на наличие речи по уже декодированному буферу
+    has_speech, speech_message = check_audio_for_speech(prepared_file_path, update_status, audio=audio)
+    if not has_speech:
+        if prepared_file_path != file_path and os.path.exists(prepared_file_path):
+            os.remove(prepared_file_path)
+        return prepared_file_path, audio, cache_key, speech_message
+
+    return prepared_file_path, audio, cache_key, None
+
+
+def finish_transcription(transcript, file_path, prepared_file_path, enable_timestamps, cache_key, result_info):
+    """Удаление подготовленного файла, определение имен говорящих и сохранение результата в кэш"""
+    if prepared_file_path != file_path and os.path.exists(prepared_file_path):
+        try:
+            os.remove(prepared_file_path)
+        except Exception as e:
+            print(f"Не удалось удалить временный файл: {e}")
+    
+    # Если получили массив с таймкодами, обрабатываем имена говорящих
+    if enable_timestamps and isinstance(transcript, list):
+        transcript = detect_speaker_names(transcript)
+
+    if cache_key and is_cacheable_result(transcript, result_info):
+        transcript_cache.put(cache_key, {'transcript': transcript, 'language': result_info.get('language')})
+
+    return transcript
+
+
+def transcribe_audio(file_path, language_code='ru-RU', enable_timestamps=False, status_callback=None,
+                     segment_callback=None, result_info=None):
+    """
+    Переработанная функция транскрибирования с использованием нового Whisper API
+    
+    segment_callback получает промежуточные сегменты по мере распознавания;
+    в result_info записываются модель и язык, о которых сообщил сервис.
+    """
+    if result_info is None:
+        result_info = {}
 
-def transcribe_audio(file_path, language_code='ru-RU', enable_timestamps=False, status_callback=None):
-    """Переработанная функция транскрибирования с использованием нового Whisper API"""
     def update_status(percent, message):
         print(f"[Прогресс] {percent}%: {message}")
         if status_callback:
             status_callback(percent, message)
 
     try:
-        # Подготовка аудио
-        update_status(10, "Подготовка аудиофайла...")
-        file_path = check_and_convert_audio_channels(file_path, update_status)
-        prepared_file_path = prepare_audio_for_transcription(file_path, update_status)
-
-        # Проверка на наличие речи
-        has_speech, speech_message = check_audio_for_speech(prepared_file_path, update_status)
-        if not has_speech:
-            return speech_message
+        prepared_file_path, audio, cache_key, ready_result = prepare_transcription(
+            file_path, language_code, enable_timestamps, update_status, result_info
+        )
+        if ready_result is not None:
+            return ready_result
 
         # Транскрипция через новый Whisper API
         update_status(30, "Отправка файла на транскрипцию (Whisper Russian)...")
         
-        transcript = transcribe_with_whisper_api(
-            prepared_file_path,
-            language_code=language_code,
-            enable_timestamps=enable_timestamps,
-            status_callback=update_status
-        )
-        
-        # Очистка временных файлов
-        if prepared_file_path != file_path and os.path.exists(prepared_file_path):
-            try:
-                os.remove(prepared_file_path)
-            except Exception as e:
-                print(f"Не удалось удалить временный файл: {e}")
+        if use_parallel_transcription(audio):
+            # Длинная запись делится на фрагменты и распознается параллельно на нескольких репликах
+            transcript = transcribe_in_parallel(
+                prepared_file_path,
+                audio,
+                language_code,
+                enable_timestamps,
+                status_callback=update_status,
+                segment_callback=segment_callback,
+                result_info=result_info
+            )
+        else:
+            transcript = transcribe_with_whisper_api(
+                prepared_file_path,
+                language_code=language_code,
+                enable_timestamps=enable_timestamps,
+                status_callback=update_status,
+                segment_callback=segment_callback,
+                result_info=result_info
+            )
         
-        # Если получили массив с таймкодами, обрабатываем имена говорящих
-        if enable_timestamps and isinstance(transcript, list):
-            transcript = detect_speaker_names(transcript)
-
-        return transcript
+        return finish_transcription(transcript, file_path, prepared_file_path, enable_timestamps,
+                                    cache_key, result_info)
 
     except Exception as e:
         print(f"Ошибка при транскрибировании: {e}")
@@ -450,8 +872,23 @@ def transcribe_audio(file_path, language_code='ru-RU', enable_timestamps=False,
         return f"Ошибка при транскрибировании: {str(e)}"
 
 
-def get_video_info(url):
-    """Получение информации о видео по ссылке"""
+def extract_video_info(url):
+    """
+    Сведения о видео и адрес его аудиопотока (bestaudio) с кэшированием
+    
+    Результат хранится VIDEO_INFO_TTL секунд в общем хранилище под ID видео,
+    поэтому проверка ссылки (/api/verify_link) и последующая обработка той же
+    ссылки обращаются к экстрактору один раз.
+    
+    Returns:
+        Словарь со сведениями о видео, адресом аудиопотока ('audio_url'), его
+        протоколом и HTTP-заголовками или None, если ссылку не удалось разобрать
+    """
+    info_key = get_media_cache_id(url) or url
+    cached = video_info_cache.get(info_key)
+    if cached is not None:
+        return cached
+    
     ydl_opts = {
         'format': 'bestaudio/best',
         'outtmpl': '%(title)s.%(ext)s',  # Временный шаблон имени файла
@@ -460,8 +897,6 @@ def get_video_info(url):
             'preferredcodec': 'wav',
             'preferredquality': '192',
         }],
-        'quiet': False,
-        'no_warnings': False,
         'geo_bypass': True,
         'nocheckcertificate': True,
         'ssl_verify': False,
@@ -485,16 +920,189 @@ def get_video_info(url):
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Неизвестное видео'),
-                'uploader': info.get('uploader', 'Неизвестный автор'),
-                'duration': info.get('duration', 0),
-                'upload_date': info.get('upload_date', ''),
-                'thumbnail': info.get('thumbnail', '')
-            }
     except Exception as e:
         print(f"Ошибка при получении информации о видео: {e}")
         return None
+    
+    video_info = {
+        'title': info.get('title', 'Неизвестное видео'),
+        'uploader': info.get('uploader', 'Неизвестный автор'),
+        'duration': info.get('duration', 0),
+        'upload_date': info.get('upload_date', ''),
+        'thumbnail': info.get('thumbnail', ''),
+        'description': info.get('description', ''),
+        'audio_url': info.get('url'),
+        'protocol': info.get('protocol'),
+        'http_headers': info.get('http_headers') or {}
+    }
+    video_info_cache[info_key] = video_info
+    return video_info
+
+
+def get_video_info(url):
+    """Получение информации о видео по ссылке"""
+    info = extract_video_info(url)
+    if info is None:
+        return None
+    return {field: info[field] for field in ('title', 'uploader', 'duration', 'upload_date', 'thumbnail')}
+
+
+def stream_audio_chunks(video_info, work_dir):
+    """
+    Потоковая загрузка аудиопотока видео с нарезкой на фрагменты для распознавания
+    
+    ffmpeg читает аудиопоток по адресу из extract_video_info и на лету декодирует
+    его в 16 кГц моно PCM. Как только накоплено около YOUTUBE_PIPELINE_CHUNK_SECONDS,
+    фрагмент режется в середине самой длинной паузы (в пределах ±10% длины),
+    сохраняется в WAV с перекрытием PARALLEL_CHUNK_OVERLAP_MS и отдается вызывающему,
+    пока загрузка продолжается. В памяти держится не больше одного фрагмента.
+    
+    Yields:
+        (путь к WAV фрагмента, (начало файла, собственное начало, собственный конец) в мс)
+    """
+    chunk_ms = app.config['YOUTUBE_PIPELINE_CHUNK_SECONDS'] * 1000
+    overlap_ms = app.config['PARALLEL_CHUNK_OVERLAP_MS']
+    search_start, search_end = int(chunk_ms * 0.9), int(chunk_ms * 1.1)
+    bytes_per_ms = AUDIO_SAMPLE_RATE * AUDIO_SAMPLE_WIDTH // 1000
+    
+    cmd = ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error']
+    headers = ''.join(f"{name}: {value}\r\n" for name, value in video_info['http_headers'].items())
+    if headers:
+        cmd += ['-headers', headers]
+    if video_info['protocol'] in ('http', 'https'):
+        # Обрыв соединения на длинной загрузке не должен обрывать запись
+        cmd += ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+    cmd += [
+        '-i', video_info['audio_url'],
+        '-vn',
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ac', '1', '-ar', str(AUDIO_SAMPLE_RATE),
+        'pipe:1'
+    ]
+    
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+    try:
+        buffer = bytearray()
+        buffer_start = 0  # позиция начала buffer от начала записи, мс
+        own_start = 0
+        index = 0
+        while True:
+            # Читаем по секунде аудио
+            data = process.stdout.read(AUDIO_SAMPLE_RATE * AUDIO_SAMPLE_WIDTH)
+            buffer.extend(data)
+            buffered_until = buffer_start + len(buffer) // bytes_per_ms
+            if data and buffered_until < own_start + search_end + overlap_ms:
+                continue
+            if not data and buffered_until <= own_start:
+                break
+            
+            if data:
+                window = AudioSegment(
+                    data=bytes(buffer[(own_start + search_start - buffer_start) * bytes_per_ms:
+                                      (own_start + search_end - buffer_start) * bytes_per_ms]),
+                    sample_width=AUDIO_SAMPLE_WIDTH,
+                    frame_rate=AUDIO_SAMPLE_RATE,
+                    channels=1
+                )
+                silence_ranges = detect_silence(window, min_silence_len=700, silence_thresh=-40)
+                if silence_ranges:
+                    longest_silence = max(silence_ranges, key=lambda x: x[1] - x[0])
+                    own_end = own_start + search_start + (longest_silence[0] + longest_silence[1]) // 2
+                else:
+                    own_end = own_start + chunk_ms
+            else:
+                # Загрузка закончилась - остаток записи становится последним фрагментом
+                own_end = buffered_until
+            
+            file_start = max(own_start - overlap_ms, 0)
+            file_end = min(own_end + overlap_ms, buffered_until)
+            chunk_path = write_pcm_to_wav(
+                bytes(buffer[(file_start - buffer_start) * bytes_per_ms:(file_end - buffer_start) * bytes_per_ms]),
+                os.path.join(work_dir, f"part{index}.wav")
+            )
+            print(f"Загружено {own_end / 1000:.0f} с аудио, фрагмент {index} отправлен на распознавание")
+            yield chunk_path, (file_start, own_start, own_end)
+            
+            # Начало следующего фрагмента с перекрытием остается в буфере
+            keep_from = max(own_end - overlap_ms, 0)
+            del buffer[:(keep_from - buffer_start) * bytes_per_ms]
+            buffer_start = keep_from
+            own_start = own_end
+            index += 1
+            if not data:
+                break
+        
+        if process.wait() != 0:
+            errors.seek(0)
+            message = errors.read().decode('utf-8', 'replace').strip()
+            raise Exception(f"Ошибка загрузки аудиопотока: {message or process.returncode}")
+        if index == 0:
+            raise Exception("Не удалось получить аудио из видео")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        errors.close()
+
+
+def transcribe_video_pipelined(url, language_code, enable_timestamps, status_callback=None,
+                               segment_callback=None, result_info=None):
+    """
+    Загрузка и распознавание видео по ссылке одним конвейером
+    
+    Фрагменты из stream_audio_chunks распознаются на репликах Whisper, пока
+    загрузка продолжается, поэтому распознавание начинается через несколько
+    секунд после старта, а не после загрузки и конвертации всего файла.
+    
+    Returns:
+        (транскрипция, сведения о видео)
+    
+    Raises:
+        Exception, если аудиопоток недоступен для потоковой загрузки или загрузка
+        прервалась; вызывающий может повторить обработку обычной загрузкой
+    """
+    video_info = extract_video_info(url)
+    if video_info is None or not video_info.get('audio_url'):
+        raise Exception("Не удалось получить адрес аудиопотока")
+    if video_info['protocol'] not in ('http', 'https', 'm3u8', 'm3u8_native'):
+        raise Exception(f"Протокол {video_info['protocol']} не поддерживается потоковой загрузкой")
+    
+    if status_callback:
+        status_callback(10, "Потоковая загрузка и распознавание аудио...")
+    
+    chunk_ms = app.config['YOUTUBE_PIPELINE_CHUNK_SECONDS'] * 1000
+    expected_total = int((video_info.get('duration') or 0) * 1000 // chunk_ms) + 1
+    
+    work_dir = tempfile.mkdtemp(prefix='youtube_', dir=app.config['UPLOAD_FOLDER'])
+    try:
+        transcript = transcribe_chunks(
+            stream_audio_chunks(video_info, work_dir),
+            language_code,
+            enable_timestamps,
+            status_callback=status_callback,
+            segment_callback=segment_callback,
+            result_info=result_info,
+            expected_total=expected_total
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    if enable_timestamps and isinstance(transcript, list):
+        transcript = detect_speaker_names(transcript)
+    
+    return transcript, {field: video_info[field]
+                        for field in ('title', 'uploader', 'duration', 'description', 'upload_date')}
+
+
+def remove_downloaded_audio(audio_path):
+    """Удаление аудио, загруженного download_from_youtube, вместе с его временной директорией"""
+    if audio_path and os.path.exists(audio_path):
+        os.remove(audio_path)
+    download_dir = os.path.dirname(audio_path or '')
+    if os.path.basename(download_dir).startswith('youtube_'):
+        shutil.rmtree(download_dir, ignore_errors=True)
 
 
 def download_from_youtube(url, status_callback=None):
@@ -503,8 +1111,9 @@ def download_from_youtube(url, status_callback=None):
         if status_callback:
             status_callback(5, "Подготовка к загрузке видео...")
         
-        # Создаем временную директорию для загрузки
-        temp_dir = tempfile.mkdtemp()
+        # Временная директория в папке загрузок: она общая с сервисом Whisper,
+        # и файл передается ему по ссылке, без загрузки по HTTP
+        temp_dir = tempfile.mkdtemp(prefix='youtube_', dir=app.config['UPLOAD_FOLDER'])
         temp_file = os.path.join(temp_dir, 'audio')
         
         # Настройки для yt-dlp с полностью отключенной проверкой SSL
@@ -582,6 +1191,8 @@ def download_from_youtube(url, status_callback=None):
                 }
                 
             except Exception as e:
+                # Временная директория лежит в общей папке загрузок - не оставляем ее
+                shutil.rmtree(temp_dir, ignore_errors=True)
                 if status_callback:
                     status_callback(0, f"Ошибка при загрузке видео: {str(e)}")
                 raise Exception(f"Ошибка при загрузке видео: {str(e)}")
@@ -674,9 +1285,11 @@ def save_transcript_to_session(session_id, transcript, docx_path, with_timestamp
     """Сохранение транскрипции в сессию с информацией о языке"""
     # Формируем уникальный URL для доступа к сессии
     share_url = f"/share/{session_id}"
+    created_at = datetime.datetime.now().timestamp()
+    expires_at = created_at + app.config['SESSION_EXPIRY']
     
     sessions[session_id] = {
-        'created_at': datetime.datetime.now().timestamp(),
+        'created_at': created_at,
         'transcript': transcript,
         'docx_path': docx_path,
         'with_timestamps': with_timestamps,
@@ -685,24 +1298,12 @@ def save_transcript_to_session(session_id, transcript, docx_path, with_timestamp
         'language': language_code  # Добавляем информацию о языке
     }
     
-    # Очистка старых сессий (старше 24 часов)
-    current_time = datetime.datetime.now().timestamp()
-    sessions_to_delete = []
-    
-    for s_id, s_data in sessions.items():
-        if current_time - s_data['created_at'] > app.config['SESSION_EXPIRY']:
-            sessions_to_delete.append(s_id)
-    
-    for s_id in sessions_to_delete:
-        # Также удаляем соответствующие DOCX файлы
-        if 'docx_path' in sessions[s_id]:
-            docx_file = os.path.join(tempfile.gettempdir(), 'transcripts', sessions[s_id]['docx_path'])
-            try:
-                if os.path.exists(docx_file):
-                    os.remove(docx_file)
-            except Exception as e:
-                print(f"Ошибка при удалении устаревшего DOCX файла: {e}")
-        del sessions[s_id]
+    # Сессия и ее DOCX-файл удаляются в фоне по истечении SESSION_EXPIRY
+    session_reaper.schedule(
+        session_id,
+        os.path.join(tempfile.gettempdir(), 'transcripts', docx_path),
+        expires_at
+    )
     
     return share_url
 
@@ -960,7 +1561,7 @@ def check_transcription_quality(transcript):
 # Определение маршрутов веб-приложения
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', whisper_stream_url=app.config['WHISPER_STREAM_URL'])
 
 
 @app.route('/share/<session_id>')
@@ -987,56 +1588,121 @@ def get_task_status(task_id):
     return jsonify({'status': 'unknown', 'percent': 0, 'message': 'Задача не найдена'})
 
 
+@app.route('/task_events/<task_id>', methods=['GET'])
+def task_events(task_id):
+    """Поток Server-Sent Events со статусом задачи: события отправляются при каждом изменении"""
+    if task_id not in task_status:
+        return jsonify({'status': 'unknown', 'percent': 0, 'message': 'Задача не найдена'}), 404
+    
+    keepalive = app.config['TASK_EVENTS_KEEPALIVE']
+    
+    def event_stream():
+        version = task_status.version(task_id)
+        last_payload = None
+        cursor = 0
+        epoch = 0
+        while True:
+            status = task_status.get(task_id)
+            if status is None:
+                return
+            
+            # Промежуточные сегменты отправляются один раз: в событии только новые.
+            # Новая эпоха (partial_epoch) - список начат заново, отправляется с начала
+            status = dict(status)
+            if 'partial' in status and status.get('partial_epoch', 0) != epoch:
+                epoch = status.get('partial_epoch', 0)
+                cursor = 0
+            partial = status.pop('partial', [])
+            status['partial'] = partial[cursor:]
+            status['partial_offset'] = cursor
+            
+            payload = json.dumps(status, ensure_ascii=False)
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                cursor += len(status['partial'])
+                status['partial'] = []
+                status['partial_offset'] = cursor
+                last_payload = json.dumps(status, ensure_ascii=False)
+            if status.get('status') in ('complete', 'completed', 'error'):
+                return
+            
+            new_version = task_status.wait_for_change(task_id, version, keepalive)
+            if new_version == version:
+                # Комментарий keep-alive, чтобы прокси не закрыли соединение
+                yield ": keep-alive\n\n"
+            version = new_version
+    
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def save_task_result(task_id, transcript, docx_name, enable_timestamps, language_code, video_info=None):
+    """Создание DOCX, сохранение транскрипции в сессию и финальный статус задачи"""
+    session_id = generate_session_id()
+    docx_path = create_docx(transcript, docx_name, with_timestamps=enable_timestamps, video_info=video_info)
+    share_url = save_transcript_to_session(
+        session_id,
+        transcript,
+        os.path.basename(docx_path),
+        enable_timestamps,
+        video_info,
+        language_code=language_code
+    )
+    
+    result = {
+        'status': 'complete',
+        'percent': 100,
+        'message': 'Транскрипция завершена',
+        'transcript': transcript,
+        'docx_path': os.path.basename(docx_path),
+        'with_timestamps': enable_timestamps,
+        'session_id': session_id,
+        'share_url': share_url,
+        'language': language_code
+    }
+    if video_info is not None:
+        result['video_info'] = video_info
+    task_status[task_id] = result
+
+
 def process_audio_file(file_path, enable_timestamps, task_id, language_code='ru-RU'):
     """Обработка аудиофайла в отдельном потоке"""
     try:
         # Функция обновления статуса
         def update_status(percent, message):
-            task_status[task_id] = {
-                'status': 'transcribing' if percent < 100 else 'complete',
-                'percent': percent,
-                'message': message
-            }
+            task_status.update(
+                task_id,
+                status='transcribing' if percent < 100 else 'complete',
+                percent=percent,
+                message=message
+            )
+        
+        # Промежуточные сегменты, уже распознанные сервисом, дописываются в статус
+        def add_segments(segments):
+            task_status.append(task_id, 'partial', segments)
         
         # Обновляем начальный статус
+        task_status[task_id] = {'status': 'transcribing', 'percent': 0, 'message': '', 'partial': []}
         update_status(5, "Начало транскрибирования с улучшенной русской моделью Whisper")
         
         # Переключаемся на использование новой функции транскрибирования
+        result_info = {}
         transcript = transcribe_audio(
             file_path, 
             language_code=language_code,
             enable_timestamps=enable_timestamps, 
-            status_callback=update_status
+            status_callback=update_status,
+            segment_callback=add_segments,
+            result_info=result_info
         )
+        language_code = detect_audio_language(language_code, result_info)
         
-        # Генерируем ID сессии
-        session_id = generate_session_id()
-        
-        # Создание DOCX файла
+        # DOCX, сессия и финальный статус
         filename = os.path.splitext(os.path.basename(file_path))[0]
-        docx_path = create_docx(transcript, filename, with_timestamps=enable_timestamps)
-        
-        # Сохраняем транскрипцию в сессию
-        share_url = save_transcript_to_session(
-            session_id, 
-            transcript, 
-            os.path.basename(docx_path), 
-            enable_timestamps,
-            language_code=language_code
-        )
-        
-        # Финальное обновление статуса
-        task_status[task_id] = {
-            'status': 'complete',
-            'percent': 100,
-            'message': 'Транскрипция завершена',
-            'transcript': transcript,
-            'docx_path': os.path.basename(docx_path),
-            'with_timestamps': enable_timestamps,
-            'session_id': session_id,
-            'share_url': share_url,
-            'language': language_code
-        }
+        save_task_result(task_id, transcript, filename, enable_timestamps, language_code)
         
         # Удаляем исходный аудиофайл, если транскрипция успешно завершена
         try:
@@ -1061,70 +1727,91 @@ def process_youtube_link(url, enable_timestamps, task_id, language_code='ru-RU')
     try:
         # Функция обновления статуса
         def update_status(percent, message):
-            task_status[task_id] = {
-                'status': 'transcribing' if percent < 100 else 'complete',
-                'percent': percent,
-                'message': message
-            }
+            task_status.update(
+                task_id,
+                status='transcribing' if percent < 100 else 'complete',
+                percent=percent,
+                message=message
+            )
+        
+        # Промежуточные сегменты, уже распознанные сервисом, дописываются в статус
+        def add_segments(segments):
+            task_status.append(task_id, 'partial', segments)
         
         # Обновляем начальный статус
+        task_status[task_id] = {'status': 'transcribing', 'percent': 0, 'message': '', 'partial': []}
         update_status(5, "Начало обработки ссылки")
         
-        # Загрузка аудио из видео
-        audio_path, video_info = download_from_youtube(url, update_status)
+        # Повторная ссылка на то же видео берется из кэша без загрузки и распознавания
+        cache_key = get_link_cache_key(url, language_code, enable_timestamps)
+        cached = transcript_cache.get(cache_key) if cache_key else None
         
-        if not audio_path:
-            task_status[task_id] = {
-                'status': 'error',
-                'percent': 0,
-                'message': 'Не удалось загрузить аудио по указанной ссылке'
-            }
-            return
-        
-        # Запускаем транскрибирование с указанным языком
-        transcript = transcribe_audio(
-            audio_path, 
-            enable_timestamps=enable_timestamps, 
-            status_callback=update_status,
-            language_code=language_code
-        )
-        
-        # Генерируем ID сессии
-        session_id = generate_session_id()
+        if cached is not None:
+            update_status(95, "Результат найден в кэше")
+            audio_path = None
+            transcript = cached['transcript']
+            video_info = cached.get('video_info')
+            result_info = {'language': cached.get('language')}
+        else:
+            audio_path = None
+            transcript = None
+            result_info = {}
+            if app.config['YOUTUBE_PIPELINE']:
+                # Распознавание фрагментов параллельно с загрузкой аудиопотока
+                try:
+                    transcript, video_info = transcribe_video_pipelined(
+                        url,
+                        language_code,
+                        enable_timestamps,
+                        status_callback=update_status,
+                        segment_callback=add_segments,
+                        result_info=result_info
+                    )
+                except Exception as e:
+                    print(f"Потоковая обработка ссылки не удалась, загрузка файла целиком: {e}")
+                    # Сегменты неудавшейся попытки заменяются новыми: смена partial_epoch
+                    # сообщает потоку событий и странице, что список начат заново
+                    epoch = (task_status.get(task_id) or {}).get('partial_epoch', 0) + 1
+                    task_status.update(task_id, partial=[], partial_epoch=epoch)
+                    result_info = {}
+
+            if transcript is None:
+                # Загрузка аудио из видео
+                audio_path, video_info = download_from_youtube(url, update_status)
+
+                if not audio_path:
+                    task_status[task_id] = {
+                        'status': 'error',
+                        'percent': 0,
+                        'message': 'Не удалось загрузить аудио по указанной ссылке'
+                    }
+                    return
+
+                # Запускаем транскрибирование с указанным языком
+                transcript = transcribe_audio(
+                    audio_path,
+                    enable_timestamps=enable_timestamps,
+                    status_callback=update_status,
+                    segment_callback=add_segments,
+                    language_code=language_code,
+                    result_info=result_info
+                )
+
+            if cache_key and is_cacheable_result(transcript, result_info):
+                transcript_cache.put(cache_key, {'transcript': transcript, 'video_info': video_info,
+                                                 'language': result_info.get('language')})
         
-        # Создание DOCX файла
-        docx_path = create_docx(transcript, f"link_{uuid.uuid4()}", with_timestamps=enable_timestamps, video_info=video_info)
+        language_code = detect_audio_language(language_code, result_info)
         
-        # Сохраняем транскрипцию в сессию
-        share_url = save_transcript_to_session(
-            session_id, 
-            transcript, 
-            os.path.basename(docx_path), 
-            enable_timestamps, 
-            video_info,
-            language_code=language_code
-        )
+        # DOCX, сессия и финальный статус
+        save_task_result(task_id, transcript, f"link_{uuid.uuid4()}", enable_timestamps, language_code,
+                         video_info)
         
         # Удаление временного файла
         try:
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
+            remove_downloaded_audio(audio_path)
         except Exception as e:
             print(f"Ошибка при удалении временного файла: {e}")
-        
-        # Финальное обновление статуса
-        task_status[task_id] = {
-            'status': 'complete',
-            'percent': 100,
-            'message': 'Транскрипция завершена',
-            'transcript': transcript,
-            'docx_path': os.path.basename(docx_path),
-            'with_timestamps': enable_timestamps,
-            'video_info': video_info,
-            'session_id': session_id,
-            'share_url': share_url,
-            'language': language_code
-        }
     except Exception as e:
         print(f"Ошибка при обработке ссылки: {e}")
         traceback.print_exc()
@@ -1165,12 +1852,8 @@ def upload_file():
             'message': 'Подготовка к обработке файла'
         }
         
-        # Запускаем обработку в отдельном потоке, передавая язык
-        threading.Thread(
-            target=process_audio_file, 
-            args=(file_path, enable_timestamps, task_id, language_code),
-            daemon=True
-        ).start()
+        # Запускаем обработку в фоне, передавая язык
+        start_job('process_audio_file', file_path, enable_timestamps, task_id, language_code)
         
         # Возвращаем ID задачи клиенту
         return jsonify({
@@ -1208,12 +1891,8 @@ def process_recording():
         'message': 'Подготовка к обработке записи'
     }
     
-    # Запускаем обработку в отдельном потоке, передавая язык
-    threading.Thread(
-        target=process_audio_file, 
-        args=(file_path, enable_timestamps, task_id, language_code),
-        daemon=True
-    ).start()
+    # Запускаем обработку в фоне, передавая язык
+    start_job('process_audio_file', file_path, enable_timestamps, task_id, language_code)
     
     # Возвращаем ID задачи клиенту
     return jsonify({
@@ -1221,6 +1900,52 @@ def process_recording():
     })
 
 
+@app.route('/record_stream', methods=['POST'])
+def finish_stream_recording():
+    """Сохранение транскрипции, полученной потоковым распознаванием во время записи"""
+    data = request.get_json()
+    if not data or not isinstance(data.get('segments'), list):
+        return jsonify({'error': 'Сегменты транскрипции не найдены в запросе'}), 400
+    
+    enable_timestamps = bool(data.get('timestamps', False))
+    language_code = data.get('language', 'ru-RU')
+    segments = [segment for segment in data['segments'] if segment.get('text')]
+    if not segments:
+        return jsonify({'error': 'В записи не обнаружена речь'}), 400
+    
+    # Сегменты уже распознаны сервисом Whisper, остается только оформить результат
+    if enable_timestamps:
+        transcript = detect_speaker_names([{
+            'speaker': segment.get('speaker', 'Говорящий 1'),
+            'text': segment['text'],
+            'start_time': segment.get('start_time', '00:00')
+        } for segment in segments])
+    else:
+        transcript = ' '.join(segment['text'] for segment in segments)
+    
+    session_id = generate_session_id()
+    docx_path = create_docx(transcript, f"recording_{uuid.uuid4()}", with_timestamps=enable_timestamps)
+    share_url = save_transcript_to_session(
+        session_id,
+        transcript,
+        os.path.basename(docx_path),
+        enable_timestamps,
+        language_code=language_code
+    )
+    
+    return jsonify({
+        'status': 'complete',
+        'percent': 100,
+        'message': 'Транскрипция завершена',
+        'transcript': transcript,
+        'docx_path': os.path.basename(docx_path),
+        'with_timestamps': enable_timestamps,
+        'session_id': session_id,
+        'share_url': share_url,
+        'language': language_code
+    })
+
+
 @app.route('/link', methods=['POST'])
 def process_link():
     """Обработка ссылки на видео."""
@@ -1244,12 +1969,8 @@ def process_link():
         'message': 'Подготовка к загрузке видео'
     }
     
-    # Запускаем обработку в отдельном потоке, передавая язык
-    threading.Thread(
-        target=process_youtube_link, 
-        args=(url, enable_timestamps, task_id, language_code),
-        daemon=True
-    ).start()
+    # Запускаем обработку в фоне, передавая язык
+    start_job('process_youtube_link', url, enable_timestamps, task_id, language_code)
     
     # Возвращаем ID задачи клиенту
     return jsonify({
@@ -1336,10 +2057,77 @@ def health_check():
         'status': 'healthy',
         'version': '1.0.0',
         'timestamp': datetime.datetime.now().isoformat(),
-        'whisper_service': app.config['WHISPER_SERVICE_URL']
+        'whisper_service': app.config['WHISPER_SERVICE_URL'],
+        'cache': transcript_cache.stats() if transcript_cache else None,
+        'jobs': job_queue.counts() if job_queue is not None else None,
+        'session_reaper': session_reaper.stats(),
+        'whisper_client': get_client().metrics()
     })
 
 
+def process_youtube_raw(url, language, timestamps, task_id, cache_key=None):
+    """Загрузка видео и транскрипция для /transcribe_youtube (результат - текст сервиса Whisper)"""
+    def update_status(percent, message):
+        task_status.update(task_id, progress=percent, message=message)
+    
+    def add_segments(segments):
+        task_status.append(task_id, 'partial', segments)
+    
+    try:
+        # Загружаем видео
+        audio_file, video_info = download_from_youtube(url, update_status)
+        
+        if not audio_file or not os.path.exists(audio_file):
+            raise Exception("Не удалось загрузить аудио из видео")
+        
+        # Подготавливаем аудио для транскрипции
+        prepared_file, _ = preprocess_audio(audio_file, update_status)
+        
+        # Отправляем файл на транскрипцию (с повторами при сбоях сервиса)
+        whisper_task = get_client().submit(
+            prepared_file,
+            language,
+            timestamps,
+            service_url=app.config['WHISPER_SERVICE_URL'],
+            status_callback=update_status
+        )
+        whisper_task_id = whisper_task['task_id']
+        
+        # Ждем завершения транскрипции: прогресс приходит потоком событий сервиса
+        result_info = {}
+        transcript = wait_for_task(whisper_task_id, update_status, add_segments,
+                                   app.config['WHISPER_SERVICE_URL'], result_info)
+        if is_error_result(transcript):
+            raise Exception(transcript)
+        
+        task_status.update(
+            task_id,
+            status='completed',
+            progress=100,
+            message='Транскрипция завершена',
+            result=transcript
+        )
+        if cache_key and is_cacheable_result(transcript, result_info):
+            transcript_cache.put(cache_key, {
+                'result': transcript,
+                'video_info': video_info
+            })
+        
+    except Exception as e:
+        task_status.update(task_id, status='error', message=str(e))
+        print(f"Ошибка при обработке видео: {e}")
+        traceback.print_exc()
+    finally:
+        # Очищаем временные файлы
+        try:
+            if 'prepared_file' in locals() and os.path.exists(prepared_file):
+                os.remove(prepared_file)
+            if 'audio_file' in locals():
+                remove_downloaded_audio(audio_file)
+        except Exception as e:
+            print(f"Ошибка при очистке временных файлов: {e}")
+
+
 @app.route('/transcribe_youtube', methods=['POST'])
 def transcribe_youtube():
     """Транскрибирование аудио из YouTube видео"""
@@ -1357,83 +2145,28 @@ def transcribe_youtube():
         task_status[task_id] = {
             'status': 'processing',
             'progress': 0,
-            'message': 'Подготовка к загрузке видео...'
+            'message': 'Подготовка к загрузке видео...',
+            'partial': []
         }
         
-        def update_status(percent, message):
-            if task_id in task_status:
-                task_status[task_id]['progress'] = percent
-                task_status[task_id]['message'] = message
-        
-        # Запускаем загрузку и транскрипцию в отдельном потоке
-        def process_video():
-            try:
-                # Загружаем видео
-                audio_file, video_info = download_from_youtube(url, update_status)
-                
-                if not audio_file or not os.path.exists(audio_file):
-                    raise Exception("Не удалось загрузить аудио из видео")
-                
-                # Подготавливаем аудио для транскрипции
-                prepared_file = prepare_audio_for_transcription(audio_file, update_status)
-                
-                # Отправляем файл на транскрипцию
-                with open(prepared_file, 'rb') as f:
-                    files = {'file': (os.path.basename(prepared_file), f, 'audio/wav')}
-                    data = {
-                        'language': language,
-                        'timestamps': str(timestamps).lower()
-                    }
-                    
-                    response = requests.post(
-                        f"{app.config['WHISPER_SERVICE_URL']}/transcribe",
-                        files=files,
-                        data=data
-                    )
-                    
-                    if response.status_code != 200:
-                        raise Exception(f"Ошибка API: {response.text}")
-                    
-                    result = response.json()
-                    task_id = result.get('task_id')
-                    
-                    # Ждем завершения транскрипции
-                    while True:
-                        status_response = requests.get(
-                            f"{app.config['WHISPER_SERVICE_URL']}/status/{task_id}"
-                        )
-                        status_data = status_response.json()
-                        
-                        if status_data['status'] == 'completed':
-                            task_status[task_id]['status'] = 'completed'
-                            task_status[task_id]['progress'] = 100
-                            task_status[task_id]['message'] = 'Транскрипция завершена'
-                            task_status[task_id]['result'] = status_data['result']
-                            break
-                        elif status_data['status'] == 'error':
-                            raise Exception(f"Ошибка транскрипции: {status_data.get('message', 'Неизвестная ошибка')}")
-                        
-                        time.sleep(1)
-                
-            except Exception as e:
-                task_status[task_id]['status'] = 'error'
-                task_status[task_id]['message'] = str(e)
-                print(f"Ошибка при обработке видео: {e}")
-                traceback.print_exc()
-            finally:
-                # Очищаем временные файлы
-                try:
-                    if 'audio_file' in locals() and os.path.exists(audio_file):
-                        os.remove(audio_file)
-                    if 'prepared_file' in locals() and os.path.exists(prepared_file):
-                        os.remove(prepared_file)
-                except Exception as e:
-                    print(f"Ошибка при очистке временных файлов: {e}")
+        cache_key = get_link_cache_key(url, language, timestamps, output='raw')
+        cached = transcript_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            task_status.update(
+                task_id,
+                status='completed',
+                progress=100,
+                message='Транскрипция завершена (из кэша)',
+                result=cached['result']
+            )
+            return jsonify({
+                'task_id': task_id,
+                'message': 'Результат найден в кэше',
+                'video_info': cached.get('video_info') or {'title': '', 'duration': 0}
+            })
         
-        # Запускаем обработку в отдельном потоке
-        thread = threading.Thread(target=process_video)
-        thread.daemon = True
-        thread.start()
+        # Запускаем загрузку и транскрипцию в фоне
+        start_job('process_youtube_raw', url, language, timestamps, task_id, cache_key)
         
         return jsonify({
             'task_id': task_id,
@@ -1448,5 +2181,314 @@ def transcribe_youtube():
         return jsonify({'error': str(e)}), 500
 
 
+def process_batch(batch_id):
+    """
+    Обработка пакета записей и ссылок как единого целого
+    
+    Сначала все элементы параллельно готовятся (загрузка ссылок, конвертация,
+    поиск в кэше), затем записи вместе ставятся в очередь сервиса Whisper
+    (submit_batch), чтобы он обрабатывал их одновременно, и результаты
+    ожидаются параллельно. Длинные записи распознаются по фрагментам.
+    Элементы, завершенные до перезапуска обработчика задач, пропускаются.
+    """
+    batch = batches.get(batch_id)
+    if batch is None:
+        return
+    batches.update(batch_id, status='processing')
+    enable_timestamps = batch['timestamps']
+    service_url = app.config['WHISPER_SERVICE_URL']
+    items = [item for item in batch['items']
+             if (task_status.get(item['task_id']) or {}).get('status') not in ('complete', 'error')]
+    
+    def fail(state, message):
+        task_status[state['item']['task_id']] = {'status': 'error', 'percent': 0, 'message': message}
+    
+    def cleanup(state):
+        # Исходные файлы пакета удаляются после обработки элемента в любом случае
+        try:
+            prepared_path = state.get('prepared_path')
+            if prepared_path and prepared_path != state.get('file_path') and os.path.exists(prepared_path):
+                os.remove(prepared_path)
+            if state['item']['source'] == 'file' and os.path.exists(state['item']['path']):
+                os.remove(state['item']['path'])
+            remove_downloaded_audio(state.get('audio_path'))
+        except Exception as e:
+            print(f"Ошибка при удалении файлов элемента пакета: {e}")
+    
+    def finalize(state, transcript):
+        item = state['item']
+        try:
+            if is_error_result(transcript):
+                fail(state, transcript)
+                return
+            if state.get('link_cache_key') and is_cacheable_result(transcript, state['result_info']):
+                transcript_cache.put(state['link_cache_key'], {
+                    'transcript': transcript,
+                    'video_info': state.get('video_info'),
+                    'language': state['result_info'].get('language')
+                })
+            language_code = detect_audio_language(item['language'], state['result_info'])
+            docx_name = os.path.splitext(item['name'])[0] if item['source'] == 'file' else f"link_{uuid.uuid4()}"
+            save_task_result(item['task_id'], transcript, docx_name, enable_timestamps, language_code,
+                             state.get('video_info'))
+        finally:
+            cleanup(state)
+    
+    def prepare(item):
+        """Подготовка элемента; None - элемент уже завершен (кэш, нет речи или ошибка)"""
+        task_id = item['task_id']
+        
+        def update_status(percent, message):
+            task_status.update(task_id, status='transcribing', percent=percent, message=message)
+        
+        def add_segments(segments):
+            task_status.append(task_id, 'partial', segments)
+        
+        task_status[task_id] = {'status': 'transcribing', 'percent': 0, 'message': '', 'partial': []}
+        state = {'item': item, 'update_status': update_status, 'add_segments': add_segments, 'result_info': {}}
+        try:
+            file_path = item.get('path')
+            if item['source'] == 'url':
+                cache_key = get_link_cache_key(item['url'], item['language'], enable_timestamps)
+                cached = transcript_cache.get(cache_key) if cache_key else None
+                if cached is not None:
+                    state['video_info'] = cached.get('video_info')
+                    state['result_info']['language'] = cached.get('language')
+                    finalize(state, cached['transcript'])
+                    return None
+                state['link_cache_key'] = cache_key
+                file_path, state['video_info'] = download_from_youtube(item['url'], update_status)
+                state['audio_path'] = file_path
+                if not file_path:
+                    fail(state, 'Не удалось загрузить аудио по указанной ссылке')
+                    cleanup(state)
+                    return None
+            
+            prepared_path, audio, cache_key, ready_result = prepare_transcription(
+                file_path, item['language'], enable_timestamps, update_status, state['result_info']
+            )
+            state.update(file_path=file_path, prepared_path=prepared_path, audio=audio, cache_key=cache_key)
+            if ready_result is not None:
+                finalize(state, ready_result)
+                return None
+            return state
+        except Exception as e:
+            print(f"Ошибка при подготовке элемента пакета {item['name']}: {e}")
+            traceback.print_exc()
+            fail(state, f'Ошибка: {str(e)}')
+            cleanup(state)
+            return None
+    
+    def transcribe(state, whisper_task_id):
+        item = state['item']
+        try:
+            if whisper_task_id is None:
+                # Длинная запись распознается по фрагментам на всех репликах
+                transcript = transcribe_in_parallel(
+                    state['prepared_path'],
+                    state['audio'],
+                    item['language'],
+                    enable_timestamps,
+                    status_callback=state['update_status'],
+                    segment_callback=state['add_segments'],
+                    result_info=state['result_info']
+                )
+            else:
+                transcript = wait_for_task(whisper_task_id, state['update_status'], state['add_segments'],
+                                           service_url, state['result_info'])
+            transcript = finish_transcription(transcript, state['file_path'], state['prepared_path'],
+                                              enable_timestamps, state['cache_key'], state['result_info'])
+            finalize(state, transcript)
+        except Exception as e:
+            print(f"Ошибка при распознавании элемента пакета {item['name']}: {e}")
+            traceback.print_exc()
+            fail(state, f'Ошибка: {str(e)}')
+            cleanup(state)
+    
+    with ThreadPoolExecutor(max_workers=app.config['BATCH_CONCURRENCY']) as executor:
+        states = [state for state in executor.map(prepare, items) if state is not None]
+        
+        long_states, short_states = [], []
+        for state in states:
+            (long_states if use_parallel_transcription(state['audio']) else short_states).append(state)
+        
+        # Короткие записи ставятся в очередь сервиса вместе
+        whisper_task_ids = []
+        if short_states:
+            try:
+                whisper_task_ids = get_client().submit_batch(
+                    [(state['prepared_path'], state['item']['language']) for state in short_states],
+                    enable_timestamps,
+                    service_url
+                )
+            except Exception as e:
+                print(f"Ошибка при отправке пакета {batch_id} в сервис Whisper: {e}")
+                # Принятые сервисом записи распознаются; ошибкой завершаются только остальные
+                whisper_task_ids = getattr(e, 'task_ids', None) or [None] * len(short_states)
+                queued = []
+                for state, whisper_task_id in zip(short_states, whisper_task_ids):
+                    if whisper_task_id is None:
+                        fail(state, f'Ошибка: {str(e)}')
+                        cleanup(state)
+                    else:
+                        queued.append((state, whisper_task_id))
+                short_states = [state for state, _ in queued]
+                whisper_task_ids = [whisper_task_id for _, whisper_task_id in queued]
+        
+        list(executor.map(transcribe, short_states + long_states,
+                          whisper_task_ids + [None] * len(long_states)))
+    
+    batches.update(batch_id, status='complete', finished_at=time.time())
+
+
+def batch_item_status(item):
+    """Состояние элемента пакета по статусу его задачи"""
+    status = task_status.get(item['task_id']) or {}
+    return {
+        'task_id': item['task_id'],
+        'name': item['name'],
+        'source': item['source'],
+        'status': status.get('status', 'unknown'),
+        'percent': status.get('percent', 0),
+        'message': status.get('message', ''),
+        'share_url': status.get('share_url')
+    }
+
+
+@app.route('/batch', methods=['POST'])
+def create_batch():
+    """
+    Пакетная транскрипция: несколько файлов и ссылок одним запросом
+    
+    multipart/form-data: файлы в поле files, ссылки - в поле urls (по одной
+    на строку), language и timestamps - общие для пакета. JSON: {"items":
+    [{"url": ..., "language": ...} или просто ссылка, ...], "language": ...,
+    "timestamps": ...}. Возвращает ID пакета и ID задач элементов.
+    """
+    sources = []
+    if request.is_json:
+        data = request.get_json() or {}
+        language_code = data.get('language', 'ru-RU')
+        enable_timestamps = bool(data.get('timestamps', False))
+        for entry in data.get('items') or []:
+            if isinstance(entry, str):
+                entry = {'url': entry}
+            if not isinstance(entry, dict) or not entry.get('url'):
+                return jsonify({'error': 'Каждый элемент пакета должен содержать url'}), 400
+            sources.append(('url', entry['url'], entry.get('language', language_code)))
+    else:
+        language_code = request.form.get('language', 'ru-RU')
+        enable_timestamps = request.form.get('timestamps') == 'true'
+        for file in request.files.getlist('files'):
+            if not file.filename or not allowed_file(file.filename):
+                return jsonify({'error': f'Формат файла не поддерживается: {file.filename}'}), 400
+            sources.append(('file', file, language_code))
+        for url in request.form.get('urls', '').splitlines():
+            if url.strip():
+                sources.append(('url', url.strip(), language_code))
+    
+    if not sources:
+        return jsonify({'error': 'Пакет не содержит файлов и ссылок'}), 400
+    if len(sources) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f"В пакете не более {app.config['BATCH_MAX_ITEMS']} элементов"}), 400
+    
+    items = []
+    for source, value, item_language in sources:
+        item = {'task_id': generate_task_id(), 'source': source, 'language': item_language}
+        if source == 'file':
+            filename = secure_filename(value.filename)
+            item['path'] = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}_{filename}")
+            item['name'] = value.filename
+            value.save(item['path'])
+        else:
+            item['url'] = item['name'] = value
+        task_status[item['task_id']] = {
+            'status': 'preparing',
+            'percent': 0,
+            'message': 'Ожидание обработки пакета'
+        }
+        items.append(item)
+    
+    batch_id = str(uuid.uuid4())
+    batches[batch_id] = {
+        'status': 'queued',
+        'created_at': time.time(),
+        'timestamps': enable_timestamps,
+        'items': items
+    }
+    start_job('process_batch', batch_id)
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'status_url': f'/batch/{batch_id}',
+        'results_url': f'/batch/{batch_id}/results',
+        'items': [{'task_id': item['task_id'], 'name': item['name'], 'source': item['source']}
+                  for item in items]
+    })
+
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Состояние пакета: общий статус, счетчики и состояние каждого элемента"""
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Пакет не найден'}), 404
+    
+    items = [batch_item_status(item) for item in batch['items']]
+    counts = {}
+    for item in items:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+    return jsonify({
+        'batch_id': batch_id,
+        'status': batch['status'],
+        'created_at': batch['created_at'],
+        'finished_at': batch.get('finished_at'),
+        'total': len(items),
+        'counts': counts,
+        'items': items
+    })
+
+
+@app.route('/batch/<batch_id>/results', methods=['GET'])
+def get_batch_results(batch_id):
+    """Результаты пакета в формате JSONL: по строке на элемент, в порядке манифеста"""
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Пакет не найден'}), 404
+    
+    def generate():
+        for item in batch['items']:
+            status = task_status.get(item['task_id']) or {}
+            state = status.get('status', 'unknown')
+            yield json.dumps({
+                'task_id': item['task_id'],
+                'name': item['name'],
+                'source': item['source'],
+                'status': state,
+                'transcript': status.get('transcript'),
+                'with_timestamps': status.get('with_timestamps'),
+                'language': status.get('language'),
+                'video_info': status.get('video_info'),
+                'share_url': status.get('share_url'),
+                'docx_path': status.get('docx_path'),
+                'error': status.get('message') if state == 'error' else None
+            }, ensure_ascii=False) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=batch_{batch_id}.jsonl'}
+    )
+
+
+# Фоновые задачи, которые запускает start_job (в том числе процесс job_runner.py)
+JOB_FUNCTIONS = {
+    'process_audio_file': process_audio_file,
+    'process_youtube_link': process_youtube_link,
+    'process_youtube_raw': process_youtube_raw,
+    'process_batch': process_batch
+}
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,275 @@
+import numpy as np
+
+# Параметры детектора речи по умолчанию
+FRAME_SECONDS = 0.03
+MIN_THRESHOLD_DB = -50.0  # кадры тише этого уровня никогда не считаются речью
+NOISE_MARGIN_DB = 10.0  # насколько речь должна быть громче фонового шума
+MIN_SILENCE_SECONDS = 0.5  # более короткие паузы считаются частью фразы
+MIN_SPEECH_SECONDS = 0.25  # более короткие всплески (щелчки, стук) отбрасываются
+PADDING_SECONDS = 0.2  # запас вокруг каждой области речи, чтобы не срезать слоги
+
+
+def frame_energy_db(samples, sample_rate=16000, frame_seconds=FRAME_SECONDS, block_frames=100000):
+    """
+    Уровень (дБ относительно полной шкалы) по кадрам фиксированной длины
+
+    Массив обрабатывается блоками, поэтому длинные записи в memmap не
+    копируются в память целиком. Целочисленный PCM приводится к [-1, 1].
+    """
+    frame = max(1, int(frame_seconds * sample_rate))
+    count = len(samples) // frame
+    scale = 1.0 / np.iinfo(samples.dtype).max if np.issubdtype(samples.dtype, np.integer) else 1.0
+
+    energy = np.empty(count, dtype=np.float32)
+    for first in range(0, count, block_frames):
+        last = min(first + block_frames, count)
+        frames = np.asarray(samples[first * frame:last * frame], dtype=np.float32).reshape(-1, frame)
+        mean_square = np.einsum('ij,ij->i', frames, frames) / frame * (scale * scale)
+        energy[first:last] = 10 * np.log10(mean_square + 1e-10)
+    return energy
+
+
+def _runs(mask):
+    """Начала и концы (не включая) непрерывных участков True в булевом массиве"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+
+def detect_speech_regions(samples, sample_rate=16000, threshold_db=None,
+                          min_silence=MIN_SILENCE_SECONDS, min_speech=MIN_SPEECH_SECONDS,
+                          padding=PADDING_SECONDS, frame_seconds=FRAME_SECONDS):
+    """
+    Энергетический детектор речи
+
+    Порог подстраивается под запись: уровень шума оценивается по 10-му
+    перцентилю энергии кадров, речью считаются кадры громче шума на
+    NOISE_MARGIN_DB (но не тише MIN_THRESHOLD_DB).
+
+    Args:
+        samples: массив отсчетов (float32 в [-1, 1] или целочисленный PCM), моно
+        sample_rate: частота дискретизации
+        threshold_db: фиксированный порог вместо адаптивного
+
+    Returns:
+        Список областей речи [(начало, конец)] в отсчетах, по возрастанию, без пересечений
+    """
+    energy = frame_energy_db(samples, sample_rate, frame_seconds)
+    if len(energy) == 0:
+        return []
+
+    if threshold_db is None:
+        threshold_db = max(MIN_THRESHOLD_DB, float(np.percentile(energy, 10)) + NOISE_MARGIN_DB)
+    speech = energy > threshold_db
+
+    # Короткие паузы внутри фразы заполняем
+    starts, ends = _runs(~speech)
+    max_gap = int(round(min_silence / frame_seconds))
+    for start, end in zip(starts, ends):
+        if end - start < max_gap and start > 0 and end < len(speech):
+            speech[start:end] = True
+
+    # Короткие всплески отбрасываем
+    starts, ends = _runs(speech)
+    keep = (ends - starts) >= int(round(min_speech / frame_seconds))
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return []
+
+    # Переводим кадры в отсчеты с запасом и объединяем пересекающиеся области
+    frame = int(frame_seconds * sample_rate)
+    pad = int(padding * sample_rate)
+    regions = []
+    for start, end in zip(starts * frame - pad, ends * frame + pad):
+        start, end = max(int(start), 0), min(int(end), len(samples))
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+class Timeline:
+    """
+    Соответствие времени в склеенном аудио (только области речи) и в исходной записи
+
+    Время внутри области речи сдвигается на суммарную длину вырезанной до
+    нее тишины.
+    """
+
+    def __init__(self, regions, sample_rate=16000):
+        self.sample_rate = sample_rate
+        lengths = np.array([end - start for start, end in regions], dtype=np.int64)
+        self._compact_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) / sample_rate
+        self._original_starts = np.array([start for start, _ in regions], dtype=np.int64) / sample_rate
+
+    def to_original(self, seconds, end=False):
+        """
+        Перевод времени склеенного аудио в время исходной записи
+
+        Точка стыка двух областей относится к следующей области для начала
+        сегмента и к предыдущей - для его конца (end=True).
+        """
+        if seconds is None or len(self._compact_starts) == 0:
+            return seconds
+        side = 'left' if end else 'right'
+        index = max(int(np.searchsorted(self._compact_starts, seconds, side=side)) - 1, 0)
+        return float(self._original_starts[index] + (seconds - self._compact_starts[index]))
+
+    def remap_chunks(self, chunks):
+        """Перевод таймкодов сегментов вида {'text', 'timestamp': (начало, конец)}"""
+        return [dict(chunk, timestamp=(
+            self.to_original(chunk['timestamp'][0]),
+            self.to_original(chunk['timestamp'][1], end=True)
+        )) for chunk in chunks]
+
+
+def compact_regions(samples, regions, sample_rate=16000, out=None):
+    """
+    Склейка областей речи в один массив
+
+    Args:
+        samples: исходный массив отсчетов
+        regions: области речи из detect_speech_regions
+        out: готовый буфер нужной длины (например, memory-mapped для длинных записей)
+
+    Returns:
+        (склеенный массив, Timeline для перевода таймкодов обратно)
+    """
+    total = sum(end - start for start, end in regions)
+    if out is None:
+        out = np.empty(total, dtype=samples.dtype)
+
+    position = 0
+    for start, end in regions:
+        out[position:position + end - start] = samples[start:end]
+        position += end - start
+    return out, Timeline(regions, sample_rate)
+
+
+def _segment_samples(audio_segment):
+    """Отсчеты AudioSegment (чередующиеся по каналам) как целочисленный массив NumPy"""
+    width = audio_segment.sample_width
+    data = audio_segment.raw_data
+    if width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8)[:len(data) // 3 * 3].reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(values >= 1 << 23, values - (1 << 24), values)
+    # audioop (и pydub вслед за ним) считает 8-битные отсчеты знаковыми
+    dtype = {1: np.int8, 2: '<i2', 4: '<i4'}[width]
+    return np.frombuffer(data, dtype=dtype, count=len(data) // width)
+
+
+def _ms_sums_of_squares(audio_segment, seg_len, block_ms=60000):
+    """
+    Суммы квадратов отсчетов по миллисекундам и границы миллисекунд в кадрах
+
+    Граница миллисекунды m - кадр int(m * frame_rate / 1000), как при срезе
+    AudioSegment[a:b]. Суммы считаются блоками, поэтому квадраты всех
+    отсчетов одновременно в памяти не держатся.
+    """
+    samples = _segment_samples(audio_segment)
+    channels = audio_segment.channels
+    frame_total = len(samples) // channels
+    # Для 8/16-битного звука суммы точны в int64, для 24/32-битного копятся в float64, как в audioop
+    acc_dtype = np.int64 if audio_segment.sample_width <= 2 else np.float64
+
+    bounds = (np.arange(seg_len + 1) * (audio_segment.frame_rate / 1000.0)).astype(np.int64)
+    clamped = np.minimum(bounds, frame_total)
+
+    sums = np.zeros(seg_len, dtype=acc_dtype)
+    for first in range(0, seg_len, block_ms):
+        last = min(first + block_ms, seg_len)
+        frame_start, frame_end = clamped[first], clamped[last]
+        if frame_end <= frame_start:
+            continue
+
+        block = samples[frame_start * channels:frame_end * channels].astype(acc_dtype)
+        squares = (block * block).reshape(-1, channels).sum(axis=1)
+
+        # Пустые миллисекунды бывают только за концом данных (или при частоте ниже 1 кГц)
+        non_empty = clamped[first + 1:last + 1] > clamped[first:last]
+        offsets = clamped[first:last][non_empty] - frame_start
+        sums[first:last][non_empty] = np.add.reduceat(squares, offsets)
+    return sums, bounds, clamped
+
+
+def detect_silence(audio_segment, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """
+    Векторизованная замена pydub.silence.detect_silence с тем же API и результатом
+
+    Вместо среза и audioop.rms для каждого шага RMS всех окон считается
+    сразу по накопленным суммам квадратов (по миллисекундам). Для 8- и
+    16-битного звука результат совпадает с pydub точно.
+
+    Returns:
+        Список участков тишины [начало, конец] в миллисекундах
+    """
+    seg_len = len(audio_segment)
+
+    # Тишина не может быть длиннее самого звука
+    if seg_len < min_silence_len:
+        return []
+
+    threshold = 10 ** (silence_thresh / 20) * audio_segment.max_possible_amplitude
+
+    last_slice_start = seg_len - min_silence_len
+    slice_starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        slice_starts = np.append(slice_starts, last_slice_start)
+    slice_ends = slice_starts + min_silence_len
+
+    sums, bounds, clamped = _ms_sums_of_squares(audio_segment, seg_len)
+    cumulative = np.concatenate(([0], np.cumsum(sums)))
+
+    # Как в AudioSegment.__getitem__: неполный срез в конце дополняется нулями,
+    # а срез совсем без данных имеет нулевой RMS
+    window_sums = (cumulative[slice_ends] - cumulative[slice_starts]).astype(np.float64)
+    counts = (bounds[slice_ends] - bounds[slice_starts]) * audio_segment.channels
+    has_data = clamped[slice_ends] > clamped[slice_starts]
+    rms = np.zeros(len(slice_starts))
+    rms[has_data] = np.floor(np.sqrt(window_sums[has_data] / counts[has_data]))
+
+    silence_starts = slice_starts[rms <= threshold]
+    if len(silence_starts) == 0:
+        return []
+
+    # Соседние окна тишины объединяются, если между ними нет разрыва длиннее окна
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = silence_starts[np.concatenate(([0], breaks + 1))]
+    range_ends = silence_starts[np.concatenate((breaks, [len(silence_starts) - 1]))] + min_silence_len
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(audio_segment, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """
+    Векторизованная замена pydub.silence.detect_nonsilent с тем же API и результатом
+
+    Returns:
+        Список участков звука [начало, конец] в миллисекундах
+    """
+    silent_ranges = detect_silence(audio_segment, min_silence_len, silence_thresh, seek_step)
+    len_seg = len(audio_segment)
+
+    # Тишины нет - весь звук не тихий
+    if not silent_ranges:
+        return [[0, len_seg]]
+
+    # Весь звук - тишина
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+
+    if end != len_seg:
+        nonsilent_ranges.append([prev_end, len_seg])
+
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+
+    return nonsilent_ranges
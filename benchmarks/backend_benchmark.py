@@ -0,0 +1,147 @@
+"""
+Сравнение бэкендов инференса на CPU: torch (float32), int8 и onnx
+
+Каждый бэкенд запускается в отдельном процессе (WHISPER_BACKEND задается
+до импорта whisper_service, кэш результатов отключен), распознает все
+аудиофайлы из каталога с примерами и сообщает время загрузки, RTF (время
+обработки / длительность аудио) и WER. Если рядом с файлом лежит
+одноименный .txt, WER считается относительно него; кроме того, для каждого
+бэкенда считается расхождение (WER) с результатом torch float32.
+
+Запуск из корня репозитория:
+    python benchmarks/backend_benchmark.py samples/
+    python benchmarks/backend_benchmark.py samples/ --backends torch int8
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.m4a', '.flac', '.webm')
+
+
+def normalize(text):
+    """Нижний регистр, ё -> е, без пунктуации"""
+    text = text.lower().replace('ё', 'е')
+    return re.sub(r'[^\w\s]', ' ', text).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """WER: расстояние Левенштейна по словам, деленное на число слов эталона"""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def list_samples(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+
+
+def run_backend(samples, language):
+    """Выполняется в дочернем процессе: распознавание всех файлов текущим бэкендом"""
+    sys.path.insert(0, ROOT)
+    import whisper_service
+
+    started = time.perf_counter()
+    whisper_service.load_model()
+    load_seconds = time.perf_counter() - started
+    whisper_service.warmup_model()
+
+    results = []
+    for path in samples:
+        duration = whisper_service.get_audio_duration(path)
+        started = time.perf_counter()
+        text = whisper_service.transcribe_with_whisper(path, language, False)
+        results.append({
+            'file': path,
+            'duration': duration,
+            'seconds': time.perf_counter() - started,
+            'text': text
+        })
+    return {'backend': whisper_service.BACKEND, 'load_seconds': load_seconds, 'results': results}
+
+
+def spawn(backend, samples, language, batch_scheduler):
+    env = dict(
+        os.environ,
+        WHISPER_BACKEND=backend,
+        WHISPER_RESULT_CACHE='false',
+        WHISPER_BATCH_SCHEDULER='true' if batch_scheduler else 'false',
+        CUDA_VISIBLE_DEVICES=''
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', '--language', language, *samples],
+        env=env, stdout=subprocess.PIPE, check=True
+    ).stdout
+    # Последняя строка вывода - JSON с результатами, выше могут быть сообщения библиотек
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='каталог с примерами (или сами файлы при --child)')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'int8', 'onnx'],
+                        choices=['torch', 'int8', 'onnx'])
+    parser.add_argument('--language', default='ru-RU')
+    parser.add_argument('--no-batch-scheduler', action='store_true',
+                        help='распознавать без общего планировщика пакетов')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.paths, args.language), ensure_ascii=False))
+        return
+
+    samples = list_samples(args.paths[0])
+    if not samples:
+        parser.error(f"в {args.paths[0]} нет аудиофайлов")
+
+    references = {}
+    for path in samples:
+        reference_path = os.path.splitext(path)[0] + '.txt'
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding='utf-8') as f:
+                references[path] = f.read()
+
+    runs = {}
+    for backend in args.backends:
+        print(f"Бэкенд {backend}: {len(samples)} файлов...", file=sys.stderr)
+        runs[backend] = spawn(backend, samples, args.language, not args.no_batch_scheduler)
+
+    baseline = runs.get('torch')
+    print(f"{'бэкенд':<7} | {'загрузка, с':>11} | {'RTF':>6} | {'WER':>6} | {'расхождение с torch':>19}")
+    print('-' * 62)
+    for backend, run in runs.items():
+        results = run['results']
+        audio_seconds = sum(item['duration'] for item in results)
+        rtf = sum(item['seconds'] for item in results) / audio_seconds if audio_seconds else 0
+
+        scored = [item for item in results if item['file'] in references]
+        wer = (sum(word_error_rate(references[item['file']], item['text']) for item in scored) / len(scored)
+               if scored else None)
+        drift = (sum(word_error_rate(base['text'], item['text'])
+                     for base, item in zip(baseline['results'], results)) / len(results)
+                 if baseline and backend != 'torch' else None)
+
+        print(f"{backend:<7} | {run['load_seconds']:>11.1f} | {rtf:>6.3f} | "
+              f"{'-' if wer is None else f'{wer:.3f}':>6} | {'-' if drift is None else f'{drift:.3f}':>19}")
+
+
+if __name__ == '__main__':
+    main()
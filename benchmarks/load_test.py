@@ -0,0 +1,194 @@
+"""
+Нагрузочный тест веб-приложения с несколькими воркерами gunicorn
+
+Для каждого числа воркеров (по умолчанию 1, 2, 4 и 8) запускается gunicorn
+в режиме JOB_RUNNER=queue с общими хранилищем статусов и очередью задач во
+временном каталоге. Клиенты в течение заданного времени повторяют сценарий:
+загрузка короткой записи (/upload), запрос статуса созданной задачи
+(/task_status), страница сохраненной транскрипции (/share) и скачивание DOCX
+(/download). Запросы одного клиента попадают в разные воркеры, поэтому
+каждый ответ "не найдено" означает, что воркер не видит данных другого
+воркера - такие ответы считаются отдельно и должны отсутствовать.
+
+job_runner.py не запускается: измеряется пропускная способность HTTP-части,
+задачи только ставятся в очередь.
+
+Запуск из корня репозитория:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --workers 1 4 --clients 64 --seconds 30
+"""
+import io
+import os
+import sys
+import time
+import wave
+import socket
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_wav(seconds=1, sample_rate=16000):
+    """Тишина в формате WAV 16 кГц, 16 бит, моно"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b'\0\0' * sample_rate * seconds)
+    return buffer.getvalue()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(env):
+    """Сессия с транскрипцией и DOCX-файл, которые запрашивают клиенты"""
+    sys.path.insert(0, ROOT)
+    from task_store import create_task_store
+
+    sessions = create_task_store(env['TASK_STORE_URL'], 'session', 3600)
+    sessions['load-test'] = {
+        'created_at': time.time(),
+        'transcript': 'Проверка нагрузки. ' * 200,
+        'docx_path': 'load-test.docx',
+        'with_timestamps': False,
+        'video_info': None,
+        'share_url': '/share/load-test',
+        'language': 'ru-RU'
+    }
+    transcripts_dir = os.path.join(tempfile.gettempdir(), 'transcripts')
+    os.makedirs(transcripts_dir, exist_ok=True)
+    with open(os.path.join(transcripts_dir, 'load-test.docx'), 'wb') as f:
+        f.write(os.urandom(16 * 1024))
+
+
+def start_gunicorn(workers, threads, env):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--worker-class', 'gthread', '--threads', str(threads), 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn с {workers} воркерами не запустился")
+
+
+def client(base_url, audio, stop, stats, lock):
+    """Один клиент: повторяет сценарий до сигнала остановки"""
+    session = requests.Session()
+    latencies, requests_done, errors, misses = [], 0, 0, 0
+
+    def call(method, path, **kwargs):
+        nonlocal requests_done, errors, misses
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            errors += 1
+            return None
+        latencies.append(time.perf_counter() - started)
+        requests_done += 1
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code == 404 or (content_type.startswith(('text/html', 'application/json'))
+                                           and 'не найдена' in response.text):
+            misses += 1
+        elif response.status_code != 200:
+            errors += 1
+        return response
+
+    while not stop.is_set():
+        response = call('POST', '/upload', files={'file': ('load.wav', audio, 'audio/wav')},
+                        data={'language': 'ru-RU'})
+        if response is not None and response.status_code == 200:
+            call('GET', f"/task_status/{response.json()['task_id']}")
+        call('GET', '/share/load-test')
+        call('GET', '/download/load-test.docx')
+
+    with lock:
+        stats['latencies'].extend(latencies)
+        stats['requests'] += requests_done
+        stats['errors'] += errors
+        stats['misses'] += misses
+
+
+def run(base_url, clients, seconds):
+    audio = make_wav()
+    stop, lock = threading.Event(), threading.Lock()
+    stats = {'latencies': [], 'requests': 0, 'errors': 0, 'misses': 0}
+    threads = [threading.Thread(target=client, args=(base_url, audio, stop, stats, lock))
+               for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(stats['latencies']) or [0.0]
+    return {
+        'rps': stats['requests'] / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+        'errors': stats['errors'],
+        'misses': stats['misses']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=8, help='потоков в каждом воркере gunicorn')
+    parser.add_argument('--clients', type=int, default=32, help='одновременных клиентов')
+    parser.add_argument('--seconds', type=int, default=20, help='длительность замера для каждого числа воркеров')
+    args = parser.parse_args()
+
+    print(f"{'воркеров':>8} | {'запросов/с':>10} | {'p50, мс':>8} | {'p95, мс':>8} | {'ошибок':>6} | "
+          f"{'не найдено':>10} | {'ускорение':>9}")
+    print('-' * 78)
+    baseline = None
+    for workers in args.workers:
+        workdir = tempfile.mkdtemp(prefix='load-test-')
+        env = dict(
+            os.environ,
+            UPLOAD_FOLDER=workdir,
+            TASK_STORE_URL='sqlite:///' + os.path.join(workdir, 'tasks.db'),
+            JOB_RUNNER='queue',
+            JOB_QUEUE_PATH=os.path.join(workdir, 'jobs.db'),
+            TRANSCRIPT_CACHE='false'
+        )
+        seed(env)
+        process, base_url = start_gunicorn(workers, args.threads, env)
+        try:
+            result = run(base_url, args.clients, args.seconds)
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        baseline = baseline or result['rps']
+        print(f"{workers:>8} | {result['rps']:>10.1f} | {result['p50']:>8.1f} | {result['p95']:>8.1f} | "
+              f"{result['errors']:>6} | {result['misses']:>10} | {result['rps'] / baseline:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Сравнение скорости поиска тишины: pydub.silence и векторизованная версия из audio_vad
+
+Генерирует синтетическую запись (16 кГц, моно, 16 бит) с чередованием
+речеподобного шума и пауз, измеряет время detect_silence/detect_nonsilent
+и проверяет, что результаты совпадают.
+
+Запуск из корня репозитория:
+    python benchmarks/silence_benchmark.py
+    python benchmarks/silence_benchmark.py --minutes 1 10 --skip-pydub-above 10
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from pydub import AudioSegment
+from pydub import silence as pydub_silence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import audio_vad  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def make_recording(minutes, seed=0):
+    """Запись с фразами по 1-8 с и паузами по 0.2-3 с (примерно 30% тишины)"""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    samples = np.empty(total, dtype=np.int16)
+    position, speaking = 0, True
+    while position < total:
+        length = int((rng.uniform(1, 8) if speaking else rng.uniform(0.2, 3)) * SAMPLE_RATE)
+        length = min(length, total - position)
+        level = 3000 if speaking else 30
+        samples[position:position + length] = np.clip(rng.normal(0, level, length), -32768, 32767)
+        position += length
+        speaking = not speaking
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+
+
+def measure(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 10, 60])
+    parser.add_argument('--min-silence-len', type=int, default=500)
+    parser.add_argument('--silence-thresh', type=float, default=-40)
+    parser.add_argument('--skip-pydub-above', type=float, default=None,
+                        help='не запускать pydub для записей длиннее N минут')
+    args = parser.parse_args()
+
+    params = dict(min_silence_len=args.min_silence_len, silence_thresh=args.silence_thresh)
+    print(f"{'минут':>6} | {'функция':<17} | {'pydub, с':>9} | {'numpy, с':>9} | {'ускорение':>9} | совпадает")
+    print('-' * 72)
+
+    for minutes in args.minutes:
+        audio = make_recording(minutes)
+        for name in ('detect_silence', 'detect_nonsilent'):
+            fast, fast_time = measure(getattr(audio_vad, name), audio, **params)
+
+            if args.skip_pydub_above is not None and minutes > args.skip_pydub_above:
+                print(f"{minutes:>6g} | {name:<17} | {'-':>9} | {fast_time:>9.3f} | {'-':>9} | -")
+                continue
+
+            slow, slow_time = measure(getattr(pydub_silence, name), audio, **params)
+            print(f"{minutes:>6g} | {name:<17} | {slow_time:>9.2f} | {fast_time:>9.3f} | "
+                  f"{slow_time / fast_time:>8.0f}x | {'да' if slow == fast else 'НЕТ'}")
+
+
+if __name__ == '__main__':
+    main()
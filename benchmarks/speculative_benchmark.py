@@ -0,0 +1,86 @@
+"""
+Спекулятивное декодирование: скорость генерации и совпадение результата
+
+Каждый 30-секундный фрагмент аудиофайлов из каталога с примерами
+распознается основной моделью дважды - обычным жадным декодированием и
+с черновой моделью (assistant_model). Для каждого режима выводится скорость
+в токенах в секунду; токены обоих режимов должны совпадать полностью.
+
+Запуск из корня репозитория:
+    python benchmarks/speculative_benchmark.py samples/
+    python benchmarks/speculative_benchmark.py samples/ --assistant distil-whisper/distil-large-v3
+"""
+import os
+import sys
+import time
+import argparse
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.m4a', '.flac', '.webm')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('samples', help='каталог с аудиофайлами')
+    parser.add_argument('--assistant', default=os.environ.get('WHISPER_ASSISTANT_MODEL',
+                                                              'distil-whisper/distil-large-v3'))
+    parser.add_argument('--language', default='ru')
+    args = parser.parse_args()
+
+    # Модули сервиса читают настройки при импорте
+    os.environ['WHISPER_ASSISTANT_MODEL'] = args.assistant
+    os.environ['WHISPER_BATCH_SCHEDULER'] = 'false'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import torch
+    import whisper_service
+    from whisper_service import SAMPLE_RATE
+
+    whisper_service.load_model()
+    model, processor = whisper_service.model, whisper_service.processor
+    assistant = whisper_service.assistant_model
+
+    files = sorted(os.path.join(args.samples, name) for name in os.listdir(args.samples)
+                   if name.lower().endswith(AUDIO_EXTENSIONS))
+    if not files:
+        parser.error(f"в {args.samples} нет аудиофайлов")
+
+    chunk_samples = 30 * SAMPLE_RATE
+    totals = {'greedy': [0, 0.0], 'assisted': [0, 0.0]}  # токены, секунды
+    chunks = mismatches = 0
+
+    for path in files:
+        audio = whisper_service.decode_audio(path)
+        for start in range(0, len(audio), chunk_samples):
+            features = processor.feature_extractor(
+                audio[start:start + chunk_samples], sampling_rate=SAMPLE_RATE, return_tensors="pt"
+            ).input_features.to(whisper_service.DEVICE, dtype=model.dtype)
+
+            outputs = {}
+            for mode in ('greedy', 'assisted'):
+                kwargs = {'assistant_model': assistant} if mode == 'assisted' else {}
+                started = time.perf_counter()
+                with torch.inference_mode():
+                    tokens = model.generate(input_features=features, language=args.language, task="transcribe",
+                                            return_timestamps=True, max_new_tokens=whisper_service.MAX_NEW_TOKENS,
+                                            **kwargs)[0]
+                totals[mode][1] += time.perf_counter() - started
+                totals[mode][0] += len(tokens)
+                outputs[mode] = tokens.tolist()
+
+            chunks += 1
+            if outputs['greedy'] != outputs['assisted']:
+                mismatches += 1
+                print(f"Расхождение: {path}, фрагмент с {start / SAMPLE_RATE:.0f} с", file=sys.stderr)
+
+    print(f"Файлов: {len(files)}, фрагментов: {chunks}, черновая модель: {args.assistant}")
+    print(f"{'режим':<9} | {'токенов':>8} | {'время, с':>9} | {'токенов/с':>9}")
+    print('-' * 44)
+    for mode, (tokens, seconds) in totals.items():
+        print(f"{mode:<9} | {tokens:>8} | {seconds:>9.1f} | {tokens / seconds if seconds else 0:>9.1f}")
+    greedy_seconds, assisted_seconds = totals['greedy'][1], totals['assisted'][1]
+    if assisted_seconds:
+        print(f"Ускорение: {greedy_seconds / assisted_seconds:.2f}x")
+    print(f"Результат совпадает: {'да' if not mismatches else f'НЕТ ({mismatches} фрагментов)'}")
+
+
+if __name__ == '__main__':
+    main()
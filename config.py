@@ -19,6 +19,54 @@ class Config:
     # Настройки для Whisper
     WHISPER_MODEL_NAME = os.environ.get('WHISPER_MODEL_NAME', 'antony66/whisper-large-v3-russian')
     WHISPER_SERVICE_URL = os.environ.get('WHISPER_SERVICE_URL', 'http://whisper:5001')
+    
+    # Реплики сервиса Whisper для параллельной обработки длинных записей (через запятую)
+    WHISPER_SERVICE_URLS = [url.strip() for url in os.environ.get(
+        'WHISPER_SERVICE_URLS', WHISPER_SERVICE_URL).split(',') if url.strip()]
+    # При нескольких репликах записи длиннее порога (секунды) делятся по паузам на фрагменты
+    # с перекрытием и распознаются параллельно
+    PARALLEL_MIN_DURATION = int(os.environ.get('PARALLEL_MIN_DURATION', 600))
+    PARALLEL_CHUNK_SECONDS = int(os.environ.get('PARALLEL_CHUNK_SECONDS', 300))
+    PARALLEL_CHUNK_OVERLAP_MS = int(os.environ.get('PARALLEL_CHUNK_OVERLAP_MS', 5000))
+    # Сколько фрагментов одновременно отправлять на каждую реплику (по числу ее обработчиков)
+    PARALLEL_JOBS_PER_SERVICE = int(os.environ.get('PARALLEL_JOBS_PER_SERVICE', 2))
+    
+    # Адрес WebSocket потокового распознавания, доступный из браузера (пусто - отключено)
+    WHISPER_STREAM_URL = os.environ.get('WHISPER_STREAM_URL', '')
+    
+    # Интервал keep-alive в потоке событий /task_events (секунды)
+    TASK_EVENTS_KEEPALIVE = 15
+    
+    # Хранилище статусов задач и сессий, общее для воркеров gunicorn:
+    # 'memory://' (один процесс), 'sqlite:///путь/к/файлу.db' или 'redis://хост:6379/0'
+    TASK_STORE_URL = os.environ.get('TASK_STORE_URL', 'sqlite:///' + os.path.join(UPLOAD_FOLDER, '.tasks.db'))
+    # Срок хранения статуса задачи (секунды)
+    TASK_TTL = int(os.environ.get('TASK_TTL', 24 * 60 * 60))
+    
+    # Где выполняются фоновые задачи: 'thread' - в потоках воркера, принявшего запрос,
+    # 'queue' - в отдельном процессе job_runner.py, который забирает их из очереди
+    JOB_RUNNER = os.environ.get('JOB_RUNNER', 'thread')
+    JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', os.path.join(UPLOAD_FOLDER, '.jobs.db'))
+    # Сколько задач job_runner.py выполняет одновременно
+    JOB_RUNNER_THREADS = int(os.environ.get('JOB_RUNNER_THREADS', 8))
+    
+    # Пакетная транскрипция (/batch): максимум элементов в пакете и сколько
+    # элементов одновременно готовится и ожидается в одном пакете
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 200))
+    BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+    
+    # Ссылки на видео: аудиопоток (bestaudio) декодируется ffmpeg на лету, и фрагменты
+    # около YOUTUBE_PIPELINE_CHUNK_SECONDS распознаются, пока загрузка продолжается;
+    # 'false' - сначала загрузка и конвертация всего файла
+    YOUTUBE_PIPELINE = os.environ.get('YOUTUBE_PIPELINE', 'true').lower() == 'true'
+    YOUTUBE_PIPELINE_CHUNK_SECONDS = int(os.environ.get('YOUTUBE_PIPELINE_CHUNK_SECONDS', 120))
+    # Срок хранения сведений о видео и адреса аудиопотока после проверки ссылки (секунды)
+    VIDEO_INFO_TTL = int(os.environ.get('VIDEO_INFO_TTL', 30 * 60))
+    
+    # Кэш результатов транскрипции (по хэшу аудио или ID видео)
+    TRANSCRIPT_CACHE_ENABLED = os.environ.get('TRANSCRIPT_CACHE', 'true').lower() == 'true'
+    TRANSCRIPT_CACHE_DIR = os.environ.get('TRANSCRIPT_CACHE_DIR', os.path.join(UPLOAD_FOLDER, '.cache'))
+    TRANSCRIPT_CACHE_MAX_BYTES = int(os.environ.get('TRANSCRIPT_CACHE_MAX_MB', 500)) * 1024 * 1024
 
 class DevelopmentConfig(Config):
     DEBUG = True
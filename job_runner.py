@@ -0,0 +1,208 @@
+"""
+Процесс выполнения фоновых задач веб-приложения
+
+В режиме JOB_RUNNER=queue воркеры gunicorn не обрабатывают записи сами:
+они кладут задачу (имя функции из app.JOB_FUNCTIONS и ее аргументы) в очередь
+SQLite, а этот процесс забирает задачи и выполняет их в пуле потоков. Статусы
+задач и сессии лежат в общем хранилище (TASK_STORE_URL), DOCX-файлы - в общем
+каталоге, поэтому результат доступен через любой воркер.
+
+На одну очередь запускается один процесс: задачи, прерванные его остановкой,
+при следующем запуске возвращаются в очередь.
+
+Запуск из корня репозитория:
+    python job_runner.py
+    python job_runner.py --threads 16
+"""
+import os
+import json
+import time
+import fcntl
+import signal
+import sqlite3
+import logging
+import argparse
+import threading
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Интервал опроса очереди, когда она пуста (секунды)
+POLL_INTERVAL = 0.5
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач в файле SQLite (WAL), общая для процессов одной машины
+
+    Задача проходит состояния pending -> running и удаляется после выполнения;
+    упавшие задачи остаются в таблице со статусом failed и текстом ошибки.
+    Забор задачи выполняется в транзакции BEGIN IMMEDIATE, поэтому одну задачу
+    не получат два потока.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, args TEXT NOT NULL, "
+                "status TEXT NOT NULL, error TEXT, created_at REAL NOT NULL, started_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _connection(self):
+        # Соединение SQLite нельзя использовать из разных потоков - у каждого потока свое
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def put(self, name: str, args) -> int:
+        """Постановка задачи в очередь; args должны сериализоваться в JSON"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (name, args, status, created_at) VALUES (?, ?, 'pending', ?)",
+                (name, json.dumps(list(args), ensure_ascii=False), time.time())
+            )
+        return cursor.lastrowid
+
+    def claim(self):
+        """Забор самой старой задачи: (id, имя, аргументы) или None, если очередь пуста"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, name, args FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                (time.time(), row[0])
+            )
+        return row[0], row[1], json.loads(row[2])
+
+    def finish(self, job_id: int, error: str = None):
+        """Завершение задачи: успешные удаляются, упавшие помечаются failed"""
+        with self._transaction() as conn:
+            if error is None:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            else:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ? WHERE id = ?", (error, job_id))
+
+    def requeue_running(self) -> int:
+        """Возврат в очередь задач, прерванных остановкой процесса; возвращает их число"""
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'pending', started_at = NULL WHERE status = 'running'")
+        return cursor.rowcount
+
+    def counts(self) -> dict:
+        """Число задач по состояниям"""
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+class JobRunner:
+    """Забирает задачи из очереди, пока есть свободные потоки, и выполняет их"""
+
+    def __init__(self, queue: JobQueue, functions: dict, threads: int):
+        self.queue = queue
+        self.functions = functions
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job')
+        self._slots = threading.Semaphore(threads)
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self):
+        requeued = self.queue.requeue_running()
+        if requeued:
+            logger.info(f"Возвращено в очередь прерванных задач: {requeued}")
+
+        while not self._stop.is_set():
+            if not self._slots.acquire(timeout=POLL_INTERVAL):
+                continue
+            job = self.queue.claim()
+            if job is None:
+                self._slots.release()
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            self.executor.submit(self._execute, *job)
+
+        # Новые задачи больше не забираем, начатые дорабатываем; если процесс
+        # все же убьют, недоделанные задачи вернутся в очередь при следующем запуске
+        logger.info("Остановка обработчика задач: ожидание выполняемых задач")
+        self.executor.shutdown(wait=True)
+
+    def _execute(self, job_id, name, args):
+        started = time.perf_counter()
+        try:
+            function = self.functions.get(name)
+            if function is None:
+                raise ValueError(f"Неизвестная задача: {name}")
+            function(*args)
+        except Exception as e:
+            logger.error(f"Задача {job_id} ({name}) завершилась ошибкой: {e}")
+            self.queue.finish(job_id, traceback.format_exc())
+        else:
+            logger.info(f"Задача {job_id} ({name}) выполнена за {time.perf_counter() - started:.1f} с")
+            self.queue.finish(job_id)
+        finally:
+            self._slots.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=None,
+                        help='число одновременно выполняемых задач (по умолчанию JOB_RUNNER_THREADS)')
+    args = parser.parse_args()
+
+    # Функции задач, хранилища и настройки берутся из веб-приложения
+    import app as web_app
+    config = web_app.app.config
+    if config['TASK_STORE_URL'].startswith('memory://'):
+        parser.error("TASK_STORE_URL=memory:// недоступно веб-приложению из другого процесса, "
+                     "укажите sqlite:/// или redis://")
+
+    queue = JobQueue(config['JOB_QUEUE_PATH'])
+
+    # Второй процесс на той же очереди вернул бы в очередь чужие выполняющиеся задачи
+    lock_file = open(config['JOB_QUEUE_PATH'] + '.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        parser.error(f"очередь {config['JOB_QUEUE_PATH']} уже обслуживает другой процесс")
+
+    threads = args.threads or config['JOB_RUNNER_THREADS']
+    runner = JobRunner(queue, web_app.JOB_FUNCTIONS, threads)
+    signal.signal(signal.SIGTERM, runner.stop)
+    signal.signal(signal.SIGINT, runner.stop)
+
+    logger.info(f"Обработчик задач запущен: очередь {config['JOB_QUEUE_PATH']}, потоков: {threads}")
+    runner.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import os
+import time
+import heapq
+import threading
+import logging
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """
+    Фоновое удаление истекших сессий и их DOCX-файлов
+
+    Сроки хранятся в куче (время истечения, ID сессии, путь к файлу), поэтому
+    сохранение сессии стоит O(log n), а не проход по всем сессиям. Поток-уборщик
+    спит до ближайшего срока и удаляет истекшие записи пачками по batch_size,
+    не задерживая обработку запросов.
+
+    Куча живет в памяти процесса; файлы, оставшиеся от прошлых запусков и
+    других процессов, при старте ставятся в кучу по времени изменения.
+    """
+
+    def __init__(self, store, directory, ttl, batch_size=500, max_sleep=60):
+        self.store = store
+        self.directory = directory
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.sessions_expired = 0
+        self.files_removed = 0
+        self.bytes_freed = 0
+        self.batches = 0
+        self.scan_seconds = 0.0
+        self.last_scan_seconds = 0.0
+        self._heap = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Запуск потока-уборщика (однократно)"""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+                self._thread.start()
+
+    def schedule(self, session_id, file_path=None, expires_at=None):
+        """Постановка сессии (и ее файла) на удаление по истечении срока"""
+        expires_at = expires_at if expires_at is not None else time.time() + self.ttl
+        with self._condition:
+            wakes_earlier = not self._heap or expires_at < self._heap[0][0]
+            heapq.heappush(self._heap, (expires_at, session_id or '', file_path or ''))
+            if wakes_earlier:
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            pending = len(self._heap)
+        return {
+            'pending': pending,
+            'sessions_expired': self.sessions_expired,
+            'files_removed': self.files_removed,
+            'bytes_freed': self.bytes_freed,
+            'batches': self.batches,
+            'scan_seconds': round(self.scan_seconds, 3),
+            'last_scan_seconds': round(self.last_scan_seconds, 4)
+        }
+
+    def _load_existing(self):
+        """Постановка в кучу файлов, созданных до запуска процесса"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.docx'):
+                path = os.path.join(self.directory, name)
+                try:
+                    self.schedule(None, path, os.path.getmtime(path) + self.ttl)
+                except OSError:
+                    continue
+
+    def _run(self):
+        self._load_existing()
+        while True:
+            with self._condition:
+                now = time.time()
+                if not self._heap or self._heap[0][0] > now:
+                    timeout = min(self._heap[0][0] - now, self.max_sleep) if self._heap else self.max_sleep
+                    self._condition.wait(timeout)
+                    continue
+                batch = []
+                while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                    batch.append(heapq.heappop(self._heap))
+
+            try:
+                self._reap(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при удалении истекших сессий: {e}")
+
+    def _reap(self, batch):
+        started = time.perf_counter()
+        expired = removed = freed = 0
+        for _, session_id, file_path in batch:
+            if session_id:
+                # Хранилище могло уже само убрать запись по сроку - сессия все равно истекла
+                self.store.delete(session_id)
+                expired += 1
+            if file_path:
+                try:
+                    size = os.path.getsize(file_path)
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    # Файл уже удален другим процессом
+                    continue
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить файл {file_path}: {e}")
+                    continue
+                removed += 1
+                freed += size
+
+        elapsed = time.perf_counter() - started
+        self.sessions_expired += expired
+        self.files_removed += removed
+        self.bytes_freed += freed
+        self.batches += 1
+        self.scan_seconds += elapsed
+        self.last_scan_seconds = elapsed
+        if expired or removed:
+            logger.info(f"Удалено истекших сессий: {expired}, файлов: {removed} ({freed} байт) за {elapsed:.3f} с")
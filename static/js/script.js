@@ -14,6 +14,7 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentTaskId = null;
     let videoLinkVerified = false;
     let currentSessionId = null;
+    let liveSegments = [];
     
     // Элементы DOM
     const tabButtons = document.querySelectorAll('.tab-button');
@@ -44,6 +45,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const progressContainer = document.getElementById('progress-container');
     const progressBar = document.getElementById('progress-bar');
     const progressStatus = document.getElementById('progress-status');
+    const partialTranscript = document.getElementById('partial-transcript');
+    const liveTranscript = document.getElementById('live-transcript');
     const progressSteps = document.getElementById('progress-steps');
     const cancelProcessButton = document.getElementById('cancel-process');
     const resultsContainer = document.getElementById('results-container');
@@ -290,51 +293,125 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Функция для отслеживания прогресса задачи
     function trackTaskProgress(taskId) {
-        const statusInterval = setInterval(() => {
-            fetch(`/task_status/${taskId}`)
-                .then(response => response.json())
-                .then(status => {
-                    updateProgress(status.percent, status.message);
-                    
-                    // Обновление шагов прогресса
-                    if (status.percent < 20) {
-                        updateProgressStep('prepare');
-                    } else if (status.percent < 40) {
-                        updateProgressStep('analyze');
-                    } else if (status.percent < 90) {
-                        updateProgressStep('transcribe');
-                    } else {
-                        updateProgressStep('format');
-                    }
-                    
-                    if (status.status === 'complete') {
-                        // Задача завершена, показываем результаты
-                        clearInterval(statusInterval);
-                        showResults(status.transcript, status.with_timestamps, status.video_info);
-                        docxPath = status.docx_path;
-                        currentSessionId = status.session_id;
-                        
-                        // Сохраняем URL для общего доступа
-                        if (status.share_url) {
-                            shareLink.value = window.location.origin + status.share_url;
+        let partialCount = 0;
+        let partialEpoch = 0;
+        partialTranscript.innerHTML = '';
+        partialTranscript.style.display = 'none';
+        
+        // Вывод уже распознанных сегментов: поток событий присылает только новые
+        // (с позицией partial_offset), опрос - весь список. Смена partial_epoch
+        // означает, что сервер начал список заново (повторная попытка распознавания)
+        function showPartial(status) {
+            if (!Array.isArray(status.partial)) {
+                return;
+            }
+            const epoch = status.partial_epoch || 0;
+            if (epoch !== partialEpoch) {
+                partialEpoch = epoch;
+                partialCount = 0;
+                partialTranscript.innerHTML = '';
+                partialTranscript.style.display = 'none';
+            }
+            const offset = status.partial_offset !== undefined ? status.partial_offset : 0;
+            const fresh = status.partial.slice(Math.max(partialCount - offset, 0));
+            fresh.forEach(segment => {
+                const line = document.createElement('div');
+                const time = document.createElement('span');
+                time.className = 'partial-time';
+                time.textContent = segment.start_time;
+                line.appendChild(time);
+                line.appendChild(document.createTextNode(segment.text));
+                partialTranscript.appendChild(line);
+            });
+            partialCount = Math.max(partialCount, offset + status.partial.length);
+            if (fresh.length) {
+                partialTranscript.style.display = 'block';
+                partialTranscript.scrollTop = partialTranscript.scrollHeight;
+            }
+        }
+        
+        // Обработка очередного состояния задачи; возвращает true, если задача завершена
+        function handleStatus(status) {
+            updateProgress(status.percent, status.message);
+            showPartial(status);
+            
+            // Обновление шагов прогресса
+            if (status.percent < 20) {
+                updateProgressStep('prepare');
+            } else if (status.percent < 40) {
+                updateProgressStep('analyze');
+            } else if (status.percent < 90) {
+                updateProgressStep('transcribe');
+            } else {
+                updateProgressStep('format');
+            }
+            
+            if (status.status === 'complete') {
+                showCompletedTask(status);
+                return true;
+            } else if (status.status === 'error') {
+                // Ошибка при выполнении задачи
+                hideProgress();
+                showToast(status.message, 'error');
+                return true;
+            }
+            return false;
+        }
+        
+        // Опрос статуса - запасной вариант, если поток событий недоступен
+        function pollTaskStatus() {
+            const statusInterval = setInterval(() => {
+                fetch(`/task_status/${taskId}`)
+                    .then(response => response.json())
+                    .then(status => {
+                        if (handleStatus(status)) {
+                            clearInterval(statusInterval);
                         }
-                        
-                        // Сохраняем состояние сессии
-                        saveSessionState();
-                    } else if (status.status === 'error') {
-                        // Ошибка при выполнении задачи
+                    })
+                    .catch(error => {
+                        console.error('Ошибка при получении статуса:', error);
                         clearInterval(statusInterval);
                         hideProgress();
-                        showToast(status.message, 'error');
-                    }
-                })
-                .catch(error => {
-                    console.error('Ошибка при получении статуса:', error);
-                    clearInterval(statusInterval);
-                    hideProgress();
-                    showToast('Потеряна связь с сервером', 'error');
-                });
-        }, 1000); // Проверяем статус каждую секунду
+                        showToast('Потеряна связь с сервером', 'error');
+                    });
+            }, 1000); // Проверяем статус каждую секунду
+        }
+        
+        if (!window.EventSource) {
+            pollTaskStatus();
+            return;
+        }
+        
+        // Сервер присылает состояние задачи при каждом изменении
+        const events = new EventSource(`/task_events/${taskId}`);
+        let finished = false;
+        events.onmessage = (event) => {
+            if (handleStatus(JSON.parse(event.data))) {
+                finished = true;
+                events.close();
+            }
+        };
+        events.onerror = () => {
+            events.close();
+            if (!finished) {
+                pollTaskStatus();
+            }
+        };
+    }
+    
+    // Показ результатов завершенной задачи
+    function showCompletedTask(status) {
+        showResults(status.transcript, status.with_timestamps, status.video_info);
+        docxPath = status.docx_path;
+        currentSessionId = status.session_id;
+        
+        // Сохраняем URL для общего доступа
+        if (status.share_url) {
+            shareLink.value = window.location.origin + status.share_url;
+        }
+        
+        // Сохраняем состояние сессии
+        saveSessionState();
     }
     
     // Функция для обновления шага прогресса
@@ -383,11 +460,21 @@ document.addEventListener('DOMContentLoaded', function() {
                     mediaRecorder = new MediaRecorder(stream);
                     const chunks = [];
                     
+                    // Потоковое распознавание во время записи, если сервис доступен из браузера
+                    const live = startLiveTranscription();
+                    
                     mediaRecorder.addEventListener('dataavailable', e => {
                         chunks.push(e.data);
+                        if (live) {
+                            live.send(e.data);
+                        }
                     });
                     
                     mediaRecorder.addEventListener('stop', () => {
+                        if (live) {
+                            live.stop();
+                        }
+                        
                         const blob = new Blob(chunks, { type: 'audio/wav' });
                         recordedBlob = blob;
                         const audioURL = URL.createObjectURL(blob);
@@ -411,8 +498,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         saveSessionState();
                     });
                     
-                    // Начало записи
-                    mediaRecorder.start();
+                    // Начало записи; при потоковом распознавании фрагменты отдаются каждые 250 мс
+                    mediaRecorder.start(live ? 250 : undefined);
                     
                     // Запуск таймера
                     recordingStartTime = Date.now();
@@ -429,6 +516,124 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Потоковое распознавание: фрагменты записи отправляются в WebSocket сервиса Whisper,
+    // в ответ приходят предварительный и окончательный текст фраз
+    function startLiveTranscription() {
+        const streamUrl = liveTranscript.dataset.streamUrl;
+        if (!streamUrl || !window.WebSocket) {
+            return null;
+        }
+        
+        const language = recordLanguageSelect ? recordLanguageSelect.value : 'ru-RU';
+        const socket = new WebSocket(`${streamUrl}?language=${encodeURIComponent(language)}`);
+        const pending = [];
+        let stopRequested = false;
+        let finished = false;
+        let provisionalLine = null;
+        
+        liveSegments = [];
+        liveTranscript.innerHTML = '';
+        liveTranscript.style.display = 'block';
+        
+        function addLine(segment, provisional) {
+            const line = document.createElement('div');
+            const time = document.createElement('span');
+            time.className = 'partial-time';
+            time.textContent = segment.start_time;
+            line.appendChild(time);
+            line.appendChild(document.createTextNode(segment.text));
+            if (provisional) {
+                line.style.opacity = '0.6';
+            }
+            liveTranscript.appendChild(line);
+            liveTranscript.scrollTop = liveTranscript.scrollHeight;
+            return line;
+        }
+        
+        socket.addEventListener('open', () => {
+            pending.splice(0).forEach(blob => socket.send(blob));
+            if (stopRequested) {
+                socket.send('stop');
+            }
+        });
+        
+        socket.addEventListener('message', event => {
+            const message = JSON.parse(event.data);
+            if (message.type === 'provisional' || message.type === 'final') {
+                if (provisionalLine) {
+                    provisionalLine.remove();
+                    provisionalLine = null;
+                }
+                if (message.type === 'final') {
+                    liveSegments.push(message);
+                    addLine(message, false);
+                } else {
+                    provisionalLine = addLine(message, true);
+                }
+            } else if (message.type === 'done') {
+                finished = true;
+                socket.close();
+                finishLiveTranscription();
+            } else if (message.type === 'error') {
+                showToast('Ошибка потокового распознавания: ' + message.message, 'error');
+            }
+        });
+        
+        socket.addEventListener('close', () => {
+            if (!finished && stopRequested) {
+                // Поток оборвался - запись можно отправить обычным способом
+                showToast('Потоковое распознавание прервано, нажмите «Транскрибировать»', 'error');
+            }
+        });
+        
+        return {
+            send(blob) {
+                if (socket.readyState === WebSocket.OPEN) {
+                    socket.send(blob);
+                } else if (socket.readyState === WebSocket.CONNECTING) {
+                    pending.push(blob);
+                }
+            },
+            stop() {
+                stopRequested = true;
+                if (socket.readyState === WebSocket.OPEN) {
+                    socket.send('stop');
+                }
+            }
+        };
+    }
+    
+    // Сохранение результата потокового распознавания (DOCX и ссылка для общего доступа)
+    function finishLiveTranscription() {
+        if (!liveSegments.length) {
+            showToast('В записи не обнаружена речь', 'error');
+            return;
+        }
+        
+        fetch('/record_stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                segments: liveSegments,
+                timestamps: recordTimestampsCheckbox.checked,
+                language: recordLanguageSelect ? recordLanguageSelect.value : 'ru-RU'
+            })
+        })
+        .then(response => response.json())
+        .then(status => {
+            if (status.error) {
+                throw new Error(status.error);
+            }
+            liveTranscript.style.display = 'none';
+            showCompletedTask(status);
+        })
+        .catch(error => {
+            showToast(error.message, 'error');
+        });
+    }
+    
     function stopRecording() {
         if (mediaRecorder && isRecording) {
             mediaRecorder.stop();
@@ -1039,6 +1244,7 @@ try {
     
     function hideProgress() {
         progressContainer.style.display = 'none';
+        partialTranscript.style.display = 'none';
     }
     
     // Отображение результатов
@@ -0,0 +1,425 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Как часто удалять записи с истекшим сроком (секунды)
+PURGE_INTERVAL = 60
+
+
+class TaskStore:
+    """
+    Хранилище состояний задач (и сессий) с версиями и сроком жизни записей
+
+    Значение записи - словарь, сериализуемый в JSON. Изменения атомарны:
+    update сливает поля, append дописывает элементы в список внутри записи;
+    каждое изменение увеличивает версию записи, по которой потоки событий
+    ждут обновлений (wait_for_change). Записи с истекшим сроком (ttl)
+    считаются отсутствующими и периодически удаляются.
+
+    Поддерживает обращения как к словарю: store[key], store[key] = value,
+    key in store, del store[key].
+    """
+
+    # Интервал опроса версии при ожидании изменений, сделанных другими процессами
+    # (None - все изменения происходят в этом процессе, достаточно уведомлений)
+    poll_interval: Optional[float] = None
+
+    def __init__(self, namespace: str, default_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self._condition = threading.Condition()
+        self._last_purge = time.monotonic()
+
+    # Операции, которые реализуют конкретные хранилища
+
+    def get(self, key: str, default=None):
+        """Значение записи или default, если записи нет или ее срок истек"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        """Запись значения целиком; ttl по умолчанию - default_ttl хранилища"""
+        raise NotImplementedError
+
+    def update(self, key: str, **fields) -> Optional[dict]:
+        """Атомарное слияние полей; возвращает новое значение или None, если записи нет"""
+        raise NotImplementedError
+
+    def append(self, key: str, field: str, items: list, **fields) -> Optional[dict]:
+        """Атомарное дополнение списка field (и слияние fields); None, если записи нет"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def version(self, key: str) -> int:
+        """Номер версии записи (0 - записи нет)"""
+        raise NotImplementedError
+
+    def keys(self) -> list:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Удаление записей с истекшим сроком; возвращает их число"""
+        raise NotImplementedError
+
+    # Общая часть
+
+    def items(self):
+        for key in self.keys():
+            value = self.get(key)
+            if value is not None:
+                yield key, value
+
+    def wait_for_change(self, key: str, version: int, timeout: float) -> int:
+        """Ожидание изменения записи после версии version; возвращает текущую версию"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                current = self.version(key)
+                remaining = deadline - time.monotonic()
+                if current != version or remaining <= 0:
+                    return current
+                self._condition.wait(remaining if self.poll_interval is None
+                                     else min(remaining, self.poll_interval))
+
+    def _changed(self):
+        """Пробуждение потоков, ожидающих изменений, и периодическая очистка"""
+        with self._condition:
+            self._condition.notify_all()
+        if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            try:
+                removed = self.purge_expired()
+                if removed:
+                    logger.info(f"Удалено устаревших записей {self.namespace}: {removed}")
+            except Exception as e:
+                logger.warning(f"Не удалось удалить устаревшие записи {self.namespace}: {e}")
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.version(key) > 0
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class MemoryTaskStore(TaskStore):
+    """Хранилище в памяти процесса (один процесс, состояние теряется при перезапуске)"""
+
+    def __init__(self, namespace: str, default_ttl: Optional[float] = None):
+        super().__init__(namespace, default_ttl)
+        self._entries = {}  # ключ -> [JSON значения, версия, время истечения]
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.time():
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key)
+            # Значение хранится в JSON, чтобы вызывающий код не менял его в обход хранилища
+            return json.loads(entry[0]) if entry is not None else default
+
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            entry = self._entries.get(key)
+            self._entries[key] = [data, (entry[1] if entry else 0) + 1, self._expires_at(ttl)]
+        self._changed()
+
+    def _modify(self, key, change):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            value = json.loads(entry[0])
+            change(value)
+            entry[0] = json.dumps(value, ensure_ascii=False)
+            entry[1] += 1
+        self._changed()
+        return value
+
+    def update(self, key, **fields):
+        return self._modify(key, lambda value: value.update(fields))
+
+    def append(self, key, field, items, **fields):
+        def change(value):
+            value.setdefault(field, []).extend(items)
+            value.update(fields)
+        return self._modify(key, change)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._live(key)
+            self._entries.pop(key, None)
+        if entry is not None:
+            self._changed()
+        return entry is not None
+
+    def version(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[1] if entry is not None else 0
+
+    def keys(self):
+        with self._lock:
+            return [key for key in self._entries if self._live(key) is not None]
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[2] is not None and entry[2] <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Хранилище в файле SQLite в режиме WAL
+
+    Подходит для нескольких процессов на одной машине (воркеры gunicorn):
+    изменения выполняются в транзакциях BEGIN IMMEDIATE, изменения из других
+    процессов замечаются опросом версии раз в poll_interval.
+    """
+
+    poll_interval = 0.25
+
+    def __init__(self, path: str, namespace: str, default_ttl: Optional[float] = None):
+        super().__init__(namespace, default_ttl)
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "version INTEGER NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_expires_at ON tasks (expires_at)")
+
+    def _connection(self):
+        # Соединение SQLite нельзя использовать из разных потоков - у каждого потока свое
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _select(self, conn, column, key):
+        row = conn.execute(
+            f"SELECT {column} FROM tasks WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self.namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def get(self, key, default=None):
+        data = self._select(self._connection(), "value", key)
+        return json.loads(data) if data is not None else default
+
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value, ensure_ascii=False)
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO tasks (namespace, key, value, version, expires_at) VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET "
+                "value = excluded.value, version = tasks.version + 1, expires_at = excluded.expires_at",
+                (self.namespace, key, data, self._expires_at(ttl))
+            )
+        self._changed()
+
+    def _modify(self, key, change):
+        with self._transaction() as conn:
+            data = self._select(conn, "value", key)
+            if data is None:
+                return None
+            value = json.loads(data)
+            change(value)
+            conn.execute(
+                "UPDATE tasks SET value = ?, version = version + 1 WHERE namespace = ? AND key = ?",
+                (json.dumps(value, ensure_ascii=False), self.namespace, key)
+            )
+        self._changed()
+        return value
+
+    def update(self, key, **fields):
+        return self._modify(key, lambda value: value.update(fields))
+
+    def append(self, key, field, items, **fields):
+        def change(value):
+            value.setdefault(field, []).extend(items)
+            value.update(fields)
+        return self._modify(key, change)
+
+    def delete(self, key):
+        with self._transaction() as conn:
+            deleted = conn.execute("DELETE FROM tasks WHERE namespace = ? AND key = ?",
+                                   (self.namespace, key)).rowcount
+        if deleted:
+            self._changed()
+        return bool(deleted)
+
+    def version(self, key):
+        return self._select(self._connection(), "version", key) or 0
+
+    def keys(self):
+        rows = self._connection().execute(
+            "SELECT key FROM tasks WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (self.namespace, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_expired(self):
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM tasks WHERE namespace = ? AND expires_at <= ?",
+                                (self.namespace, time.time())).rowcount
+
+
+class RedisTaskStore(TaskStore):
+    """
+    Хранилище в Redis (или совместимом сервере) для нескольких машин
+
+    Запись - хэш с полями value и version; срок жизни задается EXPIRE,
+    поэтому устаревшие записи удаляет сам сервер. Изменения выполняются
+    оптимистичными транзакциями WATCH/MULTI.
+    """
+
+    poll_interval = 0.25
+
+    def __init__(self, url: str, namespace: str, default_ttl: Optional[float] = None, client=None):
+        super().__init__(namespace, default_ttl)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("Для хранилища задач в Redis нужен пакет redis")
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key, default=None):
+        data = self._client.hget(self._key(key), "value")
+        return json.loads(data) if data is not None else default
+
+    def set(self, key, value, ttl=None):
+        name = self._key(key)
+        ttl = self.default_ttl if ttl is None else ttl
+        pipe = self._client.pipeline(transaction=True)
+        pipe.hset(name, "value", json.dumps(value, ensure_ascii=False))
+        pipe.hincrby(name, "version", 1)
+        if ttl:
+            pipe.pexpire(name, int(ttl * 1000))
+        else:
+            pipe.persist(name)
+        pipe.execute()
+        self._changed()
+
+    def _modify(self, key, change):
+        name = self._key(key)
+
+        def apply(pipe):
+            data = pipe.hget(name, "value")
+            if data is None:
+                return None
+            value = json.loads(data)
+            change(value)
+            pipe.multi()
+            pipe.hset(name, "value", json.dumps(value, ensure_ascii=False))
+            pipe.hincrby(name, "version", 1)
+            return value
+
+        value = self._client.transaction(apply, name, value_from_callable=True)
+        if value is not None:
+            self._changed()
+        return value
+
+    def update(self, key, **fields):
+        return self._modify(key, lambda value: value.update(fields))
+
+    def append(self, key, field, items, **fields):
+        def change(value):
+            value.setdefault(field, []).extend(items)
+            value.update(fields)
+        return self._modify(key, change)
+
+    def delete(self, key):
+        deleted = self._client.delete(self._key(key))
+        if deleted:
+            self._changed()
+        return bool(deleted)
+
+    def version(self, key):
+        return int(self._client.hget(self._key(key), "version") or 0)
+
+    def keys(self):
+        prefix = f"{self.namespace}:"
+        return [name.decode('utf-8')[len(prefix):] if isinstance(name, bytes) else name[len(prefix):]
+                for name in self._client.scan_iter(match=f"{prefix}*")]
+
+    def purge_expired(self):
+        # Сроки жизни соблюдает сам Redis
+        return 0
+
+
+def create_task_store(url: str, namespace: str, default_ttl: Optional[float] = None) -> TaskStore:
+    """
+    Хранилище задач по адресу
+
+    Args:
+        url: 'memory://', 'sqlite:///путь/к/файлу.db' или 'redis://хост:порт/номер_базы'
+        namespace: пространство имен записей (например, 'task' или 'session')
+        default_ttl: срок жизни записей в секундах (None - бессрочно)
+    """
+    if url.startswith('memory://'):
+        return MemoryTaskStore(namespace, default_ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteTaskStore(url[len('sqlite:///'):], namespace, default_ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisTaskStore(url, namespace, default_ttl)
+    raise ValueError(f"Неизвестный адрес хранилища задач: {url}")
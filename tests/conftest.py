@@ -0,0 +1,41 @@
+"""
+Общие настройки тестов
+
+Тесты запускаются из корня репозитория (python -m pytest); модули
+приложения лежат в корне, поэтому он добавляется в sys.path.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Зависимости веб-приложения (app.py)
+APP_DEPENDENCIES = ('flask', 'yt_dlp', 'docx', 'magic', 'langdetect', 'pydub', 'requests')
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """
+    Модуль app.py с каталогом загрузок во временной папке и хранилищами в памяти
+
+    Настройки читаются из окружения при импорте config.py, поэтому окружение
+    задается до первого импорта. Без зависимостей веб-приложения тест пропускается.
+    """
+    for name in APP_DEPENDENCIES:
+        pytest.importorskip(name)
+
+    upload_folder = tmp_path_factory.mktemp('uploads')
+    os.environ.update({
+        'UPLOAD_FOLDER': str(upload_folder),
+        'TASK_STORE_URL': 'memory://',
+        'JOB_RUNNER': 'thread',
+        'TRANSCRIPT_CACHE': 'true',
+        'TRANSCRIPT_CACHE_DIR': str(upload_folder / '.cache'),
+    })
+    import app
+    app.app.config['TESTING'] = True
+    return app
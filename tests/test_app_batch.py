@@ -0,0 +1,213 @@
+import io
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def started_jobs(app_module, monkeypatch):
+    """Фоновые задачи не запускаются, а записываются"""
+    jobs = []
+    monkeypatch.setattr(app_module, 'start_job', lambda name, *args: jobs.append((name, args)))
+    return jobs
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def read_jsonl(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_create_batch_from_json(app_module, client, started_jobs):
+    response = client.post('/batch', json={
+        'items': ['https://youtu.be/a', {'url': 'https://youtu.be/b', 'language': 'en-US'}],
+        'language': 'ru-RU',
+        'timestamps': True
+    })
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [item['name'] for item in data['items']] == ['https://youtu.be/a', 'https://youtu.be/b']
+    assert data['results_url'] == f"/batch/{data['batch_id']}/results"
+    assert started_jobs == [('process_batch', (data['batch_id'],))]
+
+    batch = app_module.batches[data['batch_id']]
+    assert batch['timestamps'] is True
+    assert [item['language'] for item in batch['items']] == ['ru-RU', 'en-US']
+    assert all(app_module.task_status[item['task_id']]['status'] == 'preparing' for item in batch['items'])
+
+
+def test_create_batch_from_form(app_module, client, started_jobs):
+    response = client.post('/batch', data={
+        'files': [(io.BytesIO(b'RIFF'), 'first.wav'), (io.BytesIO(b'ID3'), 'second.mp3')],
+        'urls': 'https://youtu.be/a\n\n  https://youtu.be/b  \n',
+        'timestamps': 'true'
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    batch = app_module.batches[response.get_json()['batch_id']]
+    assert [(item['source'], item['name']) for item in batch['items']] == [
+        ('file', 'first.wav'), ('file', 'second.mp3'),
+        ('url', 'https://youtu.be/a'), ('url', 'https://youtu.be/b')
+    ]
+    with open(batch['items'][0]['path'], 'rb') as file:
+        assert file.read() == b'RIFF'
+
+
+@pytest.mark.parametrize('payload, error', [
+    ({'items': []}, 'не содержит'),
+    ({'items': [{'language': 'ru-RU'}]}, 'url'),
+    ({'items': [42]}, 'url'),
+])
+def test_create_batch_rejects_invalid_json(client, started_jobs, payload, error):
+    response = client.post('/batch', json=payload)
+
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+    assert started_jobs == []
+
+
+def test_create_batch_rejects_unsupported_file(client, started_jobs):
+    response = client.post('/batch', data={'files': [(io.BytesIO(b'MZ'), 'tool.exe')]},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert started_jobs == []
+
+
+def test_create_batch_limits_item_count(app_module, client, started_jobs, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BATCH_MAX_ITEMS', 2)
+
+    response = client.post('/batch', json={'items': ['https://youtu.be/a'] * 3})
+
+    assert response.status_code == 400
+    assert started_jobs == []
+
+
+def seed_batch(app_module, statuses):
+    """Пакет из ссылок с заданными статусами задач элементов; возвращает ID пакета"""
+    items = []
+    for index, status in enumerate(statuses):
+        task_id = f'task-{index}-{id(statuses)}'
+        items.append({'task_id': task_id, 'source': 'url', 'language': 'ru-RU',
+                      'url': f'https://youtu.be/{index}', 'name': f'https://youtu.be/{index}'})
+        if status is not None:
+            app_module.task_status[task_id] = status
+    batch_id = f'batch-{id(statuses)}'
+    app_module.batches[batch_id] = {'status': 'processing', 'created_at': 0, 'timestamps': False,
+                                    'items': items}
+    return batch_id
+
+
+def test_batch_results_jsonl(app_module, client):
+    batch_id = seed_batch(app_module, [
+        {'status': 'complete', 'percent': 100, 'transcript': 'привет', 'language': 'ru-RU',
+         'with_timestamps': False, 'share_url': '/share/s1', 'docx_path': 'a.docx', 'message': 'Готово'},
+        {'status': 'error', 'percent': 0, 'message': 'Ошибка: нет звука'},
+        {'status': 'transcribing', 'percent': 40, 'message': 'Распознавание'},
+        None,
+    ])
+
+    response = client.get(f'/batch/{batch_id}/results')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert f'batch_{batch_id}.jsonl' in response.headers['Content-Disposition']
+    lines = read_jsonl(response)
+    assert [line['name'] for line in lines] == [f'https://youtu.be/{i}' for i in range(4)]
+    assert [line['status'] for line in lines] == ['complete', 'error', 'transcribing', 'unknown']
+    assert lines[0]['transcript'] == 'привет'
+    assert lines[0]['share_url'] == '/share/s1'
+    assert lines[0]['error'] is None
+    assert lines[1]['error'] == 'Ошибка: нет звука'
+    assert lines[1]['transcript'] is None
+    assert 'привет' in response.get_data(as_text=True)
+
+
+def test_batch_status_counts(app_module, client):
+    batch_id = seed_batch(app_module, [{'status': 'complete'}, {'status': 'complete'}, {'status': 'error'}])
+
+    data = client.get(f'/batch/{batch_id}').get_json()
+
+    assert data['total'] == 3
+    assert data['counts'] == {'complete': 2, 'error': 1}
+    assert [item['status'] for item in data['items']] == ['complete', 'complete', 'error']
+
+
+def test_unknown_batch(client):
+    assert client.get('/batch/missing').status_code == 404
+    assert client.get('/batch/missing/results').status_code == 404
+
+
+def test_process_batch_submits_items_together(app_module, client, started_jobs, monkeypatch):
+    submitted = []
+
+    class FakeClient:
+        def submit_batch(self, items, enable_timestamps, service_url):
+            submitted.append([path for path, _ in items])
+            return [f'whisper-{index}' for index in range(len(items))]
+
+    def prepare(file_path, language_code, enable_timestamps, update_status, result_info):
+        if file_path.endswith('broken.wav'):
+            raise ValueError('файл поврежден')
+        return file_path, None, None, None
+
+    monkeypatch.setattr(app_module, 'get_client', FakeClient)
+    monkeypatch.setattr(app_module, 'prepare_transcription', prepare)
+    monkeypatch.setattr(app_module, 'wait_for_task',
+                        lambda task_id, *args: f'текст {task_id}')
+
+    response = client.post('/batch', data={
+        'files': [(io.BytesIO(b'RIFF'), 'first.wav'), (io.BytesIO(b'RIFF'), 'broken.wav'),
+                  (io.BytesIO(b'RIFF'), 'third.wav')]
+    }, content_type='multipart/form-data')
+    batch_id = response.get_json()['batch_id']
+    app_module.process_batch(batch_id)
+
+    assert len(submitted) == 1
+    assert [path.rsplit('_', 1)[-1] for path in submitted[0]] == ['first.wav', 'third.wav']
+    assert app_module.batches[batch_id]['status'] == 'complete'
+
+    lines = read_jsonl(client.get(f'/batch/{batch_id}/results'))
+    assert [line['status'] for line in lines] == ['complete', 'error', 'complete']
+    assert lines[0]['transcript'] == 'текст whisper-0'
+    assert lines[2]['transcript'] == 'текст whisper-1'
+    assert 'файл поврежден' in lines[1]['error']
+    # Исходные файлы пакета удаляются после обработки
+    assert not any(os.path.exists(item['path']) for item in app_module.batches[batch_id]['items'])
+
+
+def test_process_batch_waits_on_items_queued_before_submit_error(app_module, client, started_jobs, monkeypatch):
+    from whisper_client import BatchSubmitError
+
+    waited = []
+
+    class FakeClient:
+        def submit_batch(self, items, enable_timestamps, service_url):
+            raise BatchSubmitError('Ошибка сервера транскрипции: 500', ['whisper-0', None, 'whisper-2'])
+
+    def wait(task_id, *args):
+        waited.append(task_id)
+        return f'текст {task_id}'
+
+    monkeypatch.setattr(app_module, 'get_client', FakeClient)
+    monkeypatch.setattr(app_module, 'prepare_transcription',
+                        lambda file_path, *args: (file_path, None, None, None))
+    monkeypatch.setattr(app_module, 'wait_for_task', wait)
+
+    response = client.post('/batch', data={
+        'files': [(io.BytesIO(b'RIFF'), f'{name}.wav') for name in ('first', 'second', 'third')]
+    }, content_type='multipart/form-data')
+    batch_id = response.get_json()['batch_id']
+    app_module.process_batch(batch_id)
+
+    # Задачи, уже поставленные в очередь сервиса, ожидаются; ошибкой завершается только не принятая
+    assert sorted(waited) == ['whisper-0', 'whisper-2']
+    lines = read_jsonl(client.get(f'/batch/{batch_id}/results'))
+    assert [line['status'] for line in lines] == ['complete', 'error', 'complete']
+    assert lines[2]['transcript'] == 'текст whisper-2'
+    assert '500' in lines[1]['error']
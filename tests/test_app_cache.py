@@ -0,0 +1,75 @@
+import uuid
+
+MAIN_MODEL = 'main-model'
+
+
+def cache_key(app_module):
+    return app_module.TranscriptCache.make_key(uuid.uuid4().hex, model=MAIN_MODEL)
+
+
+def test_is_cacheable_result(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'WHISPER_MODEL_NAME', MAIN_MODEL)
+    cacheable = app_module.is_cacheable_result
+
+    assert cacheable('текст', {'model': MAIN_MODEL})
+    # Сервис не сообщил модель - считается основной
+    assert cacheable('текст', {})
+    assert cacheable([{'text': 'текст'}], None)
+    assert not cacheable('текст', {'model': 'fast-model'})
+    assert not cacheable('текст', {'model': f'fast-model, {MAIN_MODEL}'})
+    assert not cacheable('Ошибка: сервис недоступен', {'model': MAIN_MODEL})
+    assert not cacheable('', {})
+    assert not cacheable([], {})
+
+
+def test_finish_transcription_caches_main_model_only(app_module, monkeypatch, tmp_path):
+    monkeypatch.setitem(app_module.app.config, 'WHISPER_MODEL_NAME', MAIN_MODEL)
+    audio = tmp_path / 'audio.wav'
+    audio.write_bytes(b'')
+
+    main_key = cache_key(app_module)
+    app_module.finish_transcription('текст', str(audio), str(audio), False, main_key,
+                                    {'model': MAIN_MODEL, 'language': 'ru'})
+    assert app_module.transcript_cache.get(main_key) == {'transcript': 'текст', 'language': 'ru'}
+
+    fast_key = cache_key(app_module)
+    app_module.finish_transcription('текст', str(audio), str(audio), False, fast_key,
+                                    {'model': 'fast-model', 'language': 'ru'})
+    assert app_module.transcript_cache.get(fast_key) is None
+
+
+def test_finish_transcription_removes_prepared_file(app_module, tmp_path):
+    source = tmp_path / 'audio.mp3'
+    prepared = tmp_path / 'audio.wav'
+    source.write_bytes(b'')
+    prepared.write_bytes(b'')
+
+    app_module.finish_transcription('Ошибка: сбой', str(source), str(prepared), False, None, {})
+
+    assert source.exists()
+    assert not prepared.exists()
+
+
+def test_chunked_result_reports_every_model(app_module, monkeypatch, tmp_path):
+    monkeypatch.setitem(app_module.app.config, 'WHISPER_MODEL_NAME', MAIN_MODEL)
+    monkeypatch.setitem(app_module.app.config, 'WHISPER_SERVICE_URLS', ['http://a:5001', 'http://b:5001'])
+    models = {'http://a:5001': MAIN_MODEL, 'http://b:5001': 'fast-model'}
+
+    def transcribe(chunk_path, language_code, enable_timestamps, status_callback=None,
+                   segment_callback=None, service_url=None, result_info=None):
+        result_info.update(model=models[service_url], language='ru')
+        return [{'text': 'слово', 'start': 0.0, 'end': 1.0, 'start_time': '00:00'}]
+
+    monkeypatch.setattr(app_module, 'transcribe_with_whisper_api', transcribe)
+    chunks = []
+    for index, bounds in enumerate([(0, 0, 60000), (55000, 60000, 120000)]):
+        path = tmp_path / f'part{index}.wav'
+        path.write_bytes(b'')
+        chunks.append((str(path), bounds))
+    result_info = {}
+
+    transcript = app_module.transcribe_chunks(chunks, 'ru-RU', False, result_info=result_info)
+
+    assert result_info == {'model': f'fast-model, {MAIN_MODEL}', 'language': 'ru'}
+    # Часть записи распознана быстрой моделью - результат не кэшируется
+    assert not app_module.is_cacheable_result(transcript, result_info)
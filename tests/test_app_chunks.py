@@ -0,0 +1,196 @@
+import os
+import threading
+
+import pytest
+
+
+def segment(start, text, speaker=None):
+    """Сегмент ответа сервиса с таймкодом от начала фрагмента (секунды)"""
+    minutes, seconds = divmod(int(start), 60)
+    result = {'text': text, 'start': float(start), 'end': float(start) + 1.0,
+              'start_time': f'{minutes:02d}:{seconds:02d}'}
+    if speaker:
+        result['speaker'] = speaker
+    return result
+
+
+def texts(segments):
+    return [s['text'] for s in segments]
+
+
+def test_trim_repeated_words(app_module):
+    trim = app_module.trim_repeated_words
+
+    assert trim('и вот мы пришли', 'мы пришли домой') == 'домой'
+    assert trim('И вот мы пришли.', 'Мы, пришли домой') == 'домой'
+    assert trim('вот мы пришли', 'вот мы пришли') == ''
+    # Одно совпавшее слово - скорее совпадение, чем повтор
+    assert trim('скажи да', 'да конечно') == 'да конечно'
+    assert trim('', 'текст') == 'текст'
+    assert trim('один два три', 'четыре пять') == 'четыре пять'
+
+
+def test_match_chunk_speakers_follows_overlap(app_module):
+    merged = [segment(296, 'это начало', 'Говорящий 1'), segment(298, 'и вот мы', 'Говорящий 2')]
+    # Фрагмент начинается с 295 с, его собственная часть - с 300 с; номера говорящих в нем перепутаны
+    chunk = [segment(1, 'начало', 'Говорящий 2'), segment(3, 'и вот мы', 'Говорящий 1'),
+             segment(6, 'дальше', 'Говорящий 1')]
+
+    mapping = app_module.match_chunk_speakers(merged, chunk, 295, 300000)
+
+    assert mapping == {'Говорящий 2': 'Говорящий 1', 'Говорящий 1': 'Говорящий 2'}
+
+
+def test_match_chunk_speakers_swaps_unmatched_label(app_module):
+    merged = [segment(298, 'вопрос', 'Говорящий 1')]
+    chunk = [segment(3, 'вопрос', 'Говорящий 2'), segment(7, 'ответ', 'Говорящий 1')]
+
+    mapping = app_module.match_chunk_speakers(merged, chunk, 295, 300000)
+
+    assert mapping == {'Говорящий 2': 'Говорящий 1', 'Говорящий 1': 'Говорящий 2'}
+
+
+def test_match_chunk_speakers_keeps_new_labels(app_module):
+    merged = [segment(298, 'вопрос', 'Говорящий 1')]
+    chunk = [segment(3, 'вопрос', 'Говорящий 1'), segment(7, 'ответ', 'Говорящий 3')]
+
+    mapping = app_module.match_chunk_speakers(merged, chunk, 295, 300000)
+
+    assert mapping == {'Говорящий 1': 'Говорящий 1', 'Говорящий 3': 'Говорящий 3'}
+
+
+def test_merge_chunk_transcripts(app_module):
+    first = [
+        segment(0, 'привет всем', 'Говорящий 1'),
+        segment(296, 'это начало', 'Говорящий 1'),
+        segment(298, 'и вот мы пришли', 'Говорящий 2'),
+        segment(302, 'домой', 'Говорящий 2'),  # за собственной частью первого фрагмента
+    ]
+    second = [
+        segment(1, 'начало', 'Говорящий 2'),  # в перекрытии, принадлежит первому фрагменту
+        segment(3, 'вот мы пришли', 'Говорящий 1'),
+        segment(5, 'мы пришли домой', 'Говорящий 1'),
+        segment(8, 'и сели', 'Говорящий 2'),
+    ]
+
+    merged = app_module.merge_chunk_transcripts(
+        [first, second], [(0, 0, 300000), (295000, 300000, 600000)]
+    )
+
+    assert texts(merged) == ['привет всем', 'это начало', 'и вот мы пришли', 'домой', 'и сели']
+    assert [s['start_time'] for s in merged] == ['00:00', '04:56', '04:58', '05:00', '05:03']
+    assert [s['speaker'] for s in merged] == ['Говорящий 1', 'Говорящий 1', 'Говорящий 2',
+                                              'Говорящий 2', 'Говорящий 1']
+
+
+def test_merge_chunk_transcripts_drops_repeated_segment(app_module):
+    merged = app_module.merge_chunk_transcripts(
+        [[segment(0, 'раз'), segment(59, 'два три')], [segment(5, 'два три'), segment(8, 'четыре')]],
+        [(0, 0, 60000), (55000, 60000, 120000)]
+    )
+
+    assert texts(merged) == ['раз', 'два три', 'четыре']
+
+
+def test_use_parallel_transcription(app_module, monkeypatch):
+    from pydub import AudioSegment
+
+    config = app_module.app.config
+    monkeypatch.setitem(config, 'PARALLEL_MIN_DURATION', 1)
+    long_audio = AudioSegment.silent(duration=2000, frame_rate=16000)
+    short_audio = AudioSegment.silent(duration=500, frame_rate=16000)
+
+    monkeypatch.setitem(config, 'WHISPER_SERVICE_URLS', ['http://a:5001'])
+    assert not app_module.use_parallel_transcription(long_audio)
+
+    monkeypatch.setitem(config, 'WHISPER_SERVICE_URLS', ['http://a:5001', 'http://b:5001'])
+    assert app_module.use_parallel_transcription(long_audio)
+    assert not app_module.use_parallel_transcription(short_audio)
+    assert not app_module.use_parallel_transcription(None)
+
+
+@pytest.fixture
+def fake_service(app_module, monkeypatch):
+    """
+    Замена transcribe_with_whisper_api: ответы по имени файла фрагмента
+
+    responses[имя] - список сегментов или строка с ошибкой; models[url] - модель,
+    о которой сообщает реплика. Вызовы сохраняются в calls.
+    """
+    monkeypatch.setitem(app_module.app.config, 'WHISPER_SERVICE_URLS', ['http://a:5001', 'http://b:5001'])
+    service = type('FakeService', (), {})()
+    service.responses = {}
+    service.models = {'http://a:5001': 'main', 'http://b:5001': 'main'}
+    service.calls = []
+    lock = threading.Lock()
+
+    def transcribe(chunk_path, language_code, enable_timestamps, status_callback=None,
+                   segment_callback=None, service_url=None, result_info=None):
+        name = os.path.basename(chunk_path)
+        with lock:
+            service.calls.append((name, service_url))
+        response = service.responses[name]
+        if isinstance(response, dict):
+            response = response.get(service_url, response.get('default'))
+        result_info['model'] = service.models[service_url]
+        if segment_callback and isinstance(response, list):
+            segment_callback(response)
+        return response
+
+    monkeypatch.setattr(app_module, 'transcribe_with_whisper_api', transcribe)
+    return service
+
+
+def chunk_files(tmp_path, bounds):
+    chunks = []
+    for index, chunk_bounds in enumerate(bounds):
+        path = tmp_path / f'part{index}.wav'
+        path.write_bytes(b'')
+        chunks.append((str(path), chunk_bounds))
+    return chunks
+
+
+def test_transcribe_chunks_merges_in_order(app_module, fake_service, tmp_path):
+    fake_service.responses = {
+        'part0.wav': [segment(0, 'раз'), segment(59, 'два три')],
+        'part1.wav': [segment(5, 'два три'), segment(8, 'четыре')],
+        'part2.wav': [segment(6, 'пять')],
+    }
+    chunks = chunk_files(tmp_path, [(0, 0, 60000), (55000, 60000, 120000), (115000, 120000, 150000)])
+    emitted = []
+    result_info = {}
+
+    transcript = app_module.transcribe_chunks(chunks, 'ru-RU', True, segment_callback=emitted.append,
+                                              result_info=result_info, expected_total=3)
+
+    assert texts(transcript) == ['раз', 'два три', 'четыре', 'пять']
+    # Промежуточные сегменты - по порядку фрагментов, только из собственных частей
+    assert [texts(batch) for batch in emitted] == [['раз', 'два три'], ['два три', 'четыре'], ['пять']]
+    assert [s['start'] for batch in emitted for s in batch] == [0.0, 59.0, 60.0, 63.0, 121.0]
+    assert result_info['model'] == 'main'
+    assert not any(os.path.exists(path) for path, _ in chunks)
+
+    text = app_module.transcribe_chunks(chunk_files(tmp_path, [b for _, b in chunks]), 'ru-RU', False)
+    assert text == 'раз два три четыре пять'
+
+
+def test_transcribe_chunks_retries_failed_chunk_on_other_replica(app_module, fake_service, tmp_path):
+    fake_service.responses = {
+        'part0.wav': [segment(0, 'раз')],
+        'part1.wav': {'http://b:5001': 'Ошибка: реплика недоступна', 'http://a:5001': [segment(6, 'два')]},
+    }
+    chunks = chunk_files(tmp_path, [(0, 0, 60000), (55000, 60000, 120000)])
+
+    transcript = app_module.transcribe_chunks(chunks, 'ru-RU', True)
+
+    assert texts(transcript) == ['раз', 'два']
+    assert sorted(fake_service.calls) == [('part0.wav', 'http://a:5001'), ('part1.wav', 'http://a:5001'),
+                                          ('part1.wav', 'http://b:5001')]
+
+
+def test_transcribe_chunks_returns_error(app_module, fake_service, tmp_path):
+    fake_service.responses = {'part0.wav': [segment(0, 'раз')], 'part1.wav': 'Ошибка: сбой'}
+    chunks = chunk_files(tmp_path, [(0, 0, 60000), (55000, 60000, 120000)])
+
+    assert app_module.transcribe_chunks(chunks, 'ru-RU', True) == 'Ошибка: сбой'
+
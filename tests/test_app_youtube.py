@@ -0,0 +1,358 @@
+import io
+import json
+import os
+import threading
+import uuid
+import wave
+
+import numpy as np
+import pytest
+
+RATE = 16000
+PERIOD_MS = 8500  # 7 с тона и 1.5 с тишины
+TONE_MS = 7000
+
+
+def speech_pcm(periods=16, pauses=True):
+    """
+    16-битный PCM: чередование 7 с тона и 1.5 с тишины (pauses=False - без пауз)
+
+    Частота тона у каждого периода своя, поэтому по отсчетам фрагмента
+    можно найти его место в записи.
+    """
+    t = np.arange(PERIOD_MS * RATE // 1000) / RATE
+    parts = []
+    for period in range(periods):
+        tone = 0.5 * 32767 * np.sin(2 * np.pi * (300 + 25 * period) * t)
+        if pauses:
+            tone[TONE_MS * RATE // 1000:] = 0
+        parts.append(tone.astype('<i2'))
+    return np.concatenate(parts).tobytes()
+
+
+class FakeFFmpeg:
+    """Процесс ffmpeg, отдающий заранее заданный PCM; сохраняет запущенные команды"""
+
+    def __init__(self, pcm=b'', returncode=0, stderr=b''):
+        self.pcm = pcm
+        self.returncode_on_exit = returncode
+        self.stderr = stderr
+        self.commands = []
+        self.processes = []
+
+    def __call__(self, cmd, stdout=None, stderr=None):
+        fake = self
+
+        class Process:
+            def __init__(self):
+                self.stdout = io.BytesIO(fake.pcm)
+                self.returncode = None
+                self.killed = False
+                stderr.write(fake.stderr)
+                stderr.flush()
+
+            def poll(self):
+                if self.returncode is None and self.stdout.tell() >= len(fake.pcm):
+                    self.returncode = fake.returncode_on_exit
+                return self.returncode
+
+            def wait(self):
+                if self.returncode is None:
+                    self.returncode = -9 if self.killed else fake.returncode_on_exit
+                return self.returncode
+
+            def kill(self):
+                self.killed = True
+
+        self.commands.append(cmd)
+        self.processes.append(Process())
+        return self.processes[-1]
+
+
+@pytest.fixture
+def pipeline_config(app_module, monkeypatch):
+    # Длина фрагмента кратна периоду сигнала: в окне поиска (±10%) всегда есть пауза
+    monkeypatch.setitem(app_module.app.config, 'YOUTUBE_PIPELINE_CHUNK_SECONDS', 34)
+    monkeypatch.setitem(app_module.app.config, 'PARALLEL_CHUNK_OVERLAP_MS', 2000)
+    return app_module.app.config
+
+
+def video_info(protocol='https', headers=None):
+    return {'audio_url': 'https://example.com/audio.webm', 'protocol': protocol,
+            'http_headers': headers or {}, 'title': 'Видео', 'uploader': 'Автор', 'duration': 102,
+            'description': '', 'upload_date': '20260101'}
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wav:
+        assert (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (RATE, 1, 2)
+        return wav.readframes(wav.getnframes())
+
+
+def test_stream_audio_chunks_cuts_in_pauses(app_module, pipeline_config, monkeypatch, tmp_path):
+    pcm = speech_pcm()
+    ffmpeg = FakeFFmpeg(pcm)
+    monkeypatch.setattr(app_module.subprocess, 'Popen', ffmpeg)
+    bytes_per_ms = RATE * 2 // 1000
+    total_ms = len(pcm) // bytes_per_ms
+
+    chunks = []
+    for path, bounds in app_module.stream_audio_chunks(video_info(), str(tmp_path)):
+        # Фрагмент уже записан, когда его отдают вызывающему
+        chunks.append((bounds, read_wav(path)))
+
+    own = [(own_start, own_end) for (_, own_start, own_end), _ in chunks]
+    assert own[0][0] == 0
+    assert own[-1][1] == total_ms
+    assert all(previous[1] == current[0] for previous, current in zip(own, own[1:]))
+    for own_start, own_end in own[:-1]:
+        # Граница - в паузе, длина фрагмента - в пределах ±10% от 34 с
+        assert own_end % PERIOD_MS >= TONE_MS
+        assert 30600 <= own_end - own_start <= 37400
+
+    for (file_start, own_start, own_end), data in chunks:
+        assert file_start == max(own_start - 2000, 0)
+        file_end = min(own_end + 2000, total_ms)
+        assert data == pcm[file_start * bytes_per_ms:file_end * bytes_per_ms]
+
+
+def test_stream_audio_chunks_without_pauses(app_module, pipeline_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module.subprocess, 'Popen', FakeFFmpeg(speech_pcm(pauses=False)))
+
+    bounds = [chunk_bounds for _, chunk_bounds in app_module.stream_audio_chunks(video_info(), str(tmp_path))]
+
+    # Паузы нет - фрагмент режется ровно по заданной длине
+    assert [own_end for _, _, own_end in bounds] == [34000, 68000, 102000, 136000]
+
+
+def test_stream_audio_chunks_ffmpeg_command(app_module, pipeline_config, monkeypatch, tmp_path):
+    ffmpeg = FakeFFmpeg(speech_pcm(1))
+    monkeypatch.setattr(app_module.subprocess, 'Popen', ffmpeg)
+
+    list(app_module.stream_audio_chunks(video_info(headers={'User-Agent': 'test', 'Cookie': 'a=1'}),
+                                        str(tmp_path)))
+    list(app_module.stream_audio_chunks(video_info(protocol='m3u8_native'), str(tmp_path)))
+
+    https_cmd, hls_cmd = ffmpeg.commands
+    assert https_cmd[https_cmd.index('-headers') + 1] == 'User-Agent: test\r\nCookie: a=1\r\n'
+    assert '-reconnect' in https_cmd
+    assert '-headers' not in hls_cmd and '-reconnect' not in hls_cmd
+    assert https_cmd[https_cmd.index('-i') + 1] == 'https://example.com/audio.webm'
+    assert https_cmd[-9:] == ['-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', '16000', 'pipe:1']
+
+
+def test_stream_audio_chunks_reports_ffmpeg_error(app_module, pipeline_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module.subprocess, 'Popen',
+                        FakeFFmpeg(b'', returncode=1, stderr=b'HTTP error 403 Forbidden'))
+
+    with pytest.raises(Exception, match='403 Forbidden'):
+        list(app_module.stream_audio_chunks(video_info(), str(tmp_path)))
+
+
+def test_stream_audio_chunks_requires_audio(app_module, pipeline_config, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module.subprocess, 'Popen', FakeFFmpeg(b''))
+
+    with pytest.raises(Exception, match='Не удалось получить аудио'):
+        list(app_module.stream_audio_chunks(video_info(), str(tmp_path)))
+
+
+def test_stream_audio_chunks_kills_ffmpeg_when_closed(app_module, pipeline_config, monkeypatch, tmp_path):
+    ffmpeg = FakeFFmpeg(speech_pcm())
+    monkeypatch.setattr(app_module.subprocess, 'Popen', ffmpeg)
+
+    chunks = app_module.stream_audio_chunks(video_info(), str(tmp_path))
+    next(chunks)
+    chunks.close()
+
+    assert ffmpeg.processes[0].killed
+    assert ffmpeg.processes[0].stdout.closed
+
+
+@pytest.fixture
+def fake_whisper(app_module, monkeypatch):
+    """
+    Распознавание фрагмента: по сегменту на каждую целую секунду записи, текст - ее номер
+
+    Место фрагмента в записи находится по его отсчетам в speech_pcm(), поэтому
+    по склеенному тексту видно пропуски и повторы на стыках.
+    """
+    pcm = speech_pcm()
+    monkeypatch.setitem(app_module.app.config, 'WHISPER_SERVICE_URLS', ['http://a:5001', 'http://b:5001'])
+    calls = []
+
+    def transcribe(chunk_path, language_code, enable_timestamps, status_callback=None,
+                   segment_callback=None, service_url=None, result_info=None):
+        calls.append(chunk_path)
+        result_info.update(model=app_module.app.config['WHISPER_MODEL_NAME'], language='ru')
+        data = read_wav(chunk_path)
+        offset = pcm.find(data) / (RATE * 2)
+        end = offset + len(data) / (RATE * 2)
+        segments = []
+        for second in range(int(np.ceil(offset)), int(np.ceil(end))):
+            start = second - offset
+            segments.append({'text': f'слово{second}', 'start': start, 'end': start + 1.0,
+                             'start_time': f'{int(start) // 60:02d}:{int(start) % 60:02d}'})
+        return segments
+
+    monkeypatch.setattr(app_module, 'transcribe_with_whisper_api', transcribe)
+    return calls
+
+
+def test_transcribe_video_pipelined(app_module, pipeline_config, fake_whisper, monkeypatch):
+    monkeypatch.setattr(app_module.subprocess, 'Popen', FakeFFmpeg(speech_pcm()))
+    monkeypatch.setattr(app_module, 'extract_video_info', lambda url: video_info())
+    result_info = {}
+
+    transcript, info = app_module.transcribe_video_pipelined('https://youtu.be/x', 'ru-RU', False,
+                                                             result_info=result_info)
+
+    # Слова с номерами секунд записи: каждое ровно один раз, по порядку
+    words = [int(word[len('слово'):]) for word in transcript.split()]
+    assert len(fake_whisper) > 1
+    assert words == list(range(136))
+    assert info['title'] == 'Видео'
+    assert result_info['language'] == 'ru'
+    # Временный каталог фрагментов удален
+    upload_folder = app_module.app.config['UPLOAD_FOLDER']
+    assert not [name for name in os.listdir(upload_folder) if name.startswith('youtube_')]
+
+
+def test_transcribe_video_pipelined_rejects_unsupported_protocol(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'extract_video_info', lambda url: video_info(protocol='rtmp'))
+
+    with pytest.raises(Exception, match='rtmp'):
+        app_module.transcribe_video_pipelined('https://youtu.be/x', 'ru-RU', False)
+
+
+def test_pipelined_link_is_cached(app_module, pipeline_config, fake_whisper, monkeypatch):
+    url = f'https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}'
+    monkeypatch.setitem(app_module.app.config, 'YOUTUBE_PIPELINE', True)
+    monkeypatch.setattr(app_module.subprocess, 'Popen', FakeFFmpeg(speech_pcm(5)))
+    monkeypatch.setattr(app_module, 'extract_video_info', lambda url: video_info())
+    monkeypatch.setattr(app_module, 'download_from_youtube',
+                        lambda *args: pytest.fail('при потоковой загрузке файл целиком не скачивается'))
+
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    app_module.process_youtube_link(url, False, first)
+    calls = len(fake_whisper)
+    app_module.process_youtube_link(url, False, second)
+
+    assert calls > 0
+    assert len(fake_whisper) == calls
+    assert app_module.task_status[first]['status'] == 'complete'
+    assert app_module.task_status[second]['transcript'] == app_module.task_status[first]['transcript']
+    assert app_module.task_status[second]['video_info']['title'] == 'Видео'
+
+
+def test_pipeline_failure_falls_back_to_download(app_module, pipeline_config, monkeypatch, tmp_path):
+    url = f'https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}'
+    monkeypatch.setitem(app_module.app.config, 'YOUTUBE_PIPELINE', True)
+    monkeypatch.setattr(app_module.subprocess, 'Popen',
+                        FakeFFmpeg(b'', returncode=1, stderr=b'HTTP error 403 Forbidden'))
+    monkeypatch.setattr(app_module, 'extract_video_info', lambda url: video_info())
+    audio_path = tmp_path / 'audio.wav'
+    audio_path.write_bytes(b'')
+    monkeypatch.setattr(app_module, 'download_from_youtube',
+                        lambda *args: (str(audio_path), video_info()))
+    monkeypatch.setattr(app_module, 'transcribe_audio', lambda *args, **kwargs: 'текст после загрузки')
+    task_id = str(uuid.uuid4())
+
+    app_module.process_youtube_link(url, False, task_id)
+
+    status = app_module.task_status[task_id]
+    assert status['status'] == 'complete'
+    assert status['transcript'] == 'текст после загрузки'
+
+
+def test_extract_video_info_is_cached(app_module, monkeypatch):
+    video_id = uuid.uuid4().hex[:11]
+    created = []
+
+    class FakeYoutubeDL:
+        def __init__(self, options):
+            created.append(options)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def extract_info(self, url, download):
+            assert download is False
+            return {'title': 'Видео', 'url': 'https://example.com/audio.webm', 'protocol': 'https',
+                    'http_headers': {'User-Agent': 'test'}, 'duration': 60}
+
+    monkeypatch.setattr(app_module.yt_dlp, 'YoutubeDL', FakeYoutubeDL)
+
+    first = app_module.extract_video_info(f'https://www.youtube.com/watch?v={video_id}')
+    second = app_module.extract_video_info(f'https://youtu.be/{video_id}')
+
+    assert len(created) == 1
+    assert created[0]['quiet'] is True and created[0]['no_warnings'] is True
+    assert first == second
+    assert first['audio_url'] == 'https://example.com/audio.webm'
+    assert first['http_headers'] == {'User-Agent': 'test'}
+
+
+def read_events(response):
+    """События потока /task_events (словари состояния задачи), по мере поступления"""
+    buffer = ''
+    for chunk in response.iter_encoded():
+        buffer += chunk.decode('utf-8')
+        while '\n\n' in buffer:
+            event, buffer = buffer.split('\n\n', 1)
+            if event.startswith('data: '):
+                yield json.loads(event[len('data: '):])
+
+
+def test_fallback_segments_reach_task_events(app_module, pipeline_config, monkeypatch, tmp_path):
+    url = f'https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}'
+    monkeypatch.setitem(app_module.app.config, 'YOUTUBE_PIPELINE', True)
+    stale_seen, fresh_seen = threading.Event(), threading.Event()
+
+    def failing_pipeline(url, language_code, enable_timestamps, status_callback=None,
+                         segment_callback=None, result_info=None):
+        segment_callback([{'text': f'старый{i}', 'start_time': f'00:0{i}'} for i in range(3)])
+        assert stale_seen.wait(5)
+        raise Exception('HTTP error 403 Forbidden')
+
+    def fallback_transcription(*args, segment_callback=None, **kwargs):
+        for i in range(4):
+            segment_callback([{'text': f'новый{i}', 'start_time': f'00:0{i}'}])
+        fresh_seen.wait(5)
+        return 'текст после загрузки'
+
+    audio_path = tmp_path / 'audio.wav'
+    audio_path.write_bytes(b'')
+    monkeypatch.setattr(app_module, 'transcribe_video_pipelined', failing_pipeline)
+    monkeypatch.setattr(app_module, 'download_from_youtube', lambda *args: (str(audio_path), video_info()))
+    monkeypatch.setattr(app_module, 'transcribe_audio', fallback_transcription)
+
+    task_id = str(uuid.uuid4())
+    app_module.task_status[task_id] = {'status': 'preparing', 'percent': 0, 'message': '', 'partial': []}
+    worker = threading.Thread(target=app_module.process_youtube_link, args=(url, False, task_id))
+    worker.start()
+
+    # Обработка событий как в showPartial (static/js/script.js)
+    lines, count, epoch = [], 0, 0
+    response = app_module.app.test_client().get(f'/task_events/{task_id}', buffered=False)
+    for status in read_events(response):
+        if status.get('partial_epoch', 0) != epoch:
+            epoch, count, lines = status.get('partial_epoch', 0), 0, []
+        offset = status['partial_offset']
+        lines += [segment['text'] for segment in status['partial'][max(count - offset, 0):]]
+        count = max(count, offset + len(status['partial']))
+        if len(lines) == 3 and lines[0] == 'старый0':
+            stale_seen.set()
+        if lines == [f'новый{i}' for i in range(4)]:
+            fresh_seen.set()
+        if status['status'] in ('complete', 'error'):
+            break
+    response.close()
+    worker.join(10)
+
+    assert stale_seen.is_set()
+    # Все сегменты повторной попытки доставлены, сегменты неудавшейся - убраны
+    assert fresh_seen.is_set()
+    assert app_module.task_status[task_id]['status'] == 'complete'
@@ -0,0 +1,205 @@
+import numpy as np
+import pytest
+
+from audio_vad import Timeline, compact_regions, detect_speech_regions, frame_energy_db
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=0.5, frequency=440.0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def noise(seconds, amplitude=0.001, seed=0):
+    rng = np.random.default_rng(seed)
+    return (amplitude * rng.standard_normal(int(seconds * RATE))).astype(np.float32)
+
+
+def test_frame_energy_db_levels():
+    energy = frame_energy_db(np.concatenate([tone(0.3, amplitude=1.0), np.zeros(RATE // 10, np.float32)]))
+
+    assert len(energy) == 13
+    # Синус с амплитудой 1: средний квадрат 0.5, около -3 дБ
+    assert np.allclose(energy[:10], -3.0, atol=0.1)
+    assert np.all(energy[10:] < -90)
+
+
+def test_frame_energy_db_scales_integer_pcm():
+    samples = tone(0.3, amplitude=0.5)
+    pcm = (samples * 32767).astype(np.int16)
+
+    assert np.allclose(frame_energy_db(pcm), frame_energy_db(samples), atol=0.01)
+
+
+def test_frame_energy_db_blocks_match_whole():
+    samples = np.concatenate([noise(1.0, 0.1), tone(1.0)])
+
+    assert np.allclose(frame_energy_db(samples, block_frames=7), frame_energy_db(samples))
+
+
+def test_speech_regions_with_padding():
+    samples = np.concatenate([noise(1.0), tone(1.0) + noise(1.0, seed=1), noise(1.0, seed=2)])
+
+    regions = detect_speech_regions(samples)
+
+    assert len(regions) == 1
+    start, end = regions[0]
+    # Граница области - начало кадра с речью за вычетом запаса 0.2 с
+    assert abs(start - int(0.8 * RATE)) <= int(0.03 * RATE)
+    assert abs(end - int(2.2 * RATE)) <= int(0.03 * RATE)
+
+
+def test_short_pauses_are_filled():
+    samples = np.concatenate([noise(1.0), tone(1.0), noise(0.3, seed=1), tone(1.0), noise(1.0, seed=2)])
+
+    assert len(detect_speech_regions(samples, padding=0.0)) == 1
+
+
+def test_long_pauses_split_regions():
+    samples = np.concatenate([noise(1.0), tone(1.0), noise(2.0, seed=1), tone(1.0), noise(1.0, seed=2)])
+
+    regions = detect_speech_regions(samples)
+
+    assert len(regions) == 2
+    assert regions[0][1] < regions[1][0]
+
+
+def test_short_bursts_are_dropped():
+    samples = np.concatenate([noise(1.0), tone(0.1), noise(1.0, seed=1), tone(1.0), noise(1.0, seed=2)])
+
+    regions = detect_speech_regions(samples, padding=0.0)
+
+    assert len(regions) == 1
+    assert regions[0][0] > int(2.0 * RATE)
+
+
+def test_threshold_adapts_to_noise_floor():
+    # Громкий фон: -30 дБ был бы речью при фиксированном пороге -50 дБ
+    loud_noise = 0.03
+    samples = np.concatenate([noise(2.0, loud_noise), tone(1.0, 0.5) + noise(1.0, loud_noise, 1),
+                              noise(2.0, loud_noise, 2)])
+
+    assert len(detect_speech_regions(samples)) == 1
+    assert detect_speech_regions(samples, threshold_db=-60) == [(0, len(samples))]
+
+
+def test_quiet_recording_has_no_speech():
+    assert detect_speech_regions(np.zeros(3 * RATE, np.float32)) == []
+    assert detect_speech_regions(noise(3.0, 0.001)) == []
+    assert detect_speech_regions(np.zeros(10, np.float32)) == []
+
+
+def test_compact_regions_and_timeline():
+    samples = np.arange(100, dtype=np.float32)
+    regions = [(10, 30), (50, 60), (80, 100)]
+
+    compact, timeline = compact_regions(samples, regions, sample_rate=10)
+
+    assert np.array_equal(compact, np.concatenate([samples[10:30], samples[50:60], samples[80:100]]))
+    assert timeline.to_original(0.0) == 1.0
+    assert timeline.to_original(1.5) == 2.5
+    # Стык областей: начало сегмента - в следующей области, конец - в предыдущей
+    assert timeline.to_original(2.0) == 5.0
+    assert timeline.to_original(2.0, end=True) == 3.0
+    assert timeline.to_original(None) is None
+
+
+def test_timeline_remap_chunks():
+    timeline = Timeline([(16000, 32000), (64000, 80000)])
+
+    chunks = timeline.remap_chunks([{'text': 'один', 'timestamp': (0.5, 1.0)},
+                                    {'text': 'два', 'timestamp': (1.0, 1.5)}])
+
+    assert chunks == [{'text': 'один', 'timestamp': (1.5, 2.0)},
+                      {'text': 'два', 'timestamp': (4.0, 4.5)}]
+
+
+def audio_segment(samples, sample_width=2, channels=1, frame_rate=RATE):
+    """AudioSegment из отсчетов float в [-1, 1] (для стерео - массив (кадры, каналы))"""
+    from pydub import AudioSegment
+
+    max_value = (1 << (8 * sample_width - 1)) - 1
+    pcm = np.round(np.asarray(samples) * max_value).astype(np.int64).reshape(-1)
+    if sample_width == 3:
+        unsigned = pcm & 0xFFFFFF
+        data = np.stack([unsigned & 0xFF, (unsigned >> 8) & 0xFF, unsigned >> 16], axis=1).astype(np.uint8)
+        raw = data.tobytes()
+    else:
+        raw = pcm.astype({1: np.int8, 2: '<i2', 4: '<i4'}[sample_width]).tobytes()
+    return AudioSegment(data=raw, sample_width=sample_width, frame_rate=frame_rate, channels=channels)
+
+
+def speech_like(seed=0, rate=RATE):
+    """Чередование тона и тишины разной длины с тихим шумом"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _ in range(6):
+        loud = int(rng.uniform(0.2, 1.5) * rate)
+        quiet = int(rng.uniform(0.1, 1.5) * rate)
+        t = np.arange(loud) / rate
+        parts.append(rng.uniform(0.05, 0.8) * np.sin(2 * np.pi * rng.uniform(100, 1000) * t))
+        parts.append(rng.uniform(0, 0.002) * rng.standard_normal(quiet))
+    return np.clip(np.concatenate(parts), -1, 1)
+
+
+PYDUB_CASES = [
+    # (ширина отсчета, каналы, частота, min_silence_len, silence_thresh, seek_step)
+    (2, 1, RATE, 300, -40, 1),
+    (2, 1, RATE, 500, -30, 10),
+    (2, 2, 44100, 250, -35, 7),
+    (1, 1, 8000, 400, -30, 1),
+    (2, 1, 22050, 1000, -16, 3),
+    (2, 1, RATE, 100, -60, 50),
+]
+
+
+@pytest.mark.parametrize("width, channels, rate, min_silence_len, silence_thresh, seek_step", PYDUB_CASES)
+def test_detect_silence_matches_pydub(width, channels, rate, min_silence_len, silence_thresh, seek_step):
+    pytest.importorskip("pydub")
+    from pydub import silence
+
+    from audio_vad import detect_nonsilent, detect_silence
+
+    samples = speech_like(seed=min_silence_len, rate=rate)
+    if channels == 2:
+        samples = np.stack([samples, np.roll(samples, rate // 10)], axis=1)
+    segment = audio_segment(samples, width, channels, rate)
+    args = (min_silence_len, silence_thresh, seek_step)
+
+    assert detect_silence(segment, *args) == silence.detect_silence(segment, *args)
+    assert detect_nonsilent(segment, *args) == silence.detect_nonsilent(segment, *args)
+
+
+@pytest.mark.parametrize("width", [3, 4])
+def test_detect_silence_wide_samples(width):
+    pytest.importorskip("pydub")
+    from pydub import silence
+
+    from audio_vad import detect_silence
+
+    segment = audio_segment(speech_like(seed=width), width)
+
+    assert detect_silence(segment, 300, -40, 5) == silence.detect_silence(segment, 300, -40, 5)
+
+
+def test_detect_silence_edge_cases():
+    pytest.importorskip("pydub")
+    from pydub import silence
+
+    from audio_vad import detect_nonsilent, detect_silence
+
+    quiet = audio_segment(np.zeros(RATE))
+    loud = audio_segment(np.sin(np.arange(RATE) * 0.1) * 0.5)
+    short = audio_segment(np.zeros(RATE // 2))
+    # Длительность не кратна миллисекунде: последнее окно дополняется нулями
+    ragged = audio_segment(np.concatenate([np.sin(np.arange(RATE) * 0.1) * 0.5, np.zeros(RATE + 7)]))
+
+    for segment in (quiet, loud, short, ragged):
+        for args in ((1000, -16, 1), (300, -40, 7), (50, -50, 1)):
+            assert detect_silence(segment, *args) == silence.detect_silence(segment, *args)
+            assert detect_nonsilent(segment, *args) == silence.detect_nonsilent(segment, *args)
+
+    assert detect_silence(short, 1000) == []
+    assert detect_nonsilent(quiet, 300, -40) == []
+    assert detect_nonsilent(loud, 300, -40) == [[0, 1000]]
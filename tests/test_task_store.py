@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+from task_store import (MemoryTaskStore, RedisTaskStore, SQLiteTaskStore,
+                        create_task_store)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def make_store(request, tmp_path):
+    """Фабрика хранилищ одного бэкенда: make_store(namespace, ttl)"""
+    if request.param == "memory":
+        return lambda namespace="task", ttl=None: MemoryTaskStore(namespace, ttl)
+    if request.param == "sqlite":
+        path = str(tmp_path / "tasks.db")
+        return lambda namespace="task", ttl=None: SQLiteTaskStore(path, namespace, ttl)
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    return lambda namespace="task", ttl=None: RedisTaskStore("redis://", namespace, ttl, client=client)
+
+
+@pytest.fixture
+def store(make_store):
+    return make_store()
+
+
+def test_set_get_and_versions(store):
+    assert store.get("a") is None
+    assert store.get("a", {}) == {}
+    assert store.version("a") == 0
+    assert "a" not in store
+
+    store.set("a", {"status": "queued", "text": "привет"})
+    assert store.get("a") == {"status": "queued", "text": "привет"}
+    assert store.version("a") == 1
+    assert "a" in store
+
+    store["a"] = {"status": "processing"}
+    assert store["a"] == {"status": "processing"}
+    assert store.version("a") == 2
+
+
+def test_update_merges_fields(store):
+    assert store.update("missing", status="done") is None
+    assert "missing" not in store
+
+    store.set("a", {"status": "queued", "progress": 0})
+    assert store.update("a", progress=50) == {"status": "queued", "progress": 50}
+    assert store.get("a") == {"status": "queued", "progress": 50}
+    assert store.version("a") == 2
+
+
+def test_append_extends_list(store):
+    assert store.append("missing", "segments", [1]) is None
+
+    store.set("a", {"status": "processing"})
+    store.append("a", "segments", [{"text": "один"}])
+    value = store.append("a", "segments", [{"text": "два"}], progress=80)
+
+    assert value == store.get("a")
+    assert [s["text"] for s in value["segments"]] == ["один", "два"]
+    assert value["progress"] == 80
+
+
+def test_returned_value_is_a_copy(store):
+    store.set("a", {"items": []})
+    store.get("a")["items"].append(1)
+    assert store.get("a") == {"items": []}
+
+
+def test_delete(store):
+    store.set("a", {"x": 1})
+    assert store.delete("a") is True
+    assert store.delete("a") is False
+    assert store.get("a") is None
+    with pytest.raises(KeyError):
+        del store["a"]
+    with pytest.raises(KeyError):
+        store["a"]
+
+
+def test_keys_items_and_len(store):
+    store.set("a", {"x": 1})
+    store.set("b", {"x": 2})
+    assert sorted(store.keys()) == ["a", "b"]
+    assert dict(store.items()) == {"a": {"x": 1}, "b": {"x": 2}}
+    assert len(store) == 2
+
+
+def test_namespaces_are_separate(make_store):
+    tasks = make_store("task")
+    sessions = make_store("session")
+    tasks.set("a", {"kind": "task"})
+
+    assert sessions.get("a") is None
+    assert sessions.keys() == []
+    sessions.set("a", {"kind": "session"})
+    assert tasks.get("a") == {"kind": "task"}
+
+
+def test_expired_entries_are_absent(make_store):
+    store = make_store(ttl=0.05)
+    store.set("short", {"x": 1})
+    store.set("long", {"x": 2}, ttl=60)
+    time.sleep(0.2)
+
+    assert store.get("short") is None
+    assert store.version("short") == 0
+    assert store.update("short", x=3) is None
+    assert store.keys() == ["long"]
+
+
+def test_purge_expired(tmp_path):
+    # В Redis сроки соблюдает сам сервер, поэтому проверяются локальные хранилища
+    for store in (MemoryTaskStore("task"), SQLiteTaskStore(str(tmp_path / "tasks.db"), "task")):
+        store.set("old", {"x": 1}, ttl=0.01)
+        store.set("new", {"x": 2})
+        time.sleep(0.05)
+        assert store.purge_expired() == 1
+        assert store.purge_expired() == 0
+        assert store.keys() == ["new"]
+
+
+def test_wait_for_change(store):
+    store.set("a", {"progress": 0})
+    version = store.version("a")
+
+    assert store.wait_for_change("a", version, timeout=0.05) == version
+
+    timer = threading.Timer(0.05, store.update, args=("a",), kwargs={"progress": 10})
+    timer.start()
+    started = time.monotonic()
+    assert store.wait_for_change("a", version, timeout=5) == version + 1
+    assert time.monotonic() - started < 2
+    timer.join()
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.db")
+    writer = SQLiteTaskStore(path, "task")
+    reader = SQLiteTaskStore(path, "task")
+
+    writer.set("a", {"status": "queued"})
+    version = reader.version("a")
+    threading.Timer(0.05, writer.update, args=("a",), kwargs={"status": "done"}).start()
+
+    # Изменение из другого экземпляра замечается опросом версии
+    assert reader.wait_for_change("a", version, timeout=5) == version + 1
+    assert reader.get("a") == {"status": "done"}
+
+
+def test_sqlite_concurrent_appends(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path / "tasks.db"), "task")
+    store.set("a", {"items": []})
+
+    def worker(n):
+        for i in range(20):
+            store.append("a", "items", [n * 100 + i])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store.get("a")["items"]) == 80
+    assert store.version("a") == 81
+
+
+def test_create_task_store(tmp_path):
+    assert isinstance(create_task_store("memory://", "task"), MemoryTaskStore)
+
+    store = create_task_store(f"sqlite:///{tmp_path}/tasks.db", "task", 60)
+    assert isinstance(store, SQLiteTaskStore)
+    assert store.default_ttl == 60
+
+    with pytest.raises(ValueError):
+        create_task_store("ftp://host", "task")
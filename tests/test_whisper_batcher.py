@@ -0,0 +1,158 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from whisper_batcher import (CHUNK_LENGTH_S, SAMPLE_RATE, BatchJob, BatchScheduler,
+                             own_segments, split_windows)
+
+CHUNK = CHUNK_LENGTH_S * SAMPLE_RATE
+STRIDE = 5 * SAMPLE_RATE
+
+
+def test_short_audio_is_one_window():
+    assert split_windows(10 * SAMPLE_RATE, CHUNK, STRIDE) == [(0, 0, None)]
+    assert split_windows(CHUNK, CHUNK, STRIDE) == [(0, 0, None)]
+
+
+def test_windows_overlap_and_own_parts_meet_in_the_middle():
+    assert split_windows(70 * SAMPLE_RATE, CHUNK, STRIDE) == [
+        (0, 0, 25 * SAMPLE_RATE),
+        (20 * SAMPLE_RATE, 25 * SAMPLE_RATE, 45 * SAMPLE_RATE),
+        (40 * SAMPLE_RATE, 45 * SAMPLE_RATE, None),
+    ]
+
+
+@pytest.mark.parametrize("seconds", [30.5, 50, 61, 119.9, 600])
+def test_own_parts_cover_the_whole_recording(seconds):
+    num_samples = int(seconds * SAMPLE_RATE)
+    windows = split_windows(num_samples, CHUNK, STRIDE)
+
+    assert windows[0][1] == 0
+    assert windows[-1][2] is None
+    # Собственные части идут встык и лежат внутри своих окон
+    for (start, own_start, own_end), (_, next_own_start, _) in zip(windows, windows[1:]):
+        assert own_end == next_own_start
+        assert start <= own_start < own_end <= start + CHUNK
+    # Последнее окно доходит до конца записи
+    assert windows[-1][0] + CHUNK >= num_samples
+    assert windows[-1][0] < num_samples
+
+
+def test_own_segments_uses_segment_middle():
+    segments = [
+        {'text': 'a', 'timestamp': (18.0, 21.0)},   # середина 19.5 - в предыдущем окне
+        {'text': 'b', 'timestamp': (24.0, 27.0)},   # середина 25.5
+        {'text': 'c', 'timestamp': (44.0, 45.0)},   # середина 44.5
+        {'text': 'd', 'timestamp': (44.5, 45.5)},   # середина 45.0 - уже в следующем окне
+    ]
+
+    assert [s['text'] for s in own_segments(segments, 25.0, 45.0)] == ['b', 'c']
+    assert [s['text'] for s in own_segments(segments, 25.0, None)] == ['b', 'c', 'd']
+    assert [s['text'] for s in own_segments(segments, 0, 25.0)] == ['a']
+
+
+class FakeScheduler(BatchScheduler):
+    """
+    Планировщик без модели: "распознает" по слову на каждую секунду окна
+
+    Слово - номер секунды записи, поэтому по результату видно, какие участки
+    попали в транскрипцию дважды или пропали. fail_keys - параметры
+    генерации, на которых распознавание завершается ошибкой.
+    """
+
+    def __init__(self, fail_keys=(), **kwargs):
+        self.batches = []
+        self.fail_keys = set(fail_keys)
+        self.release = threading.Event()
+        super().__init__(None, None, 'cpu', None, **kwargs)
+
+    def _infer(self, batch):
+        self.release.wait(5)
+        self.batches.append([(item.key, item.index) for item in batch])
+        if batch[0].key in self.fail_keys:
+            raise RuntimeError("сбой модели")
+
+        results = []
+        for item in batch:
+            first = int(round(item.offset))
+            last = first + int(np.ceil(len(item.audio) / SAMPLE_RATE))
+            segments = [{'text': f' w{second}', 'timestamp': (float(second), second + 1.0)}
+                        for second in range(first, last)]
+            results.append(own_segments(segments, *item.own))
+        return results, [0.5] * len(batch)
+
+
+def test_overlapping_windows_merge_without_duplicates():
+    scheduler = FakeScheduler(max_wait=0.01)
+    scheduler.release.set()
+    progress = []
+
+    job = scheduler.submit(np.zeros(70 * SAMPLE_RATE, dtype=np.float32), language='ru',
+                           on_chunk=lambda done, total, segments: progress.append((done, total)))
+    result = job.result(timeout=5)
+
+    assert [chunk['text'].strip() for chunk in result['chunks']] == [f'w{i}' for i in range(70)]
+    assert result['text'].split() == [f'w{i}' for i in range(70)]
+    assert result['confidence'] == 0.5
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_repeated_phrase_on_window_seam_is_kept_once():
+    job = BatchJob(2)
+    job._set_chunk_result(0, [{'text': ' привет', 'timestamp': (24.0, 25.0)}])
+    job._set_chunk_result(1, [{'text': 'привет ', 'timestamp': (24.5, 25.5)},
+                              {'text': ' мир', 'timestamp': (25.5, 26.0)}])
+
+    assert job.result(timeout=1)['text'] == 'привет мир'
+
+
+def test_chunks_of_different_jobs_share_a_batch():
+    scheduler = FakeScheduler(max_batch_size=8, max_wait=0.5)
+    first = scheduler.submit(np.zeros(50 * SAMPLE_RATE, dtype=np.float32), language='ru')
+    second = scheduler.submit(np.zeros(10 * SAMPLE_RATE, dtype=np.float32), language='ru')
+    other = scheduler.submit(np.zeros(10 * SAMPLE_RATE, dtype=np.float32), language='en')
+    scheduler.release.set()
+
+    for job in (first, second, other):
+        job.result(timeout=5)
+
+    assert scheduler.batches[0] == [(('ru', 'transcribe'), 0), (('ru', 'transcribe'), 1),
+                                    (('ru', 'transcribe'), 0)]
+    assert scheduler.batches[1] == [(('en', 'transcribe'), 0)]
+
+
+def test_urgent_chunks_go_first():
+    scheduler = FakeScheduler(max_batch_size=1, max_wait=0)
+    # Первый фрагмент уже передан в распознавание и ждет release
+    blocker = scheduler.submit(np.zeros(SAMPLE_RATE, dtype=np.float32), language='de')
+    while scheduler.queue_size():
+        time.sleep(0.001)
+    normal = scheduler.submit(np.zeros(SAMPLE_RATE, dtype=np.float32), language='ru')
+    urgent = scheduler.submit(np.zeros(SAMPLE_RATE, dtype=np.float32), language='en', urgent=True)
+    scheduler.release.set()
+
+    for job in (blocker, normal, urgent):
+        job.result(timeout=5)
+    assert [batch[0][0][0] for batch in scheduler.batches] == ['de', 'en', 'ru']
+
+
+def test_failed_job_skips_remaining_chunks():
+    scheduler = FakeScheduler(fail_keys={('fail', 'transcribe')}, max_batch_size=1, max_wait=0)
+    failing = scheduler.submit(np.zeros(300 * SAMPLE_RATE, dtype=np.float32), language='fail')
+    healthy = scheduler.submit(np.zeros(10 * SAMPLE_RATE, dtype=np.float32), language='ru')
+    total = failing.total_chunks
+    scheduler.release.set()
+
+    with pytest.raises(RuntimeError):
+        failing.result(timeout=5)
+    assert healthy.result(timeout=5)['text'].split() == [f'w{i}' for i in range(10)]
+
+    failed_batches = [batch for batch in scheduler.batches if batch[0][0][0] == 'fail']
+    assert total > 10
+    # После первой ошибки остальные фрагменты задачи убираются из очереди
+    assert len(failed_batches) == 1
+    assert scheduler.queue_size() == 0
@@ -0,0 +1,279 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import whisper_client
+from whisper_client import CircuitOpenError, WhisperClient
+
+
+class FakeService:
+    """
+    Локальный HTTP-сервер с заданной последовательностью ответов
+
+    responses - список (код, тело, заголовки, задержка); последний ответ
+    повторяется, когда список исчерпан. Все запросы сохраняются в requests.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                service.requests.append((self.command, self.path, body))
+                index = min(len(service.requests), len(service.responses)) - 1
+                status, payload, headers, delay = service.responses[index]
+                if delay:
+                    time.sleep(delay)
+                data = json.dumps(payload).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    for name, value in (headers or {}).items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except OSError:
+                    pass
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(whisper_client, 'RETRY_BACKOFF', 0.0)
+
+
+@pytest.fixture
+def service():
+    services = []
+
+    def start(*responses):
+        services.append(FakeService(responses))
+        return services[-1]
+
+    yield start
+    for fake in services:
+        fake.close()
+
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def test_get_retries_server_errors(service):
+    fake = service((500, {}, None, 0), (503, {}, None, 0), (200, {'status': 'ok'}, None, 0))
+    client = WhisperClient(fake.url, max_retries=3)
+
+    response = client.request('GET', '/status/task_1')
+
+    assert response.status_code == 200
+    assert len(fake.requests) == 3
+    assert client.metrics()['operations']['status']['retries'] == 2
+
+
+def test_get_returns_last_server_error(service):
+    fake = service((500, {'error': 'boom'}, None, 0))
+    client = WhisperClient(fake.url, max_retries=3, breaker_threshold=100)
+
+    response = client.request('GET', '/status/task_1')
+
+    assert response.status_code == 500
+    assert len(fake.requests) == 4
+
+
+def test_post_is_not_retried_after_server_error(service):
+    fake = service((500, {}, None, 0), (200, {'task_id': 'task_1'}, None, 0))
+    client = WhisperClient(fake.url, max_retries=3)
+
+    response = client.request('POST', '/transcribe_raw', data=b'audio')
+
+    assert response.status_code == 500
+    assert len(fake.requests) == 1
+
+
+def test_post_is_not_retried_after_read_timeout(service):
+    fake = service((200, {'task_id': 'task_1'}, None, 0.5))
+    client = WhisperClient(fake.url, read_timeout=0.1, max_retries=3)
+
+    with pytest.raises(requests.Timeout):
+        client.request('POST', '/transcribe_raw', data=b'audio')
+    time.sleep(0.5)
+    assert len(fake.requests) == 1
+
+
+def test_get_is_retried_after_read_timeout(service):
+    fake = service((200, {}, None, 0.5), (200, {'status': 'ok'}, None, 0))
+    client = WhisperClient(fake.url, read_timeout=0.1, max_retries=3)
+
+    assert client.request('GET', '/status/task_1').status_code == 200
+    assert len(fake.requests) == 2
+
+
+def test_post_is_retried_when_connection_refused():
+    client = WhisperClient(unused_url(), max_retries=2, breaker_threshold=100)
+
+    with pytest.raises(requests.ConnectionError):
+        client.request('POST', '/transcribe_raw', data=b'audio')
+
+    stats = client.metrics()['operations']['transcribe_raw']
+    assert stats['requests'] == 3
+    assert stats['retries'] == 2
+
+
+def test_request_body_is_rewound_between_attempts(service, tmp_path):
+    fake = service((502, {}, None, 0), (200, {}, None, 0))
+    client = WhisperClient(fake.url, max_retries=1)
+    audio = tmp_path / 'audio.wav'
+    audio.write_bytes(b'0123456789')
+
+    with open(audio, 'rb') as file:
+        client.request('GET', '/echo', data=file)
+
+    assert [body for _, _, body in fake.requests] == [b'0123456789', b'0123456789']
+
+
+def test_breaker_opens_after_consecutive_failures(service):
+    fake = service((500, {}, None, 0))
+    client = WhisperClient(fake.url, max_retries=0, breaker_threshold=3, breaker_reset=60)
+
+    for _ in range(3):
+        assert client.request('GET', '/status/task_1').status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.request('GET', '/status/task_1')
+
+    assert len(fake.requests) == 3
+    metrics = client.metrics()
+    assert metrics['circuits'][fake.url] == 'open'
+    assert metrics['operations']['status']['rejected'] == 1
+
+
+def test_breaker_lets_probe_through_after_reset(service):
+    fake = service((500, {}, None, 0), (500, {}, None, 0), (200, {}, None, 0))
+    client = WhisperClient(fake.url, max_retries=0, breaker_threshold=2, breaker_reset=0.1)
+
+    client.request('GET', '/status/task_1')
+    client.request('GET', '/status/task_1')
+    with pytest.raises(CircuitOpenError):
+        client.request('GET', '/status/task_1')
+
+    time.sleep(0.15)
+    assert client.request('GET', '/status/task_1').status_code == 200
+    assert client.metrics()['circuits'][fake.url] == 'closed'
+
+
+def test_breaker_is_per_replica(service):
+    broken = service((500, {}, None, 0))
+    healthy = service((200, {}, None, 0))
+    client = WhisperClient(broken.url, max_retries=0, breaker_threshold=1, breaker_reset=60)
+
+    client.request('GET', '/status/task_1')
+    with pytest.raises(CircuitOpenError):
+        client.request('GET', '/status/task_1')
+    assert client.request('GET', '/status/task_1', service_url=healthy.url).status_code == 200
+
+
+def test_submit_waits_retry_after_on_full_queue(service, tmp_path, monkeypatch):
+    fake = service((429, {'error': 'full'}, {'Retry-After': '7'}, 0),
+                   (200, {'task_id': 'task_1'}, None, 0))
+    client = WhisperClient(fake.url)
+    sleeps = []
+    monkeypatch.setattr(whisper_client.time, 'sleep', sleeps.append)
+    audio = tmp_path / 'audio.wav'
+    audio.write_bytes(b'audio')
+
+    assert client.submit(str(audio))['task_id'] == 'task_1'
+    assert sleeps == [7]
+    assert len(fake.requests) == 2
+
+
+def test_submit_batch_groups_shared_files(service, tmp_path, monkeypatch):
+    fake = service((200, {'tasks': [{'task_id': 't1'}, {'task_id': 't2'}]}, None, 0),
+                   (200, {'tasks': [{'task_id': 't3'}]}, None, 0))
+    monkeypatch.setattr(whisper_client, 'SHARED_DIR', str(tmp_path))
+    monkeypatch.setattr(whisper_client, 'BATCH_SUBMIT_SIZE', 2)
+    paths = []
+    for name in ('a.wav', 'b.wav', 'c.wav'):
+        (tmp_path / name).write_bytes(b'audio')
+        paths.append((str(tmp_path / name), 'ru'))
+    client = WhisperClient(fake.url)
+
+    assert client.submit_batch(paths, enable_timestamps=True) == ['t1', 't2', 't3']
+
+    bodies = [json.loads(body) for _, path, body in fake.requests]
+    assert [path for _, path, _ in fake.requests] == ['/transcribe_batch', '/transcribe_batch']
+    assert [[item['path'] for item in body['items']] for body in bodies] == [['a.wav', 'b.wav'], ['c.wav']]
+    assert all(item['timestamps'] is True for body in bodies for item in body['items'])
+
+
+def test_submit_batch_falls_back_to_single_files(service, tmp_path, monkeypatch):
+    fake = service((404, {}, None, 0), (200, {'task_id': 't1'}, None, 0), (200, {'task_id': 't2'}, None, 0))
+    monkeypatch.setattr(whisper_client, 'SHARED_DIR', str(tmp_path))
+    paths = []
+    for name in ('a.wav', 'b.wav'):
+        (tmp_path / name).write_bytes(b'audio')
+        paths.append((str(tmp_path / name), 'ru'))
+    client = WhisperClient(fake.url)
+
+    assert client.submit_batch(paths) == ['t1', 't2']
+    assert [path for _, path, _ in fake.requests] == ['/transcribe_batch', '/transcribe_ref', '/transcribe_ref']
+
+
+def test_submit_batch_keeps_queued_groups_when_one_fails(service, tmp_path, monkeypatch):
+    fake = service((200, {'tasks': [{'task_id': 't1'}, {'task_id': 't2'}]}, None, 0),
+                   (500, {'error': 'boom'}, None, 0),
+                   (200, {'tasks': [{'task_id': 't5'}]}, None, 0))
+    monkeypatch.setattr(whisper_client, 'SHARED_DIR', str(tmp_path))
+    monkeypatch.setattr(whisper_client, 'BATCH_SUBMIT_SIZE', 2)
+    paths = []
+    for name in ('a.wav', 'b.wav', 'c.wav', 'd.wav', 'e.wav'):
+        (tmp_path / name).write_bytes(b'audio')
+        paths.append((str(tmp_path / name), 'ru'))
+    client = WhisperClient(fake.url)
+
+    with pytest.raises(whisper_client.BatchSubmitError) as excinfo:
+        client.submit_batch(paths)
+
+    # Группа с ошибкой не повторяется, следующая группа все равно отправлена
+    assert excinfo.value.task_ids == ['t1', 't2', None, None, 't5']
+    assert len(fake.requests) == 3
+    assert '3 из 5' in str(excinfo.value)
+
+
+def test_submit_batch_single_files_fail_independently(service, tmp_path):
+    fake = service((200, {'task_id': 't1'}, None, 0), (500, {'error': 'boom'}, None, 0),
+                   (200, {'task_id': 't3'}, None, 0))
+    paths = []
+    for name in ('a.wav', 'b.wav', 'c.wav'):
+        (tmp_path / name).write_bytes(b'audio')
+        paths.append((str(tmp_path / name), 'ru'))
+    client = WhisperClient(fake.url)
+
+    with pytest.raises(whisper_client.BatchSubmitError) as excinfo:
+        client.submit_batch(paths)
+
+    assert excinfo.value.task_ids == ['t1', None, 't3']
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+
+from whisper_queue import JobQueue, QueueFullError
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("условие не выполнилось за отведенное время")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def busy_queue():
+    """Очередь с одним обработчиком, занятым до конца теста"""
+    queue = JobQueue(workers=1, max_depth=3)
+    release = threading.Event()
+    queue.submit("blocker", release.wait)
+    wait_until(lambda: queue.stats()["running"] == 1)
+    yield queue
+    release.set()
+
+
+def test_priority_for_duration():
+    assert JobQueue.priority_for_duration(30) == 0
+    assert JobQueue.priority_for_duration(60) == 0
+    assert JobQueue.priority_for_duration(300) == 1
+    assert JobQueue.priority_for_duration(3600) == 2
+    assert JobQueue.priority_for_duration(None) == 2
+
+
+def test_short_jobs_go_first(busy_queue):
+    busy_queue.submit("long", lambda: None, duration=3600)
+    busy_queue.submit("medium", lambda: None, duration=300)
+    busy_queue.submit("short", lambda: None, duration=10)
+
+    assert busy_queue.position("short") == 1
+    assert busy_queue.position("medium") == 2
+    assert busy_queue.position("long") == 3
+    assert busy_queue.position("blocker") is None
+
+
+def test_fifo_within_priority_class(busy_queue):
+    busy_queue.submit("first", lambda: None, duration=10)
+    busy_queue.submit("second", lambda: None, duration=20)
+
+    assert busy_queue.position("first") == 1
+    assert busy_queue.position("second") == 2
+
+
+def test_execution_order():
+    queue = JobQueue(workers=1, max_depth=10)
+    release = threading.Event()
+    order = []
+    queue.submit("blocker", release.wait)
+    wait_until(lambda: queue.stats()["running"] == 1)
+
+    queue.submit("long", order.append, "long", duration=3600)
+    queue.submit("short", order.append, "short", duration=10)
+    release.set()
+
+    wait_until(lambda: len(order) == 2)
+    assert order == ["short", "long"]
+
+
+def test_aged_job_is_taken_out_of_turn():
+    queue = JobQueue(workers=1, max_depth=10, aging_seconds=0.05)
+    release = threading.Event()
+    order = []
+    queue.submit("blocker", release.wait)
+    wait_until(lambda: queue.stats()["running"] == 1)
+
+    queue.submit("long", order.append, "long", duration=3600)
+    time.sleep(0.1)
+    queue.submit("short", order.append, "short", duration=10)
+    release.set()
+
+    wait_until(lambda: len(order) == 2)
+    assert order == ["long", "short"]
+
+
+def test_full_queue_raises_with_retry_after(busy_queue):
+    for i in range(3):
+        busy_queue.submit(f"job{i}", lambda: None)
+
+    with pytest.raises(QueueFullError) as excinfo:
+        busy_queue.submit("overflow", lambda: None)
+
+    # Среднее время задачи до первых измерений - 60 с, обработчик один
+    assert excinfo.value.retry_after == 60
+    assert busy_queue.retry_after() == 60
+    assert busy_queue.stats()["rejected"] == 1
+    assert busy_queue.position("overflow") is None
+
+
+def test_retry_after_is_at_least_one_second():
+    queue = JobQueue(workers=4, max_depth=1)
+    queue._avg_job_seconds = 0.1
+    assert queue.retry_after() == 1
+
+
+def test_submit_many_is_all_or_nothing(busy_queue):
+    busy_queue.submit("existing", lambda: None)
+
+    jobs = [(f"batch{i}", lambda: None, (), 10) for i in range(3)]
+    with pytest.raises(QueueFullError):
+        busy_queue.submit_many(jobs)
+
+    assert busy_queue.stats()["queued"] == 1
+    assert busy_queue.stats()["rejected"] == 3
+    assert all(busy_queue.position(job_id) is None for job_id, *_ in jobs)
+
+    busy_queue.submit_many(jobs[:2])
+    assert busy_queue.stats()["queued"] == 3
+
+
+def test_failed_job_does_not_stop_worker():
+    queue = JobQueue(workers=1, max_depth=10)
+    done = threading.Event()
+
+    def fail():
+        raise RuntimeError("сбой")
+
+    queue.submit("failing", fail)
+    queue.submit("next", done.set)
+
+    assert done.wait(5)
+    wait_until(lambda: queue.stats()["completed"] == 2)
+
+
+def test_api_returns_429_with_retry_after(monkeypatch, tmp_path):
+    pytest.importorskip("torch")
+    pytest.importorskip("fastapi")
+    import whisper_api
+
+    queue = JobQueue(workers=1, max_depth=0)
+    monkeypatch.setattr(whisper_api, "job_queue", queue)
+    monkeypatch.setattr(whisper_api, "get_audio_duration", lambda path: 10.0)
+    audio = tmp_path / "audio.wav"
+    audio.write_bytes(b"RIFF")
+
+    response = whisper_api.enqueue_transcription(str(audio), None, False, "auto")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    assert not audio.exists()
+    assert whisper_api.ACTIVE_TASKS.keys() == []
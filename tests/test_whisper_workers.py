@@ -0,0 +1,116 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import whisper_workers
+from whisper_workers import InferencePool
+
+
+class FakeExecutor:
+    """Пул процессов без процессов: задачи выполняются сразу в вызывающем потоке"""
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.shut_down = False
+        self.submitted = 0
+
+    def submit(self, func, *args):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+
+        self.submitted += 1
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("процесс завершился"))
+        else:
+            future.set_result(("текст", {"model": "main"}))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """
+    Пул с подмененным созданием и прогревом процессов
+
+    warm_up_failures - сколько следующих прогревов завершатся ошибкой.
+    """
+    monkeypatch.setattr(whisper_workers, 'RESTART_RETRY_DELAY', 0.01)
+    pool = InferencePool(1)
+    pool.executors = []
+    pool.warm_up_failures = 0
+
+    def create_executor():
+        with pool._lock:
+            pool._process_count = 1
+            pool._executor = FakeExecutor()
+            pool._warming = True
+            pool.executors.append(pool._executor)
+            return pool._executor
+
+    original_warm_up = pool._warm_up
+
+    def warm_up(executor):
+        if pool.warm_up_failures:
+            pool.warm_up_failures -= 1
+            raise OSError("не удалось запустить процесс")
+        with pool._lock:
+            pool._process_count = 0
+        original_warm_up(executor)
+
+    pool._create_executor = create_executor
+    pool._warm_up = warm_up
+    pool._warm_up(pool._create_executor())
+    pool._ready.set()
+    return pool
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("условие не выполнилось за отведенное время")
+        time.sleep(0.005)
+
+
+def crash(pool):
+    pool.executors[-1].broken = True
+    with pytest.raises(RuntimeError, match="аварийно"):
+        pool.transcribe("task", "audio.wav", "ru", False)
+
+
+def test_crashed_pool_is_replaced(pool):
+    assert pool.is_ready()
+    crash(pool)
+
+    wait_until(pool.is_ready)
+    assert pool.restarts == 1
+    assert pool.executors[0].shut_down
+    assert pool.transcribe("task", "audio.wav", "ru", False) == "текст"
+
+
+def test_failed_restart_is_reported_and_retried(pool, monkeypatch):
+    gate = threading.Event()
+    # Повтор перезапуска ждет разрешения теста
+    monkeypatch.setattr(whisper_workers, 'time', SimpleNamespace(sleep=lambda delay: gate.wait(5)))
+    pool.warm_up_failures = 1
+    crash(pool)
+
+    # Первая попытка перезапуска не удалась: пул не готов, задачи не уходят в нерабочий пул
+    wait_until(lambda: pool._error is not None)
+    assert not pool.is_ready()
+    with pytest.raises(RuntimeError, match="недоступен"):
+        pool.transcribe("task", "audio.wav", "ru", False)
+    assert all(executor.submitted <= 1 for executor in pool.executors)
+    assert pool.executors[1].shut_down
+
+    # Следующая попытка удалась - пул снова принимает задачи
+    gate.set()
+    wait_until(pool.is_ready)
+    assert pool._error is None
+    assert len(pool.executors) == 3
+    assert pool.transcribe("task", "audio.wav", "ru", False) == "текст"
@@ -0,0 +1,159 @@
+import os
+import json
+import hashlib
+import tempfile
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def hash_bytes(data):
+    """SHA-256 от байтов или буфера (bytes, memoryview, массив NumPy)"""
+    return hashlib.sha256(memoryview(data).cast('B')).hexdigest()
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """SHA-256 содержимого файла, читаемого блоками"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """
+    Дисковый кэш результатов транскрипции с адресацией по содержимому
+
+    Ключ строится из хэша аудио (или идентификатора видео) и параметров
+    распознавания. Каждая запись хранится отдельным JSON-файлом, общий
+    размер ограничен max_bytes; при превышении удаляются записи, к которым
+    дольше всего не обращались (LRU). Порядок обращений восстанавливается
+    после перезапуска по времени изменения файлов.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()  # ключ -> размер файла
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(content_id, **params):
+        """Ключ кэша: идентификатор содержимого плюс параметры распознавания"""
+        payload = json.dumps({'content': content_id, **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Получение записи; обновляет порядок LRU и счетчики попаданий"""
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                # Запись могла появиться от другого процесса, использующего тот же каталог
+                try:
+                    self._index[key] = os.path.getsize(path)
+                    self._total_bytes += self._index[key]
+                except OSError:
+                    self.misses += 1
+                    return None
+            self._index.move_to_end(key)
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать запись кэша {key}: {e}")
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Сохранение записи с вытеснением самых старых при превышении лимита"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Не удалось сохранить запись кэша {key}: {e}")
+            return
+
+        with self._lock:
+            self._forget(key, remove_file=False)
+            self._index[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def stats(self):
+        """Счетчики попаданий/промахов и заполненность кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                # Недописанные файлы прерванных записей (свежие может писать другой процесс)
+                try:
+                    if time.time() - os.path.getmtime(path) > 3600:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _forget(self, key, remove_file=True):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+        if remove_file:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            self._forget(key)
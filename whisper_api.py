@@ -1,15 +1,17 @@
 import os
+import asyncio
 import tempfile
 import time
 import json
 import logging
-import shutil
+import wave
 import ssl
+import threading
 import urllib3
-from fastapi import FastAPI, File, UploadFile, Form, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
 # Отключаем проверку SSL сертификатов
@@ -17,7 +19,12 @@ ssl._create_default_https_context = ssl._create_unverified_context
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # Импортируем обновленный сервис
-from whisper_service import transcribe_with_whisper, format_time
+import whisper_service
+from whisper_service import transcribe_with_whisper, format_time, get_audio_duration
+from whisper_queue import JobQueue, QueueFullError
+from whisper_workers import InferencePool
+from whisper_stream import StreamingSession
+from task_store import create_task_store
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -40,7 +47,110 @@ app.add_middleware(
 
 # Инициализация переменных
 MODEL_NAME = os.environ.get("WHISPER_MODEL_NAME", "antony66/whisper-large-v3-russian")
-ACTIVE_TASKS = {}
+
+# Хранилище состояний задач: 'memory://', 'sqlite:///путь/к/файлу.db' или 'redis://хост:6379/0';
+# записи удаляются через WHISPER_TASK_TTL секунд
+TASK_STORE_URL = os.environ.get("WHISPER_TASK_STORE_URL", "memory://")
+TASK_TTL = float(os.environ.get("WHISPER_TASK_TTL", 24 * 3600))
+ACTIVE_TASKS = create_task_store(TASK_STORE_URL, "whisper_task", TASK_TTL)
+
+# Очередь задач: число параллельных обработчиков и максимальная глубина очереди
+WORKER_COUNT = int(os.environ.get("WHISPER_WORKERS", 2))
+MAX_QUEUE_DEPTH = int(os.environ.get("WHISPER_MAX_QUEUE", 50))
+job_queue = JobQueue(workers=WORKER_COUNT, max_depth=MAX_QUEUE_DEPTH)
+
+# Режим обработчиков: 'thread' - модель в процессе API, 'process' - WHISPER_WORKERS
+# отдельных процессов, каждый на своей группе ядер CPU
+WORKER_MODE = os.environ.get("WHISPER_WORKER_MODE", "thread")
+inference_pool = InferencePool(WORKER_COUNT) if WORKER_MODE == "process" else None
+
+# Ограничение размера загружаемого файла и размер блока при записи на диск
+MAX_UPLOAD_BYTES = int(os.environ.get("WHISPER_MAX_UPLOAD_MB", 100)) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Общий с веб-приложением каталог (том uploads): файлы из него принимаются
+# по ссылке через /transcribe_ref без передачи по HTTP (пусто - отключено)
+SHARED_DIR = os.environ.get("WHISPER_SHARED_DIR", "")
+
+@app.on_event("startup")
+def start_inference_pool():
+    """Запуск пула процессов-обработчиков или прогрева модели в фоне, чтобы не задерживать старт API"""
+    if inference_pool is not None:
+        threading.Thread(target=inference_pool.start, name="inference-pool-start", daemon=True).start()
+    elif whisper_service.WARMUP:
+        threading.Thread(target=whisper_service.warmup_model, name="model-warmup", daemon=True).start()
+
+@app.on_event("startup")
+def fail_interrupted_tasks():
+    """Задачи, прерванные перезапуском сервиса, помечаются ошибкой, чтобы клиенты не ждали их вечно"""
+    for task_id in ACTIVE_TASKS.keys():
+        task_info = ACTIVE_TASKS.get(task_id)
+        if task_info and task_info.get("status") in ("queued", "processing"):
+            update_task(task_id, status="error", message="Ошибка: задача прервана перезапуском сервиса")
+
+# Подписчики потоков событий: task_id -> множество (цикл событий, asyncio.Event)
+TASK_SUBSCRIBERS = {}
+_subscribers_lock = threading.Lock()
+
+# Интервал комментариев keep-alive в потоке событий (секунды)
+EVENTS_KEEPALIVE = float(os.environ.get("WHISPER_EVENTS_KEEPALIVE", 15))
+
+def update_task(task_id: str, replace: bool = False, **fields):
+    """Изменение состояния задачи с уведомлением подписчиков потока событий"""
+    if replace or ACTIVE_TASKS.update(task_id, **fields) is None:
+        ACTIVE_TASKS.set(task_id, dict(fields))
+    notify_subscribers(task_id)
+
+def append_segments(task_id: str, segments: list, done: int, total: int):
+    """Добавление промежуточных сегментов очередного распознанного фрагмента"""
+    # Список только дополняется, поэтому читатели могут брать срез с любой позиции
+    if ACTIVE_TASKS.append(task_id, "segments", segments, chunks_done=done, chunks_total=total) is not None:
+        notify_subscribers(task_id)
+
+def notify_subscribers(task_id: str):
+    """Пробуждение потоков событий, подписанных на задачу"""
+    with _subscribers_lock:
+        subscribers = list(TASK_SUBSCRIBERS.get(task_id, ()))
+    for loop, event in subscribers:
+        loop.call_soon_threadsafe(event.set)
+
+def task_response(task_id: str, since: Optional[int] = None) -> Optional[dict]:
+    """
+    Ответ о состоянии задачи (общий для /status и /events)
+    
+    Если задан since, в ответ добавляются промежуточные сегменты, начиная
+    с этой позиции; segments_count - позиция для следующего запроса.
+    """
+    task_info = ACTIVE_TASKS.get(task_id)
+    if task_info is None:
+        return None
+    
+    response = {
+        "status": task_info["status"],
+        "progress": task_info["progress"],
+        "message": task_info["message"]
+    }
+    
+    segments = task_info.get("segments", [])
+    response["segments_count"] = len(segments)
+    if "chunks_total" in task_info:
+        response["chunks_done"] = task_info["chunks_done"]
+        response["chunks_total"] = task_info["chunks_total"]
+    if since is not None:
+        response["segments"] = segments[max(since, 0):]
+    if task_info.get("language"):
+        response["language"] = task_info["language"]
+        response["language_probability"] = task_info.get("language_probability")
+    if task_info.get("model_info"):
+        response["model"] = task_info["model_info"]["model"]
+        response["model_info"] = task_info["model_info"]
+    
+    # Возвращаем результат, если задача завершена
+    if task_info["status"] == "completed":
+        response["result"] = task_info.get("result")
+    elif task_info["status"] == "queued":
+        response["queue_position"] = job_queue.position(task_id)
+    return response
 
 class TranscriptionStatus(BaseModel):
     task_id: str
@@ -49,11 +159,20 @@ class TranscriptionStatus(BaseModel):
     message: str = ""
     result: Optional[dict] = None
 
-def cleanup_temp_files(file_path: str):
-    """Очистка временных файлов"""
+class TranscribeRefRequest(BaseModel):
+    path: str
+    language: Optional[str] = None
+    timestamps: bool = False
+    quality: str = "auto"
+
+class TranscribeBatchRequest(BaseModel):
+    items: List[TranscribeRefRequest]
+
+def cleanup_temp_files(file_path: str, keep_source: bool = False):
+    """Очистка временных файлов; keep_source - исходный файл принадлежит клиенту и остается"""
     try:
         # Удаляем оригинальный временный файл
-        if os.path.exists(file_path):
+        if not keep_source and os.path.exists(file_path):
             os.remove(file_path)
             logger.info(f"Удален временный файл: {file_path}")
         
@@ -65,96 +184,267 @@ def cleanup_temp_files(file_path: str):
     except Exception as e:
         logger.error(f"Ошибка при удалении временных файлов: {e}")
 
-def transcribe_task(task_id: str, file_path: str, language: Optional[str] = None, timestamps: bool = False):
+def transcribe_task(task_id: str, file_path: str, language: Optional[str] = None, timestamps: bool = False,
+                    quality: str = "auto", keep_source: bool = False):
     """Фоновая задача для транскрипции"""
     try:
-        ACTIVE_TASKS[task_id] = {
-            "status": "processing",
-            "progress": 0,
-            "message": "Подготовка к транскрипции"
-        }
+        # Глубина очереди на момент запуска влияет на выбор модели
+        queue_depth = job_queue.stats()["queued"]
+        result_info = {}
+        
+        update_task(
+            task_id,
+            replace=True,
+            status="processing",
+            progress=0,
+            message="Подготовка к транскрипции"
+        )
         
         # Функция обновления статуса
         def update_status(percent, message):
-            ACTIVE_TASKS[task_id] = {
-                "status": "processing" if percent < 100 else "completed",
-                "progress": percent,
-                "message": message
-            }
+            update_task(
+                task_id,
+                status="processing" if percent < 100 else "completed",
+                progress=percent,
+                message=message
+            )
         
-        # Запуск транскрибирования
-        result = transcribe_with_whisper(
-            file_path=file_path,
-            language_code=language,
-            enable_timestamps=timestamps,
-            status_callback=update_status
-        )
+        # Промежуточные сегменты публикуются по мере распознавания фрагментов
+        def add_segments(segments, done, total):
+            append_segments(task_id, segments, done, total)
+        
+        # Запуск транскрибирования в процессе-обработчике или в текущем процессе
+        if inference_pool is not None:
+            result = inference_pool.transcribe(task_id, file_path, language, timestamps, update_status,
+                                               add_segments, quality, queue_depth, result_info)
+        else:
+            result = transcribe_with_whisper(
+                file_path=file_path,
+                language_code=language,
+                enable_timestamps=timestamps,
+                status_callback=update_status,
+                segment_callback=add_segments,
+                quality=quality,
+                queue_depth=queue_depth,
+                result_info=result_info
+            )
         
         # Обработка результатов
-        ACTIVE_TASKS[task_id]["status"] = "completed"
-        ACTIVE_TASKS[task_id]["progress"] = 100
-        ACTIVE_TASKS[task_id]["message"] = "Транскрипция завершена"
-        ACTIVE_TASKS[task_id]["result"] = result
+        update_task(
+            task_id,
+            status="completed",
+            progress=100,
+            message="Транскрипция завершена",
+            result=result,
+            language=result_info.pop("language", None),
+            language_probability=result_info.pop("language_probability", None),
+            model_info=result_info or None
+        )
         
     except Exception as e:
         logger.error(f"Ошибка при транскрипции: {e}")
-        ACTIVE_TASKS[task_id]["status"] = "error"
-        ACTIVE_TASKS[task_id]["message"] = f"Ошибка: {str(e)}"
+        update_task(task_id, status="error", message=f"Ошибка: {str(e)}")
     finally:
         # Очищаем временные файлы в любом случае
-        cleanup_temp_files(file_path)
+        cleanup_temp_files(file_path, keep_source)
+
+class UploadTooLargeError(Exception):
+    """Загружаемый файл превышает MAX_UPLOAD_BYTES"""
+
+async def save_upload(chunks, suffix: str, pcm: bool = False):
+    """
+    Запись загружаемых данных во временный файл за один проход
+
+    Размер проверяется по мере записи: при превышении MAX_UPLOAD_BYTES файл
+    удаляется и выбрасывается UploadTooLargeError. pcm=True - данные являются
+    PCM s16le 16 кГц моно, на диске сразу получается канонический WAV.
+    Возвращает (путь, размер данных).
+    """
+    size = 0
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav" if pcm else suffix)
+    writer = None
+    try:
+        if pcm:
+            # wave дописывает размеры в заголовок при закрытии
+            writer = wave.open(temp_file, "wb")
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(whisper_service.SAMPLE_RATE)
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadTooLargeError()
+            if writer is not None:
+                writer.writeframesraw(chunk)
+            else:
+                temp_file.write(chunk)
+        if writer is not None:
+            writer.close()
+        temp_file.close()
+    except BaseException:
+        temp_file.close()
+        os.remove(temp_file.name)
+        raise
+    return temp_file.name, size
+
+async def read_upload_file(file: UploadFile):
+    """Чтение UploadFile блоками по UPLOAD_CHUNK_SIZE"""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+def upload_too_large_response():
+    return JSONResponse(
+        status_code=413,
+        content={"error": f"Файл слишком большой (максимум {MAX_UPLOAD_BYTES // (1024 * 1024)} МБ)"}
+    )
+
+def enqueue_transcription(temp_path: str, language: Optional[str], timestamps: bool, quality: str,
+                          keep_source: bool = False):
+    """
+    Постановка сохраненного файла в очередь; ответ эндпоинта с ID задачи или 429
+    
+    Блокирует (ffprobe, хранилище задач) - из асинхронных эндпоинтов вызывается
+    через run_in_executor, чтобы не останавливать цикл событий.
+    """
+    # Генерируем ID задачи
+    task_id = f"task_{int(time.time())}_{os.urandom(4).hex()}"
+    
+    # Ставим задачу в очередь; короткие записи обрабатываются в первую очередь
+    duration = get_audio_duration(temp_path)
+    update_task(
+        task_id,
+        replace=True,
+        status="queued",
+        progress=0,
+        message="Задача ожидает в очереди"
+    )
+    try:
+        job_queue.submit(task_id, transcribe_task, task_id, temp_path, language, timestamps, quality,
+                         keep_source, duration=duration)
+    except QueueFullError as e:
+        ACTIVE_TASKS.delete(task_id)
+        cleanup_temp_files(temp_path, keep_source)
+        logger.warning(f"Очередь заполнена, запрос отклонен: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    return JSONResponse({
+        "task_id": task_id,
+        "message": "Задача транскрипции поставлена в очередь",
+        # Предполагаемая модель: окончательная (с учетом уверенности) будет в статусе задачи
+        "model": whisper_service.model_for_tier(
+            whisper_service.choose_model_tier(duration, quality, job_queue.stats()["queued"])
+        ),
+        "queue_position": job_queue.position(task_id)
+    })
+
+def invalid_quality_response(quality: str):
+    if quality not in ("auto", "fast", "high"):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "quality должен быть auto, fast или high"}
+        )
+    return None
 
 @app.post("/transcribe")
 async def transcribe_audio(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     language: Optional[str] = Form(None),
-    timestamps: bool = Form(False)
+    timestamps: bool = Form(False),
+    quality: str = Form("auto")
 ):
-    """Эндпоинт для транскрипции аудиофайла"""
+    """
+    Эндпоинт для транскрипции аудиофайла
+    
+    quality: 'auto' - модель выбирается по длительности и загрузке,
+    'fast' - быстрая модель, 'high' - основная модель.
+    language='auto' - язык определяется по первым 30 с записи и
+    возвращается в статусе задачи вместе с вероятностью.
+    """
+    error_response = invalid_quality_response(quality)
+    if error_response is not None:
+        return error_response
     try:
-        # Проверка размера файла (ограничение в 100 МБ)
-        file_size = 0
-        chunk_size = 1024 * 1024  # 1 МБ
-        max_size = 100 * 1024 * 1024  # 100 МБ
-        
-        # Перематываем файл в начало для проверки размера
-        await file.seek(0)
-        
-        while True:
-            chunk = await file.read(chunk_size)
-            if not chunk:
-                break
-            file_size += len(chunk)
-            if file_size > max_size:
-                return JSONResponse(
-                    status_code=413,
-                    content={"error": "Файл слишком большой (максимум 100 МБ)"}
-                )
-        
-        # Перематываем файл в начало для последующего копирования
-        await file.seek(0)
-        
-        # Создаем временный файл для сохранения загруженного аудио
+        # Файл копируется во временный за один проход с проверкой размера
         suffix = os.path.splitext(file.filename)[1] if file.filename else ".wav"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-            # Копируем содержимое загруженного файла во временный файл
-            shutil.copyfileobj(file.file, temp_file)
-            temp_path = temp_file.name
+        try:
+            temp_path, file_size = await save_upload(read_upload_file(file), suffix)
+        except UploadTooLargeError:
+            return upload_too_large_response()
         
         logger.info(f"Файл {file.filename} (размер: {file_size} байт) сохранен как {temp_path}")
+        return await asyncio.get_running_loop().run_in_executor(
+            None, enqueue_transcription, temp_path, language, timestamps, quality
+        )
+    
+    except Exception as e:
+        logger.error(f"Ошибка при обработке запроса: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Ошибка при обработке файла: {str(e)}"}
+        )
+
+@app.post("/transcribe_raw")
+async def transcribe_raw(
+    request: Request,
+    language: Optional[str] = None,
+    timestamps: bool = False,
+    quality: str = "auto",
+    filename: Optional[str] = None
+):
+    """
+    Транскрипция аудио, переданного телом запроса без multipart
+    
+    Тело пишется на диск по мере поступления, без промежуточной буферизации.
+    Content-Type audio/L16 (или audio/pcm) - PCM s16le 16 кГц моно, из него
+    сразу получается канонический WAV; иначе тело - аудиофайл любого формата,
+    расширение берется из filename. Параметры - как у /transcribe, в строке запроса.
+    """
+    error_response = invalid_quality_response(quality)
+    if error_response is not None:
+        return error_response
+    
+    # Слишком большое тело отклоняем по Content-Length, не читая его
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        return upload_too_large_response()
+    
+    content_type, _, params = request.headers.get("content-type", "").partition(";")
+    pcm = content_type.strip().lower() in ("audio/l16", "audio/pcm")
+    if pcm:
+        options = dict(
+            (name.strip().lower(), value.strip())
+            for name, _, value in (param.partition("=") for param in params.split(";") if param.strip())
+        )
+        if options.get("rate", str(whisper_service.SAMPLE_RATE)) != str(whisper_service.SAMPLE_RATE) \
+                or options.get("channels", "1") != "1":
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"PCM принимается только {whisper_service.SAMPLE_RATE} Гц, моно"}
+            )
+    
+    try:
+        suffix = os.path.splitext(filename)[1] if filename else ".wav"
+        try:
+            temp_path, size = await save_upload(request.stream(), suffix, pcm=pcm)
+        except UploadTooLargeError:
+            return upload_too_large_response()
         
-        # Генерируем ID задачи
-        task_id = f"task_{int(time.time())}_{os.urandom(4).hex()}"
-        
-        # Запускаем фоновую задачу для транскрипции
-        background_tasks.add_task(transcribe_task, task_id, temp_path, language, timestamps)
+        if size == 0:
+            cleanup_temp_files(temp_path)
+            return JSONResponse(status_code=400, content={"error": "Пустое тело запроса"})
         
-        return JSONResponse({
-            "task_id": task_id,
-            "message": "Задача транскрипции запущена",
-            "model": MODEL_NAME
-        })
+        logger.info(f"Тело запроса {filename or content_type or 'без имени'} (размер: {size} байт) "
+                    f"сохранено как {temp_path}")
+        return await asyncio.get_running_loop().run_in_executor(
+            None, enqueue_transcription, temp_path, language, timestamps, quality
+        )
     
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса: {e}")
@@ -163,56 +453,294 @@ async def transcribe_audio(
             content={"error": f"Ошибка при обработке файла: {str(e)}"}
         )
 
-@app.get("/status/{task_id}")
-async def get_task_status(task_id: str):
-    """Проверка статуса задачи по ID"""
-    if task_id not in ACTIVE_TASKS:
+def resolve_shared_path(path: str) -> Optional[str]:
+    """Абсолютный путь к файлу внутри SHARED_DIR или None, если путь выходит за его пределы"""
+    root = os.path.realpath(SHARED_DIR)
+    full_path = os.path.realpath(os.path.join(root, path))
+    # realpath раскрывает '..' и символические ссылки, поэтому проверка по префиксу надежна
+    if os.path.isabs(path) or os.path.commonpath([root, full_path]) != root or full_path == root:
+        return None
+    return full_path if os.path.isfile(full_path) else None
+
+@app.post("/transcribe_ref")
+def transcribe_ref(body: TranscribeRefRequest):
+    """
+    Транскрипция файла из общего каталога по ссылке, без передачи по HTTP
+    
+    path - путь относительно WHISPER_SHARED_DIR. Файл читается на месте и
+    после обработки не удаляется: им по-прежнему владеет клиент. Ограничение
+    размера загрузки не применяется - файл никуда не копируется.
+    """
+    if not SHARED_DIR:
         return JSONResponse(
             status_code=404,
-            content={"error": "Задача не найдена"}
+            content={"error": "Передача по ссылке отключена (не задан WHISPER_SHARED_DIR)"}
         )
+    error_response = invalid_quality_response(body.quality)
+    if error_response is not None:
+        return error_response
     
-    task_info = ACTIVE_TASKS[task_id].copy()
+    file_path = resolve_shared_path(body.path)
+    if file_path is None:
+        logger.warning(f"Отклонена ссылка на файл вне общего каталога или несуществующий файл: {body.path}")
+        return JSONResponse(status_code=403, content={"error": "Файл не найден в общем каталоге"})
     
-    # Возвращаем результат, если задача завершена
-    if task_info["status"] == "completed":
-        result = task_info.pop("result", None)
-        
-        return JSONResponse({
-            "status": task_info["status"],
-            "progress": task_info["progress"],
-            "message": task_info["message"],
-            "result": result
-        })
-    
-    # Для незавершенных задач возвращаем только статус
+    logger.info(f"Файл {file_path} принят по ссылке")
+    return enqueue_transcription(file_path, body.language, body.timestamps, body.quality, keep_source=True)
+
+@app.post("/transcribe_batch")
+def transcribe_batch(body: TranscribeBatchRequest):
+    """
+    Постановка нескольких файлов из общего каталога одной операцией
+    
+    Все задачи пакета встают в очередь вместе (или ни одна - ответ 429),
+    поэтому обработчики берут их одновременно и планировщик пакетов модели
+    объединяет фрагменты разных файлов. Файлы передаются по ссылке, как в
+    /transcribe_ref. Ответ - задачи в порядке элементов запроса.
+    
+    Обычная (не async) функция: длительность каждого файла определяется
+    ffprobe, и FastAPI выполняет такой эндпоинт в пуле потоков, не
+    останавливая цикл событий.
+    """
+    if not SHARED_DIR:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Передача по ссылке отключена (не задан WHISPER_SHARED_DIR)"}
+        )
+    if not body.items or len(body.items) > job_queue.max_depth:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"В пакете должно быть от 1 до {job_queue.max_depth} файлов"}
+        )
+    
+    jobs = []
+    for index, item in enumerate(body.items):
+        error_response = invalid_quality_response(item.quality)
+        if error_response is not None:
+            return error_response
+        file_path = resolve_shared_path(item.path)
+        if file_path is None:
+            logger.warning(f"Отклонена ссылка на файл вне общего каталога или несуществующий файл: {item.path}")
+            return JSONResponse(
+                status_code=403,
+                content={"error": f"Файл элемента {index} не найден в общем каталоге", "index": index}
+            )
+        task_id = f"task_{int(time.time())}_{os.urandom(4).hex()}"
+        duration = get_audio_duration(file_path)
+        jobs.append((task_id, item, file_path, duration))
+    
+    for task_id, _, _, _ in jobs:
+        update_task(
+            task_id,
+            replace=True,
+            status="queued",
+            progress=0,
+            message="Задача ожидает в очереди"
+        )
+    try:
+        job_queue.submit_many([
+            (task_id, transcribe_task, (task_id, file_path, item.language, item.timestamps, item.quality, True),
+             duration)
+            for task_id, item, file_path, duration in jobs
+        ])
+    except QueueFullError as e:
+        for task_id, _, _, _ in jobs:
+            ACTIVE_TASKS.delete(task_id)
+        logger.warning(f"Очередь заполнена, пакет из {len(jobs)} файлов отклонен: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    logger.info(f"Пакет из {len(jobs)} файлов поставлен в очередь")
+    queued = job_queue.stats()["queued"]
     return JSONResponse({
-        "status": task_info["status"],
-        "progress": task_info["progress"],
-        "message": task_info["message"]
+        "tasks": [
+            {
+                "task_id": task_id,
+                "model": whisper_service.model_for_tier(
+                    whisper_service.choose_model_tier(duration, item.quality, queued)
+                ),
+                "queue_position": job_queue.position(task_id)
+            }
+            for task_id, item, _, duration in jobs
+        ]
     })
 
+@app.get("/status/{task_id}")
+def get_task_status(task_id: str, since: Optional[int] = None):
+    """Проверка статуса задачи по ID; since - позиция, с которой вернуть промежуточные сегменты"""
+    response = task_response(task_id, since)
+    if response is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Задача не найдена"}
+        )
+    return JSONResponse(response)
+
+@app.get("/events/{task_id}")
+async def task_events(task_id: str, since: int = 0):
+    """
+    Поток Server-Sent Events с прогрессом задачи
+    
+    Событие отправляется при каждом изменении состояния задачи, без
+    периодического опроса; каждое событие содержит только новые
+    промежуточные сегменты. Поток закрывается после завершения или ошибки.
+    """
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(None, ACTIVE_TASKS.get, task_id) is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Задача не найдена"}
+        )
+    
+    async def event_stream():
+        changed = asyncio.Event()
+        subscriber = (loop, changed)
+        with _subscribers_lock:
+            TASK_SUBSCRIBERS.setdefault(task_id, set()).add(subscriber)
+        try:
+            last_payload = None
+            cursor = since
+            while True:
+                changed.clear()
+                response = await loop.run_in_executor(None, task_response, task_id, cursor)
+                if response is None:
+                    yield f"event: error\ndata: {json.dumps({'error': 'Задача не найдена'}, ensure_ascii=False)}\n\n"
+                    return
+                
+                payload = json.dumps(response, ensure_ascii=False)
+                if payload != last_payload:
+                    yield f"data: {payload}\n\n"
+                    # Отправленные сегменты больше не повторяются: сравниваем со следующим
+                    # ответом так, как он будет выглядеть без новых сегментов
+                    cursor = response["segments_count"]
+                    response["segments"] = []
+                    last_payload = json.dumps(response, ensure_ascii=False)
+                if response["status"] in ("completed", "error"):
+                    return
+                
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Комментарий keep-alive, чтобы прокси не закрыли соединение
+                    yield ": keep-alive\n\n"
+        finally:
+            with _subscribers_lock:
+                subscribers = TASK_SUBSCRIBERS.get(task_id)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del TASK_SUBSCRIBERS[task_id]
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/stream")
+async def stream_transcription(websocket: WebSocket, language: Optional[str] = None):
+    """
+    Потоковое распознавание записи с микрофона
+    
+    Клиент присылает бинарные фрагменты webm/opus по мере записи и текстовое
+    сообщение "stop" в конце. Сервер отвечает JSON-событиями: предварительный
+    текст текущей фразы (provisional), окончательный текст фразы после паузы
+    (final) и {"type": "done"} после распознавания последней фразы.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    session = StreamingSession(language)
+    session.start(loop)
+    
+    async def receive_audio():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    await loop.run_in_executor(None, session.feed, message["bytes"])
+                elif message.get("text") == "stop":
+                    break
+        finally:
+            session.finish()
+    
+    receiver = asyncio.create_task(receive_audio())
+    try:
+        async for event in session.events():
+            await websocket.send_json(event)
+        await websocket.send_json({"type": "done"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Клиент потокового распознавания отключился")
+    except Exception as e:
+        logger.error(f"Ошибка потокового распознавания: {e}")
+        try:
+            await websocket.send_json({"type": "error", "message": str(e)})
+            await websocket.close()
+        except Exception:
+            pass
+    finally:
+        receiver.cancel()
+        session.close()
+
 @app.get("/health")
 async def health_check():
     """Проверка работоспособности сервиса"""
     return {
         "status": "healthy", 
         "model": MODEL_NAME,
+        "fast_model": whisper_service.FAST_MODEL_NAME or None,
         "device": os.environ.get("DEVICE", "cpu"),
+        "backend": whisper_service.BACKEND,
+        "worker_mode": WORKER_MODE,
+        "queue": job_queue.stats(),
+        "cache": whisper_service.result_cache.stats() if whisper_service.result_cache else None,
         "timestamp": time.time()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность к приему трафика: модель загружена и прогрета"""
+    if inference_pool is not None:
+        ready = inference_pool.is_ready()
+        states = inference_pool.worker_states
+        model_state = {
+            "loaded": bool(states) and all(state["loaded"] for state in states),
+            "load_seconds": max((state["load_seconds"] or 0 for state in states), default=None),
+            "warmed_up": bool(states) and all(state["warmed_up"] for state in states),
+            "warmup_seconds": max((state["warmup_seconds"] or 0 for state in states), default=None),
+            "workers": states
+        }
+    else:
+        ready = whisper_service.is_ready()
+        model_state = dict(whisper_service.MODEL_STATE)
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "model": MODEL_NAME,
+            "worker_mode": WORKER_MODE,
+            "warmup_enabled": whisper_service.WARMUP,
+            **model_state
+        }
+    )
+
 # Очистка старых задач
 @app.get("/cleanup")
-async def cleanup_tasks(age_hours: int = 24):
+def cleanup_tasks(age_hours: int = 24):
     """Очистка старых задач"""
     try:
         current_time = time.time()
         count_before = len(ACTIVE_TASKS)
         tasks_to_remove = []
         
-        # Проверяем время создания каждой задачи
-        for task_id, task_info in ACTIVE_TASKS.items():
+        # Проверяем время создания каждой задачи (задачи старше WHISPER_TASK_TTL хранилище удаляет само)
+        for task_id in ACTIVE_TASKS.keys():
             # Извлекаем время из ID задачи (формат: task_timestamp_hash)
             try:
                 task_time = int(task_id.split('_')[1])
@@ -224,7 +752,7 @@ async def cleanup_tasks(age_hours: int = 24):
         
         # Удаляем старые задачи
         for task_id in tasks_to_remove:
-            del ACTIVE_TASKS[task_id]
+            ACTIVE_TASKS.delete(task_id)
         
         return {
             "status": "success",
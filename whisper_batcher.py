@@ -0,0 +1,344 @@
+import time
+import threading
+import logging
+from typing import Optional, Callable, List
+
+import numpy as np
+import torch
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_LENGTH_S = 30
+# Перекрытие соседних окон с каждой стороны, как stride_length_s у pipeline (по умолчанию chunk_length_s / 6)
+STRIDE_LENGTH_S = CHUNK_LENGTH_S / 6
+
+
+def split_windows(num_samples: int, chunk_samples: int, stride_samples: int) -> list:
+    """
+    Разбиение записи на окна модели с перекрытием
+
+    Соседние окна перекрываются на 2 * stride_samples; каждому окну принадлежит
+    середина перекрытия с соседом, поэтому слово на границе окна распознается
+    целиком хотя бы в одном из них.
+
+    Returns:
+        Список (начало окна, собственное начало, собственный конец) в отсчетах;
+        у последнего окна собственный конец - None (до конца записи)
+    """
+    step = chunk_samples - 2 * stride_samples
+    starts = [0]
+    while starts[-1] + chunk_samples < num_samples:
+        starts.append(starts[-1] + step)
+
+    windows = []
+    for index, start in enumerate(starts):
+        own_start = start + stride_samples if index > 0 else 0
+        own_end = start + chunk_samples - stride_samples if index < len(starts) - 1 else None
+        windows.append((start, own_start, own_end))
+    return windows
+
+
+def own_segments(segments: list, own_start: float, own_end: float) -> list:
+    """Сегменты окна, середина которых лежит в его собственной части [own_start, own_end); own_end=None - без границы"""
+    kept = []
+    for segment in segments:
+        middle = (segment['timestamp'][0] + segment['timestamp'][1]) / 2
+        if own_start <= middle and (own_end is None or middle < own_end):
+            kept.append(segment)
+    return kept
+
+
+class BatchJob:
+    """Задача транскрипции, разбитая на 30-секундные фрагменты с перекрытием"""
+
+    def __init__(self, total_chunks: int, on_chunk: Optional[Callable[[int, int, list], None]] = None):
+        self.total_chunks = total_chunks
+        self.on_chunk = on_chunk
+        self._results = {}
+        self._confidences = {}
+        self._error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _set_chunk_result(self, index: int, segments: list, confidence: Optional[float] = None):
+        if self._error is not None:
+            return
+        with self._lock:
+            self._results[index] = segments
+            if confidence is not None:
+                self._confidences[index] = confidence
+            completed = len(self._results)
+        if self.on_chunk:
+            try:
+                self.on_chunk(completed, self.total_chunks, segments)
+            except Exception as e:
+                logger.error(f"Ошибка в обработчике фрагмента: {e}")
+        if completed == self.total_chunks:
+            self._done.set()
+
+    def _set_error(self, error: Exception):
+        self._error = error
+        self._done.set()
+
+    def result(self, timeout: Optional[float] = None) -> dict:
+        """
+        Ожидание завершения и сборка результата в формате pipeline ({'text', 'chunks'})
+
+        Если планировщик оценивает уверенность, в результат добавляется
+        'confidence' - средняя вероятность выбранных токенов по фрагментам.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Превышено время ожидания транскрипции")
+        if self._error is not None:
+            raise self._error
+
+        chunks = []
+        for index in range(self.total_chunks):
+            for segment in self._results.get(index, []):
+                # Фраза на стыке окон, распознанная в обоих, остается один раз
+                if chunks and segment['text'].strip() and segment['text'].strip() == chunks[-1]['text'].strip():
+                    continue
+                chunks.append(segment)
+        text = " ".join(chunk['text'].strip() for chunk in chunks if chunk['text'].strip())
+        result = {'text': text, 'chunks': chunks}
+        if self._confidences:
+            result['confidence'] = round(sum(self._confidences.values()) / len(self._confidences), 4)
+        return result
+
+
+class _ChunkItem:
+    __slots__ = ('job', 'index', 'audio', 'offset', 'own', 'key', 'encoder_state', 'enqueued_at')
+
+    def __init__(self, job, index, audio, offset, own, key, encoder_state=None):
+        self.job = job
+        self.index = index
+        self.audio = audio
+        self.offset = offset
+        self.own = own
+        self.key = key
+        self.encoder_state = encoder_state
+        self.enqueued_at = time.monotonic()
+
+
+class BatchScheduler:
+    """
+    Планировщик, объединяющий 30-секундные фрагменты разных задач в общие батчи модели
+
+    Фрагменты всех поставленных задач попадают в одну очередь. Рабочий поток
+    ждет не дольше max_wait с момента появления самого старого фрагмента,
+    набирает до max_batch_size фрагментов с одинаковыми параметрами генерации
+    (язык, задача) и запускает один вызов model.generate. Результаты
+    раскладываются обратно по задачам с учетом смещения фрагмента.
+
+    Окна соседних фрагментов перекрываются на stride_length_s с каждой стороны
+    (как chunk_length_s/stride_length_s у pipeline): из каждого окна берутся
+    сегменты, середина которых попадает в его собственную часть. Если батч
+    завершился ошибкой, оставшиеся фрагменты тех же задач не распознаются.
+
+    С confidence=True для каждого фрагмента дополнительно считается средняя
+    вероятность выбранных токенов (оценка уверенности модели). С assistant_model
+    фрагменты батча декодируются спекулятивно, по одному: transformers
+    поддерживает assisted generation только для батча из одного элемента.
+    """
+
+    def __init__(self, model, processor, device: str, torch_dtype, max_batch_size: int = 16,
+                 max_wait: float = 0.1, max_new_tokens: int = 128, confidence: bool = False,
+                 assistant_model=None, stride_length_s: float = STRIDE_LENGTH_S):
+        self.model = model
+        self.processor = processor
+        self.device = device
+        self.torch_dtype = torch_dtype
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_new_tokens = max_new_tokens
+        self.confidence = confidence
+        self.assistant_model = assistant_model
+        self.stride_length_s = stride_length_s
+
+        self._pending: List[_ChunkItem] = []
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, audio: np.ndarray, language: Optional[str] = None, task: str = "transcribe",
+               on_chunk: Optional[Callable[[int, int, list], None]] = None, urgent: bool = False,
+               encoder_state: Optional[torch.Tensor] = None) -> BatchJob:
+        """
+        Постановка аудио (float32, 16 кГц) в очередь на распознавание
+
+        Args:
+            audio: массив отсчетов
+            language: код языка Whisper (например, 'ru')
+            task: 'transcribe' или 'translate'
+            on_chunk: вызывается после распознавания каждого фрагмента (готово, всего, сегменты)
+            urgent: поставить фрагменты в начало очереди (потоковое распознавание с микрофона)
+            encoder_state: уже посчитанный выход кодировщика для первого фрагмента
+                (после определения языка), кодировщик для него повторно не запускается
+        """
+        chunk_samples = CHUNK_LENGTH_S * SAMPLE_RATE
+        windows = split_windows(len(audio), chunk_samples, int(self.stride_length_s * SAMPLE_RATE))
+        job = BatchJob(len(windows), on_chunk)
+        key = (language, task)
+
+        items = [_ChunkItem(job, index, audio[start:start + chunk_samples], start / SAMPLE_RATE,
+                            (own_start / SAMPLE_RATE, own_end / SAMPLE_RATE if own_end is not None else None), key)
+                 for index, (start, own_start, own_end) in enumerate(windows)]
+        items[0].encoder_state = encoder_state
+
+        with self._condition:
+            if urgent:
+                self._pending[:0] = items
+            else:
+                self._pending.extend(items)
+            self._condition.notify()
+
+        return job
+
+    def queue_size(self) -> int:
+        """Количество фрагментов, ожидающих обработки"""
+        with self._condition:
+            return len(self._pending)
+
+    def _next_batch(self) -> List[_ChunkItem]:
+        with self._condition:
+            while True:
+                # Фрагменты задач, уже завершившихся ошибкой, не распознаем
+                self._pending = [item for item in self._pending if item.job._error is None]
+                if self._pending:
+                    break
+                self._condition.wait()
+
+            # Ждем заполнения батча, но не дольше max_wait от самого старого фрагмента
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            key = self._pending[0].key
+            batch, rest = [], []
+            for item in self._pending:
+                if item.key == key and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    rest.append(item)
+            self._pending = rest
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results, confidences = self._infer(batch)
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном распознавании: {e}")
+                for job in {id(item.job): item.job for item in batch}.values():
+                    job._set_error(e)
+                continue
+
+            for item, segments, confidence in zip(batch, results, confidences):
+                item.job._set_chunk_result(item.index, segments, confidence)
+
+    def _infer(self, batch: List[_ChunkItem]):
+        language, task = batch[0].key
+        started = time.time()
+
+        features = self.processor.feature_extractor(
+            [np.asarray(item.audio, dtype=np.float32) for item in batch],
+            sampling_rate=SAMPLE_RATE,
+            return_tensors="pt"
+        )
+        input_features = features.input_features.to(self.device, dtype=self.torch_dtype)
+
+        inputs = self._encoder_inputs(batch, input_features)
+        generate_kwargs = dict(
+            language=language,
+            task=task,
+            return_timestamps=True,
+            max_new_tokens=self.max_new_tokens,
+            return_dict_in_generate=self.confidence,
+            output_scores=self.confidence
+        )
+        with torch.inference_mode():
+            if self.assistant_model is None:
+                generated = self.model.generate(**inputs, **generate_kwargs)
+            else:
+                generated = [
+                    self.model.generate(**self._slice_inputs(inputs, i), assistant_model=self.assistant_model,
+                                        **generate_kwargs)[0]
+                    for i in range(len(batch))
+                ]
+
+        confidences = [None] * len(batch)
+        if self.confidence:
+            confidences = self._token_confidence(generated)
+            generated = generated.sequences
+
+        results = []
+        for item, token_ids in zip(batch, generated):
+            decoded = self.processor.tokenizer.decode(token_ids, skip_special_tokens=True, output_offsets=True)
+            duration = len(item.audio) / SAMPLE_RATE
+            segments = []
+            for offset in decoded.get('offsets', []):
+                start, end = offset['timestamp']
+                segments.append({
+                    'text': offset['text'],
+                    'timestamp': (
+                        item.offset + (start or 0.0),
+                        item.offset + (end if end is not None else duration)
+                    )
+                })
+            if not segments and decoded['text'].strip():
+                segments.append({
+                    'text': decoded['text'],
+                    'timestamp': (item.offset, item.offset + duration)
+                })
+            results.append(own_segments(segments, *item.own))
+
+        logger.info(f"Батч из {len(batch)} фрагментов ({len({id(i.job) for i in batch})} задач) "
+                    f"распознан за {time.time() - started:.2f} с")
+        return results, confidences
+
+    def _encoder_inputs(self, batch: List[_ChunkItem], input_features: torch.Tensor) -> dict:
+        """
+        Входы generate: признаки или, если у части фрагментов выход кодировщика
+        уже посчитан, готовые состояния кодировщика для всего батча
+        """
+        if all(item.encoder_state is None for item in batch):
+            return {'input_features': input_features}
+
+        from transformers.modeling_outputs import BaseModelOutput
+
+        missing = [i for i, item in enumerate(batch) if item.encoder_state is None]
+        states = [item.encoder_state for item in batch]
+        if missing:
+            with torch.inference_mode():
+                encoded = self.model.get_encoder()(input_features[missing]).last_hidden_state
+            for i, state in zip(missing, encoded):
+                states[i] = state
+        hidden = torch.stack([state.to(self.device) for state in states])
+        return {'encoder_outputs': BaseModelOutput(last_hidden_state=hidden)}
+
+    @staticmethod
+    def _slice_inputs(inputs: dict, index: int) -> dict:
+        if 'input_features' in inputs:
+            return {'input_features': inputs['input_features'][index:index + 1]}
+        from transformers.modeling_outputs import BaseModelOutput
+        hidden = inputs['encoder_outputs'].last_hidden_state[index:index + 1]
+        return {'encoder_outputs': BaseModelOutput(last_hidden_state=hidden)}
+
+    def _token_confidence(self, generated) -> List[Optional[float]]:
+        """Средняя вероятность выбранного токена по шагам генерации (без заполнения после конца)"""
+        steps = len(generated.scores)
+        if steps == 0:
+            return [None] * len(generated.sequences)
+
+        probs = torch.stack([torch.softmax(scores.float(), dim=-1).max(dim=-1).values
+                             for scores in generated.scores], dim=1)
+        tokens = generated.sequences[:, -steps:]
+        mask = (tokens != self.model.generation_config.pad_token_id).float()
+        return ((probs * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)).tolist()
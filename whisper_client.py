@@ -1,7 +1,12 @@
 import os
 import time
+import json
+import random
+import threading
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
 from typing import Optional, Callable
 
 # Настройка логгера
@@ -11,105 +16,581 @@ logger = logging.getLogger(__name__)
 # URL сервиса Whisper API
 WHISPER_SERVICE_URL = os.environ.get('WHISPER_SERVICE_URL', 'http://127.0.0.1:5001')
 
-def transcribe_with_whisper_api(
-    file_path: str, 
-    language_code: Optional[str] = None, 
-    enable_timestamps: bool = False, 
-    status_callback: Optional[Callable[[int, str], None]] = None
-):
-    """Отправка файла на транскрипцию через Whisper API сервис с улучшенной моделью русского языка"""
-    try:
-        if status_callback:
-            status_callback(5, "Подготовка к отправке файла на транскрипцию с улучшенной моделью для русского языка")
-        
-        # Подготовка данных для запроса
+# Сколько раз повторять отправку, если очередь сервиса заполнена (HTTP 429)
+MAX_QUEUE_RETRIES = int(os.environ.get('WHISPER_MAX_QUEUE_RETRIES', 10))
+
+# Таймаут чтения потока событий: сервис шлет keep-alive каждые 15 с
+EVENTS_READ_TIMEOUT = 60
+
+# Таймауты соединения и чтения ответа (секунды)
+CONNECT_TIMEOUT = float(os.environ.get('WHISPER_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('WHISPER_READ_TIMEOUT', 120))
+
+# Повторы при ошибках соединения и ответах 5xx: число попыток сверх первой и
+# задержка перед первым повтором (далее удваивается, не больше MAX_BACKOFF).
+# POST ставит задачу в очередь сервиса и повторяется, только если соединение
+# не было установлено: иначе та же запись может быть распознана дважды
+MAX_RETRIES = int(os.environ.get('WHISPER_MAX_RETRIES', 3))
+RETRY_BACKOFF = float(os.environ.get('WHISPER_RETRY_BACKOFF', 0.5))
+MAX_BACKOFF = 10.0
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+# Размыкатель цепи: после BREAKER_THRESHOLD неудач подряд запросы к реплике не
+# отправляются BREAKER_RESET секунд, затем пропускается пробный запрос
+BREAKER_THRESHOLD = int(os.environ.get('WHISPER_BREAKER_THRESHOLD', 5))
+BREAKER_RESET = float(os.environ.get('WHISPER_BREAKER_RESET', 30))
+
+# Сколько ждать восстановления сервиса при ожидании задачи, прежде чем сдаться (секунды)
+UNAVAILABLE_TIMEOUT = float(os.environ.get('WHISPER_UNAVAILABLE_TIMEOUT', 300))
+
+# Каталог, общий с сервисом (том uploads): файлы из него передаются по ссылке
+# (/transcribe_ref), а не загружаются по HTTP. У сервиса этот каталог задан той же
+# переменной, путь монтирования может отличаться (пусто - отключено)
+SHARED_DIR = os.environ.get('WHISPER_SHARED_DIR', '')
+
+# Сколько файлов ставить в очередь сервиса одним запросом /transcribe_batch
+BATCH_SUBMIT_SIZE = int(os.environ.get('WHISPER_BATCH_SUBMIT_SIZE', 16))
+
+# Размер пула соединений к каждой реплике
+POOL_SIZE = int(os.environ.get('WHISPER_POOL_SIZE', 32))
+
+
+def _not_sent(error):
+    """Ошибка возникла до отправки запроса: соединение не установлено"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError, ConnectionRefusedError))
+
+
+class WhisperServiceError(Exception):
+    """Сервис Whisper не принял запрос или недоступен"""
+
+
+class CircuitOpenError(WhisperServiceError):
+    """Реплика сервиса признана недоступной, запрос не отправлялся"""
+
+
+class BatchSubmitError(WhisperServiceError):
+    """
+    Часть файлов пакета не поставлена в очередь сервиса
+
+    task_ids - ID задач в порядке файлов пакета, None для не принятых:
+    задачи остальных файлов уже в очереди сервиса и будут выполнены.
+    """
+
+    def __init__(self, message: str, task_ids: list):
+        super().__init__(message)
+        self.task_ids = task_ids
+
+
+class WhisperClient:
+    """
+    Клиент сервиса Whisper с пулом соединений, повторами и размыкателем цепи
+
+    Все запросы идут через одну requests.Session (keep-alive, до POOL_SIZE
+    соединений на реплику) с таймаутами соединения и чтения. Ошибки соединения
+    и ответы 5xx на GET повторяются с экспоненциальной задержкой, POST - только
+    если соединение не удалось установить; после серии неудач
+    реплика на время исключается (CircuitOpenError без сетевого запроса).
+    Клиент потокобезопасен и собирает метрики запросов (metrics()).
+    """
+
+    def __init__(self, service_url: Optional[str] = None, connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 breaker_threshold: int = BREAKER_THRESHOLD, breaker_reset: float = BREAKER_RESET):
+        self.service_url = (service_url or WHISPER_SERVICE_URL).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._breakers = {}  # реплика -> [неудач подряд, время размыкания]
+        self._metrics = {}   # операция -> счетчики
+        self._raw_unsupported = set()  # реплики без /transcribe_raw
+        self._ref_unsupported = set()  # реплики без /transcribe_ref
+        self._batch_unsupported = set()  # реплики без /transcribe_batch
+
+    # Размыкатель цепи и метрики
+
+    def _check_breaker(self, base_url, operation):
+        with self._lock:
+            failures, opened_at = self._breakers.get(base_url, (0, None))
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self.breaker_reset:
+                self._stats(operation)['rejected'] += 1
+                raise CircuitOpenError(f"Ошибка: сервис транскрипции {base_url} недоступен")
+            # Срок истек: пропускаем пробный запрос, остальные ждут его результата
+            self._breakers[base_url] = [failures, time.monotonic()]
+
+    def _record(self, base_url, operation, elapsed, failed):
+        with self._lock:
+            stats = self._stats(operation)
+            stats['requests'] += 1
+            stats['latency_total'] += elapsed
+            stats['latency_max'] = max(stats['latency_max'], elapsed)
+            breaker = self._breakers.setdefault(base_url, [0, None])
+            if failed:
+                stats['errors'] += 1
+                breaker[0] += 1
+                if breaker[0] >= self.breaker_threshold:
+                    if breaker[1] is None:
+                        logger.error(f"Сервис транскрипции {base_url} недоступен, "
+                                     f"запросы приостановлены на {self.breaker_reset:.0f} с")
+                    breaker[1] = time.monotonic()
+            else:
+                breaker[0], breaker[1] = 0, None
+
+    def _stats(self, operation):
+        return self._metrics.setdefault(operation, {
+            'requests': 0, 'errors': 0, 'retries': 0, 'rejected': 0,
+            'latency_total': 0.0, 'latency_max': 0.0
+        })
+
+    def metrics(self) -> dict:
+        """Счетчики по операциям (запросов, ошибок, повторов, задержка) и состояние реплик"""
+        with self._lock:
+            operations = {
+                operation: {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                    'rejected': stats['rejected'],
+                    'latency_avg_ms': round(stats['latency_total'] / stats['requests'] * 1000, 1)
+                    if stats['requests'] else 0.0,
+                    'latency_max_ms': round(stats['latency_max'] * 1000, 1)
+                }
+                for operation, stats in self._metrics.items()
+            }
+            circuits = {url: 'open' if opened_at is not None else 'closed'
+                        for url, (_, opened_at) in self._breakers.items()}
+        return {'operations': operations, 'circuits': circuits}
+
+    # Запросы
+
+    def request(self, method: str, path: str, service_url: Optional[str] = None,
+                files: Optional[dict] = None, timeout=None, **kwargs) -> requests.Response:
+        """
+        Запрос к сервису с повторами при ошибках соединения и ответах 5xx
+
+        Неидемпотентные запросы (POST) повторяются только при ошибке установки
+        соединения: после таймаута чтения или ответа 5xx сервис мог уже принять
+        задачу, и повтор поставил бы ее в очередь второй раз.
+
+        Файлы в files и файл в data перематываются перед каждой попыткой.
+        Если все попытки закончились ответом 5xx, возвращается последний ответ;
+        если ошибкой соединения - она пробрасывается.
+        """
+        base_url = (service_url or self.service_url).rstrip('/')
+        operation = path.strip('/').split('/')[0] or 'root'
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        for attempt in range(self.max_retries + 1):
+            self._check_breaker(base_url, operation)
+            for file_tuple in (files or {}).values():
+                file_tuple[1].seek(0)
+            if hasattr(kwargs.get('data'), 'seek'):
+                kwargs['data'].seek(0)
+
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, f'{base_url}{path}', files=files,
+                                                timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(base_url, operation, time.perf_counter() - started, failed=True)
+                if attempt == self.max_retries or not (idempotent or _not_sent(e)):
+                    raise
+                error = str(e)
+            else:
+                failed = response.status_code >= 500
+                self._record(base_url, operation, time.perf_counter() - started, failed=failed)
+                if not failed or attempt == self.max_retries or not idempotent:
+                    return response
+                error = f"HTTP {response.status_code}"
+
+            # Экспоненциальная задержка со случайной добавкой, чтобы клиенты не повторяли разом
+            delay = min(RETRY_BACKOFF * 2 ** attempt, MAX_BACKOFF) * random.uniform(1, 1.5)
+            with self._lock:
+                self._stats(operation)['retries'] += 1
+            logger.warning(f"Запрос {method} {path} к {base_url} не удался ({error}), повтор через {delay:.1f} с")
+            time.sleep(delay)
+
+    def iter_task_events(self, task_id: str, since: int = 0, service_url: Optional[str] = None):
+        """Чтение потока Server-Sent Events /events/{task_id}; отдает словари состояния задачи"""
+        response = self.request('GET', f'/events/{task_id}', service_url=service_url, params={'since': since},
+                                stream=True, timeout=(self.timeout[0], EVENTS_READ_TIMEOUT))
+        with response:
+            response.raise_for_status()
+
+            data_lines = []
+            for raw_line in response.iter_lines():
+                line = raw_line.decode('utf-8')
+                if not line:
+                    # Пустая строка завершает событие
+                    if data_lines:
+                        yield json.loads("\n".join(data_lines))
+                        data_lines = []
+                elif line.startswith('data:'):
+                    data_lines.append(line[5:].lstrip())
+                # Комментарии keep-alive (':') и прочие поля пропускаем
+
+    def _shared_path(self, file_path):
+        """Путь файла относительно SHARED_DIR или None, если файл вне общего каталога"""
+        if not SHARED_DIR:
+            return None
+        root = os.path.realpath(SHARED_DIR)
+        full_path = os.path.realpath(file_path)
+        if os.path.commonpath([root, full_path]) != root or full_path == root:
+            return None
+        return os.path.relpath(full_path, root)
+
+    def _submit_ref(self, file_path, params, base_url):
+        """Передача файла по ссылке; None, если сервис не может прочитать файл из общего каталога"""
+        shared_path = self._shared_path(file_path)
+        if shared_path is None or base_url in self._ref_unsupported:
+            return None
+
+        response = self.request('POST', '/transcribe_ref', service_url=base_url, json={
+            'path': shared_path,
+            'language': params.get('language'),
+            'timestamps': params['timestamps'] == 'true',
+            'quality': params.get('quality', 'auto')
+        })
+        if response.status_code in (404, 405):
+            # Старая версия сервиса или передача по ссылке отключена
+            logger.warning(f"Сервис {base_url} не принимает файлы по ссылке, переход на загрузку по HTTP")
+            self._ref_unsupported.add(base_url)
+            return None
+        if response.status_code == 403:
+            # Сервис не видит файл: каталог смонтирован иначе или файл еще не виден
+            logger.warning(f"Сервис {base_url} не нашел {shared_path} в общем каталоге, загрузка по HTTP")
+            return None
+        return response
+
+    def _post_file(self, file, filename, params, service_url):
+        """Потоковая отправка файла; multipart /transcribe - для сервиса без /transcribe_raw"""
+        base_url = (service_url or self.service_url).rstrip('/')
+        if base_url not in self._raw_unsupported:
+            response = self.request('POST', '/transcribe_raw', service_url=base_url, data=file,
+                                    params=dict(params, filename=filename),
+                                    headers={'Content-Type': 'application/octet-stream'})
+            if response.status_code not in (404, 405):
+                return response
+            logger.info(f"Сервис {base_url} не поддерживает /transcribe_raw, отправка через multipart")
+            self._raw_unsupported.add(base_url)
+
+        return self.request('POST', '/transcribe', service_url=base_url,
+                            files={'file': (filename, file)}, data=params)
+
+    def submit(self, file_path: str, language_code: Optional[str] = None, enable_timestamps: bool = False,
+               service_url: Optional[str] = None,
+               status_callback: Optional[Callable[[int, str], None]] = None) -> dict:
+        """
+        Отправка файла на транскрипцию; возвращает ответ сервиса (task_id, model)
+
+        Файл из общего каталога (WHISPER_SHARED_DIR) передается по ссылке, иначе -
+        телом запроса /transcribe_raw, который читается с диска по мере отправки.
+        При заполненной очереди сервиса (HTTP 429) ждет столько, сколько просит
+        сервер. Если файл не принят, выбрасывает WhisperServiceError.
+        """
+        params = {'timestamps': 'true' if enable_timestamps else 'false'}
+        if language_code:
+            params['language'] = language_code
+
+        base_url = (service_url or self.service_url).rstrip('/')
         with open(file_path, 'rb') as file:
-            files = {'file': (os.path.basename(file_path), file)}
-            
-            # Подготовка параметров
-            data = {'timestamps': 'true' if enable_timestamps else 'false'}
-            
-            # Добавляем языковой код, если указан
-            if language_code:
-                data['language'] = language_code
-            
+            for attempt in range(MAX_QUEUE_RETRIES + 1):
+                response = self._submit_ref(file_path, params, base_url)
+                if response is None:
+                    response = self._post_file(file, os.path.basename(file_path), params, base_url)
+                if response.status_code != 429 or attempt == MAX_QUEUE_RETRIES:
+                    break
+
+                retry_after = int(response.headers.get('Retry-After', 5))
+                if status_callback:
+                    status_callback(10, f"Сервер транскрипции перегружен, повтор через {retry_after} с")
+                time.sleep(retry_after)
+
+        if response.status_code != 200:
+            logger.error(f"Ошибка при отправке запроса: {response.text}")
+            raise WhisperServiceError(f"Ошибка сервера транскрипции: {response.status_code}")
+
+        task_data = response.json()
+        if not task_data.get('task_id'):
+            logger.error("Сервер не вернул ID задачи")
+            raise WhisperServiceError("Ошибка сервера транскрипции: не получен ID задачи")
+        return task_data
+
+    def submit_batch(self, items: list, enable_timestamps: bool = False, service_url: Optional[str] = None,
+                     status_callback: Optional[Callable[[int, str], None]] = None) -> list:
+        """
+        Отправка нескольких файлов; items - список (путь, язык). Возвращает ID задач в том же порядке
+
+        Файлы из общего каталога ставятся в очередь сервиса группами по
+        BATCH_SUBMIT_SIZE одним запросом /transcribe_batch, чтобы сервис
+        обрабатывал их одновременно. Иначе (или если сервис не поддерживает
+        пакетную постановку) файлы отправляются по одному через submit().
+
+        Ошибка одной группы (или одного файла) не отменяет остальные: если
+        какие-то файлы не приняты, выбрасывается BatchSubmitError с ID уже
+        поставленных задач.
+        """
+        base_url = (service_url or self.service_url).rstrip('/')
+        task_ids = []
+        errors = []
+
+        def submit_each(group):
+            for path, language in group:
+                try:
+                    task_ids.append(self.submit(path, language, enable_timestamps, base_url,
+                                                status_callback)['task_id'])
+                except (WhisperServiceError, requests.RequestException) as e:
+                    errors.append(e)
+                    task_ids.append(None)
+
+        shared_paths = [self._shared_path(path) for path, _ in items]
+        if None in shared_paths or base_url in self._ref_unsupported or base_url in self._batch_unsupported:
+            submit_each(items)
+        else:
+            for start in range(0, len(items), BATCH_SUBMIT_SIZE):
+                group = items[start:start + BATCH_SUBMIT_SIZE]
+                if base_url in self._batch_unsupported:
+                    submit_each(group)
+                    continue
+                try:
+                    group_ids = self._submit_group(shared_paths[start:start + BATCH_SUBMIT_SIZE], group,
+                                                   enable_timestamps, base_url, status_callback)
+                except (WhisperServiceError, requests.RequestException) as e:
+                    errors.append(e)
+                    task_ids += [None] * len(group)
+                    continue
+                if group_ids is None:
+                    submit_each(group)
+                else:
+                    task_ids += group_ids
+
+        if errors:
+            accepted = len(task_ids) - task_ids.count(None)
+            raise BatchSubmitError(f"{errors[0]} (принято файлов: {accepted} из {len(items)})", task_ids)
+        return task_ids
+
+    def _submit_group(self, shared_paths, group, enable_timestamps, base_url, status_callback):
+        """Постановка группы файлов одним запросом /transcribe_batch; None - отправить файлы по одному"""
+        payload = {'items': [
+            {'path': shared_path, 'language': language, 'timestamps': enable_timestamps}
+            for shared_path, (_, language) in zip(shared_paths, group)
+        ]}
+        for attempt in range(MAX_QUEUE_RETRIES + 1):
+            response = self.request('POST', '/transcribe_batch', service_url=base_url, json=payload)
+            if response.status_code != 429 or attempt == MAX_QUEUE_RETRIES:
+                break
+
+            retry_after = int(response.headers.get('Retry-After', 5))
             if status_callback:
-                status_callback(10, "Отправка файла на сервер транскрипции")
-                
-            # Отправляем запрос
-            response = requests.post(
-                f'{WHISPER_SERVICE_URL}/transcribe',
-                files=files,
-                data=data
-            )
-            
-            # Проверяем ответ
-            if response.status_code != 200:
-                logger.error(f"Ошибка при отправке запроса: {response.text}")
+                status_callback(10, f"Сервер транскрипции перегружен, повтор через {retry_after} с")
+            time.sleep(retry_after)
+
+        if response.status_code in (404, 405):
+            logger.warning(f"Сервис {base_url} не поддерживает пакетную постановку, отправка по одному файлу")
+            self._batch_unsupported.add(base_url)
+            return None
+        if response.status_code == 403:
+            # Сервис не видит файлы группы в общем каталоге
+            return None
+        if response.status_code != 200:
+            logger.error(f"Ошибка при отправке пакета: {response.text}")
+            raise WhisperServiceError(f"Ошибка сервера транскрипции: {response.status_code}")
+        return [task['task_id'] for task in response.json()['tasks']]
+
+    def wait_for_task(
+        self,
+        task_id: str,
+        status_callback: Optional[Callable[[int, str], None]] = None,
+        segment_callback: Optional[Callable[[list], None]] = None,
+        service_url: Optional[str] = None,
+        result_info: Optional[dict] = None
+    ):
+        """
+        Ожидание завершения задачи на сервисе Whisper
+
+        Прогресс и промежуточные сегменты приходят через поток событий по мере
+        изменения; если поток недоступен или оборвался, используется опрос
+        /status/{task_id} с позиции последнего полученного сегмента. Если сервис
+        не отвечает дольше UNAVAILABLE_TIMEOUT, возвращается сообщение об ошибке.
+
+        В result_info, если он передан, записываются модель и язык записи
+        (language, language_probability), о которых сообщил сервис.
+        """
+        last_progress = 20
+        received_segments = 0
+
+        def handle_status(status_data):
+            """Обработка состояния задачи; возвращает (завершено, результат)"""
+            nonlocal last_progress, received_segments
+            current_status = status_data.get('status')
+
+            segments = status_data.get('segments')
+            if segments:
+                received_segments += len(segments)
+                if segment_callback:
+                    segment_callback(segments)
+            progress = status_data.get('progress', 0)
+            message = status_data.get('message', '')
+
+            # Масштабируем прогресс от сервера (0-100) на наш диапазон (20-90)
+            scaled_progress = 20 + int(progress * 0.7)
+
+            if scaled_progress > last_progress:
                 if status_callback:
-                    status_callback(15, f"Ошибка сервера: {response.status_code}")
-                return f"Ошибка сервера транскрипции: {response.status_code}"
-            
-            # Получаем ID задачи
-            task_data = response.json()
-            task_id = task_data.get('task_id')
-            
-            if not task_id:
-                logger.error("Сервер не вернул ID задачи")
+                    status_callback(scaled_progress, message)
+                last_progress = scaled_progress
+            elif current_status == 'queued' and status_data.get('queue_position'):
+                if status_callback:
+                    status_callback(last_progress, f"Задача в очереди, позиция: {status_data['queue_position']}")
+
+            if current_status == 'completed':
+                if status_data.get('model'):
+                    logger.info(f"Задача {task_id} распознана моделью {status_data['model']}")
+                if result_info is not None:
+                    result_info.update({
+                        'model': status_data.get('model'),
+                        'language': status_data.get('language'),
+                        'language_probability': status_data.get('language_probability')
+                    })
+                if status_callback:
+                    status_callback(95, "Транскрипция завершена, обработка результатов")
+                return True, status_data.get('result')
+
+            elif current_status == 'error':
+                if status_callback:
+                    status_callback(90, f"Ошибка: {message}")
+                return True, f"Ошибка при транскрибировании: {message}"
+
+            return False, None
+
+        try:
+            for status_data in self.iter_task_events(task_id, received_segments, service_url):
+                completed, result = handle_status(status_data)
+                if completed:
+                    return result
+        except Exception as e:
+            logger.warning(f"Поток событий недоступен, переход на опрос статуса: {e}")
+
+        unavailable_since = None
+        while True:
+            time.sleep(2)  # Пауза между запросами статуса
+
+            try:
+                status_response = self.request('GET', f'/status/{task_id}', service_url=service_url,
+                                               params={'since': received_segments})
+                error = None if status_response.status_code == 200 else status_response.status_code
+            except (requests.RequestException, WhisperServiceError) as e:
+                error = e
+
+            if error is not None:
+                logger.error(f"Ошибка при проверке статуса: {error}")
+                unavailable_since = unavailable_since or time.monotonic()
+                if time.monotonic() - unavailable_since > UNAVAILABLE_TIMEOUT:
+                    if status_callback:
+                        status_callback(90, "Ошибка: сервис транскрипции недоступен")
+                    return "Ошибка при транскрибировании: сервис транскрипции недоступен"
+                if status_callback:
+                    status_callback(last_progress, f"Ошибка при проверке статуса: {error}")
+                time.sleep(5)  # Увеличиваем паузу при ошибке
+                continue
+
+            unavailable_since = None
+            completed, result = handle_status(status_response.json())
+            if completed:
+                return result
+
+    def transcribe(
+        self,
+        file_path: str,
+        language_code: Optional[str] = None,
+        enable_timestamps: bool = False,
+        status_callback: Optional[Callable[[int, str], None]] = None,
+        segment_callback: Optional[Callable[[list], None]] = None,
+        service_url: Optional[str] = None,
+        result_info: Optional[dict] = None
+    ):
+        """Отправка файла и ожидание результата; при ошибке возвращает строку с ее описанием"""
+        try:
+            if status_callback:
+                status_callback(5, "Подготовка к отправке файла на транскрипцию с улучшенной моделью для русского языка")
+                status_callback(10, "Отправка файла на сервер транскрипции")
+
+            try:
+                task_data = self.submit(file_path, language_code, enable_timestamps, service_url, status_callback)
+            except WhisperServiceError as e:
                 if status_callback:
-                    status_callback(15, "Ошибка: сервер не вернул ID задачи")
-                return "Ошибка сервера транскрипции: не получен ID задачи"
-            
+                    status_callback(15, f"Ошибка: {e}")
+                return str(e)
+
             if status_callback:
                 status_callback(20, f"Файл принят сервером, модель: {task_data.get('model', 'whisper-large-v3-russian')}")
-            
+
             # Ожидаем завершения задачи и получаем результаты
-            completed = False
-            last_progress = 20
-            
-            while not completed:
-                time.sleep(2)  # Пауза между запросами статуса
-                
-                status_response = requests.get(f'{WHISPER_SERVICE_URL}/status/{task_id}')
-                
-                if status_response.status_code != 200:
-                    logger.error(f"Ошибка при проверке статуса: {status_response.text}")
-                    if status_callback:
-                        status_callback(last_progress, f"Ошибка при проверке статуса: {status_response.status_code}")
-                    time.sleep(5)  # Увеличиваем паузу при ошибке
-                    continue
-                
-                status_data = status_response.json()
-                current_status = status_data.get('status')
-                progress = status_data.get('progress', 0)
-                message = status_data.get('message', '')
-                
-                # Масштабируем прогресс от сервера (0-100) на наш диапазон (20-90)
-                scaled_progress = 20 + int(progress * 0.7)
-                
-                if scaled_progress > last_progress:
-                    if status_callback:
-                        status_callback(scaled_progress, message)
-                    last_progress = scaled_progress
-                
-                if current_status == 'completed':
-                    completed = True
-                    result = status_data.get('result')
-                    
-                    if status_callback:
-                        status_callback(95, "Транскрипция завершена, обработка результатов")
-                    
-                    return result
-                
-                elif current_status == 'error':
-                    if status_callback:
-                        status_callback(90, f"Ошибка: {message}")
-                    return f"Ошибка при транскрибировании: {message}"
-            
-            return "Не удалось получить результаты транскрипции"
-        
-    except Exception as e:
-        logger.error(f"Ошибка при взаимодействии с Whisper API: {e}")
-        if status_callback:
-            status_callback(90, f"Ошибка: {str(e)}")
-        return f"Ошибка: {str(e)}"
\ No newline at end of file
+            return self.wait_for_task(task_data['task_id'], status_callback, segment_callback,
+                                      service_url, result_info)
+
+        except Exception as e:
+            logger.error(f"Ошибка при взаимодействии с Whisper API: {e}")
+            if status_callback:
+                status_callback(90, f"Ошибка: {str(e)}")
+            return f"Ошибка: {str(e)}"
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> WhisperClient:
+    """Общий клиент процесса: пул соединений и состояние реплик разделяются между потоками"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WhisperClient()
+        return _default_client
+
+
+def iter_task_events(task_id: str, since: int = 0, service_url: Optional[str] = None):
+    """Чтение потока Server-Sent Events /events/{task_id}; отдает словари состояния задачи"""
+    return get_client().iter_task_events(task_id, since, service_url)
+
+
+def wait_for_task(
+    task_id: str,
+    status_callback: Optional[Callable[[int, str], None]] = None,
+    segment_callback: Optional[Callable[[list], None]] = None,
+    service_url: Optional[str] = None,
+    result_info: Optional[dict] = None
+):
+    """Ожидание завершения задачи на сервисе Whisper (см. WhisperClient.wait_for_task)"""
+    return get_client().wait_for_task(task_id, status_callback, segment_callback, service_url, result_info)
+
+
+def transcribe_with_whisper_api(
+    file_path: str,
+    language_code: Optional[str] = None,
+    enable_timestamps: bool = False,
+    status_callback: Optional[Callable[[int, str], None]] = None,
+    segment_callback: Optional[Callable[[list], None]] = None,
+    service_url: Optional[str] = None,
+    result_info: Optional[dict] = None
+):
+    """
+    Отправка файла на транскрипцию через Whisper API сервис с улучшенной моделью русского языка
+
+    service_url выбирает реплику сервиса (по умолчанию WHISPER_SERVICE_URL).
+    language_code='auto' - язык определяет сервис, он возвращается в result_info.
+    """
+    return get_client().transcribe(file_path, language_code, enable_timestamps, status_callback,
+                                   segment_callback, service_url, result_info)
@@ -0,0 +1,169 @@
+import math
+import time
+import threading
+import logging
+from typing import Optional, Callable
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Границы классов приоритета по длительности аудио (секунды)
+SHORT_AUDIO_SECONDS = 60
+MEDIUM_AUDIO_SECONDS = 600
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена, клиенту следует повторить запрос позже"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Очередь задач заполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class _QueuedJob:
+    __slots__ = ('job_id', 'func', 'args', 'kwargs', 'priority', 'seq', 'enqueued_at')
+
+    def __init__(self, job_id, func, args, kwargs, priority, seq):
+        self.job_id = job_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+
+class JobQueue:
+    """
+    Ограниченная очередь задач с пулом рабочих потоков
+
+    Короткие записи обслуживаются в первую очередь: задачи делятся на классы
+    по длительности аудио, внутри класса порядок FIFO. Чтобы длинные записи
+    не ждали бесконечно, задача, простоявшая дольше aging_seconds, берется
+    вне очереди.
+    """
+
+    def __init__(self, workers: int = 2, max_depth: int = 50, aging_seconds: float = 300):
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.aging_seconds = aging_seconds
+
+        self._pending = []
+        self._running = set()
+        self._seq = 0
+        self._avg_job_seconds = 60.0
+        self._completed = 0
+        self._rejected = 0
+        self._condition = threading.Condition()
+
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"transcribe-worker-{i}", daemon=True).start()
+
+    @staticmethod
+    def priority_for_duration(duration: Optional[float]) -> int:
+        """Класс приоритета: 0 - короткие записи, 1 - средние, 2 - длинные или неизвестные"""
+        if duration is None:
+            return 2
+        if duration <= SHORT_AUDIO_SECONDS:
+            return 0
+        if duration <= MEDIUM_AUDIO_SECONDS:
+            return 1
+        return 2
+
+    def submit(self, job_id: str, func: Callable, *args, duration: Optional[float] = None, **kwargs):
+        """Постановка задачи в очередь; при переполнении выбрасывает QueueFullError"""
+        with self._condition:
+            if len(self._pending) >= self.max_depth:
+                self._rejected += 1
+                raise QueueFullError(self._retry_after_locked())
+
+            self._seq += 1
+            self._pending.append(_QueuedJob(job_id, func, args, kwargs,
+                                            self.priority_for_duration(duration), self._seq))
+            self._condition.notify()
+
+    def submit_many(self, jobs: list):
+        """
+        Постановка нескольких задач одной операцией: либо все, либо ни одной
+
+        jobs - список (job_id, func, args, duration). Задачи встают в очередь
+        подряд и разбираются обработчиками одновременно, поэтому планировщик
+        пакетов модели объединяет их фрагменты. Если места не хватает на все
+        задачи, выбрасывает QueueFullError.
+        """
+        with self._condition:
+            if len(self._pending) + len(jobs) > self.max_depth:
+                self._rejected += len(jobs)
+                raise QueueFullError(self._retry_after_locked())
+
+            for job_id, func, args, duration in jobs:
+                self._seq += 1
+                self._pending.append(_QueuedJob(job_id, func, args, {},
+                                                self.priority_for_duration(duration), self._seq))
+            self._condition.notify_all()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Позиция задачи в очереди (1 - следующая на обработку) или None, если задача не ожидает"""
+        with self._condition:
+            ordered = sorted(self._pending, key=_QueuedJob.sort_key)
+            for index, job in enumerate(ordered):
+                if job.job_id == job_id:
+                    return index + 1
+        return None
+
+    def retry_after(self) -> int:
+        """Оценка времени (в секундах), через которое в очереди освободится место"""
+        with self._condition:
+            return self._retry_after_locked()
+
+    def stats(self) -> dict:
+        """Текущее состояние очереди"""
+        with self._condition:
+            return {
+                "workers": self.workers,
+                "queued": len(self._pending),
+                "running": len(self._running),
+                "max_depth": self.max_depth,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_job_seconds": round(self._avg_job_seconds, 2)
+            }
+
+    def _retry_after_locked(self) -> int:
+        # Одна задача из очереди освобождается примерно раз в avg / workers секунд
+        return max(1, math.ceil(self._avg_job_seconds / self.workers))
+
+    def _take_next_locked(self) -> _QueuedJob:
+        now = time.monotonic()
+        oldest = min(self._pending, key=lambda job: job.seq)
+        if now - oldest.enqueued_at > self.aging_seconds:
+            job = oldest
+        else:
+            job = min(self._pending, key=_QueuedJob.sort_key)
+        self._pending.remove(job)
+        return job
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                job = self._take_next_locked()
+                self._running.add(job.job_id)
+
+            started = time.monotonic()
+            try:
+                job.func(*job.args, **job.kwargs)
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении задачи {job.job_id}: {e}")
+            finally:
+                elapsed = time.monotonic() - started
+                with self._condition:
+                    self._running.discard(job.job_id)
+                    self._completed += 1
+                    # Экспоненциальное скользящее среднее времени обработки
+                    self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
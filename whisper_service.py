@@ -3,11 +3,17 @@ import time
 import tempfile
 import subprocess
 import json
+import wave
+import inspect
 import logging
+import threading
 import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+from transformers import AutoConfig, AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 import numpy as np
 from datetime import datetime
+from whisper_batcher import BatchScheduler
+from transcript_cache import TranscriptCache, hash_bytes, hash_file
+from audio_vad import detect_speech_regions, compact_regions
 
 # Настройка логгера
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -17,12 +23,89 @@ logger = logging.getLogger(__name__)
 MODEL_NAME = os.environ.get('WHISPER_MODEL_NAME', 'antony66/whisper-large-v3-russian')
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 COMPUTE_TYPE = "float16" if torch.cuda.is_available() else "float32"
+# Бэкенд инференса на CPU: 'torch' - исходная модель, 'int8' - динамическое квантование
+# линейных слоев в int8, 'onnx' - модель, экспортированная в ONNX Runtime (пакет optimum[onnxruntime])
+BACKEND = os.environ.get('WHISPER_BACKEND', 'torch').lower()
+if BACKEND not in ('torch', 'int8', 'onnx'):
+    raise ValueError(f"Неизвестный WHISPER_BACKEND: {BACKEND} (ожидается torch, int8 или onnx)")
+if DEVICE == "cuda" and BACKEND != "torch":
+    logger.warning(f"WHISPER_BACKEND={BACKEND} предназначен для CPU, на GPU используется torch")
+    BACKEND = "torch"
 CACHE_DIR = os.environ.get('WHISPER_CACHE_DIR', './models')
 
+# Быстрая модель для коротких записей (например, openai/whisper-small); пусто - только основная модель
+FAST_MODEL_NAME = os.environ.get('WHISPER_FAST_MODEL_NAME', '')
+# Записи не длиннее порога (секунды) распознаются быстрой моделью
+FAST_MAX_DURATION = float(os.environ.get('WHISPER_FAST_MAX_DURATION', 30))
+# При очереди не короче FAST_BUSY_QUEUE_DEPTH задач быстрой модели отдаются записи до FAST_BUSY_MAX_DURATION
+FAST_BUSY_QUEUE_DEPTH = int(os.environ.get('WHISPER_FAST_BUSY_QUEUE_DEPTH', 4))
+FAST_BUSY_MAX_DURATION = float(os.environ.get('WHISPER_FAST_BUSY_MAX_DURATION', 300))
+# Короткая запись с уверенностью быстрой модели ниже порога перераспознается основной
+FAST_MIN_CONFIDENCE = float(os.environ.get('WHISPER_FAST_MIN_CONFIDENCE', 0.7))
+
+# Спекулятивное декодирование: декодер черновой модели (например, distil-whisper/distil-large-v3)
+# предлагает токены, основная модель проверяет их за один проход. Результат совпадает с обычным
+# жадным декодированием; пусто - выключено
+ASSISTANT_MODEL_NAME = os.environ.get('WHISPER_ASSISTANT_MODEL', '')
+if ASSISTANT_MODEL_NAME and BACKEND == "onnx":
+    logger.warning("WHISPER_ASSISTANT_MODEL не поддерживается с WHISPER_BACKEND=onnx и будет проигнорирован")
+    ASSISTANT_MODEL_NAME = ''
+
+# Режим декодирования аудио: 'array' - поток ffmpeg сразу в массив NumPy,
+# 'file' - прежний вариант с временным WAV-файлом
+DECODE_MODE = os.environ.get('WHISPER_DECODE_MODE', 'array')
+# Записи длиннее порога (в секундах) размещаются в memory-mapped файле на диске,
+# а не в оперативной памяти
+MMAP_THRESHOLD_SECONDS = float(os.environ.get('WHISPER_MMAP_THRESHOLD', 1800))
+# Каталог для memory-mapped буферов (по умолчанию - том с моделями, а не tmpfs)
+MMAP_DIR = os.environ.get('WHISPER_MMAP_DIR', CACHE_DIR)
+
+# Пакетный планировщик: фрагменты всех задач объединяются в общие батчи модели
+BATCH_SCHEDULER = os.environ.get('WHISPER_BATCH_SCHEDULER', 'true').lower() == 'true'
+BATCH_SIZE = int(os.environ.get('WHISPER_BATCH_SIZE', 16))
+BATCH_MAX_WAIT = float(os.environ.get('WHISPER_BATCH_MAX_WAIT', 0.1))  # секунды
+MAX_NEW_TOKENS = 128
+
+# Детектор речи: в модель передаются только области речи, тишина пропускается
+VAD_ENABLED = os.environ.get('WHISPER_VAD', 'true').lower() == 'true'
+
+# Кэш результатов распознавания по хэшу декодированного аудио
+RESULT_CACHE_DIR = os.environ.get('WHISPER_RESULT_CACHE_DIR', os.path.join(CACHE_DIR, 'results'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('WHISPER_RESULT_CACHE_MAX_MB', 500)) * 1024 * 1024
+RESULT_CACHE_ENABLED = os.environ.get('WHISPER_RESULT_CACHE', 'true').lower() == 'true'
+
+# Канонический формат входного аудио для Whisper
+SAMPLE_RATE = 16000
+
 # Переменные для ленивой загрузки модели
 model = None
 processor = None
+assistant_model = None
 pipe = None
+scheduler = None
+fast_scheduler = None
+_model_lock = threading.Lock()
+result_cache = TranscriptCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES) if RESULT_CACHE_ENABLED else None
+
+# Каталог с весами в safetensors, общими для процессов-обработчиков (см. whisper_workers)
+shared_weights_dir = None
+
+# Прогрев модели при старте: загрузка и пробное распознавание тишины
+WARMUP = os.environ.get('WHISPER_WARMUP', 'false').lower() == 'true'
+WARMUP_SECONDS = float(os.environ.get('WHISPER_WARMUP_SECONDS', 3))
+
+# Состояние модели для проверки готовности (/ready)
+MODEL_STATE = {
+    "backend": BACKEND,
+    "fast_model": FAST_MODEL_NAME or None,
+    "fast_loaded": False,
+    "assistant_model": ASSISTANT_MODEL_NAME or None,
+    "loaded": False,
+    "load_seconds": None,
+    "warmed_up": False,
+    "warmup_seconds": None,
+    "error": None
+}
 
 def format_time(seconds):
     """Форматирование времени в формат ММ:СС"""
@@ -30,11 +113,48 @@ def format_time(seconds):
     seconds = int(seconds) % 60
     return f"{minutes:02d}:{seconds:02d}"
 
+def is_canonical_wav(file_path):
+    """Проверка, что файл уже является WAV 16 кГц моно 16-bit PCM"""
+    try:
+        with wave.open(file_path, 'rb') as wav_file:
+            return (wav_file.getnchannels() == 1
+                    and wav_file.getsampwidth() == 2
+                    and wav_file.getframerate() == SAMPLE_RATE
+                    and wav_file.getcomptype() == 'NONE')
+    except (wave.Error, EOFError, OSError):
+        return False
+
+def get_audio_duration(file_path):
+    """Длительность аудиофайла в секундах (None, если определить не удалось)"""
+    try:
+        if is_canonical_wav(file_path):
+            with wave.open(file_path, 'rb') as wav_file:
+                return wav_file.getnframes() / wav_file.getframerate()
+        
+        cmd = [
+            'ffprobe', '-v', 'quiet', '-print_format', 'json',
+            '-show_format', file_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        info = json.loads(result.stdout or '{}')
+        duration = info.get('format', {}).get('duration')
+        return float(duration) if duration is not None else None
+    except Exception as e:
+        logger.warning(f"Не удалось определить длительность {file_path}: {e}")
+        return None
+
 def prepare_audio(file_path, status_callback=None):
     """Подготовка аудиофайла для транскрипции"""
     if status_callback:
         status_callback(5, "Подготовка аудиофайла...")
     
+    # Клиент уже прислал канонический PCM - повторная конвертация не нужна
+    if is_canonical_wav(file_path):
+        logger.info(f"Файл {file_path} уже в формате WAV 16 кГц моно, конвертация пропущена")
+        if status_callback:
+            status_callback(10, "Аудиофайл уже в оптимальном формате")
+        return file_path
+    
     try:
         # Создаем временный файл с уникальным именем
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
@@ -82,53 +202,506 @@ def prepare_audio(file_path, status_callback=None):
             status_callback(10, error_msg)
         raise Exception(error_msg)
 
-def load_model():
-    """Ленивая загрузка модели при первом использовании"""
-    global model, processor, pipe
+def _wav_data_offset(file_path):
+    """Поиск смещения и размера блока 'data' в WAV-файле"""
+    with open(file_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f"Файл {file_path} не является WAV")
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"В файле {file_path} не найден блок данных")
+            chunk_id = chunk_header[:4]
+            chunk_size = int.from_bytes(chunk_header[4:], 'little')
+            if chunk_id == b'data':
+                return f.tell(), chunk_size
+            # Блоки RIFF выравниваются по четной границе
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def _mmap_buffer(dtype, length):
+    """Создание анонимного (удаленного с диска) memory-mapped буфера в MMAP_DIR"""
+    os.makedirs(MMAP_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=MMAP_DIR, suffix='.pcm', delete=False) as tmp:
+        buffer_path = tmp.name
+    try:
+        return np.memmap(buffer_path, dtype=dtype, mode='w+', shape=(max(length, 1),))[:length]
+    finally:
+        # Отображение остается действительным, файл исчезнет после освобождения массива
+        os.remove(buffer_path)
+
+def _pcm_to_float32(samples):
+    """Преобразование int16 PCM в float32 [-1, 1] блоками"""
+    if len(samples) > MMAP_THRESHOLD_SECONDS * SAMPLE_RATE:
+        audio = _mmap_buffer(np.float32, len(samples))
+    else:
+        audio = np.empty(len(samples), dtype=np.float32)
     
-    if pipe is None:
-        logger.info(f"Загрузка модели {MODEL_NAME}...")
+    block = SAMPLE_RATE * 60
+    for start in range(0, len(samples), block):
+        np.multiply(samples[start:start + block], np.float32(1.0 / 32768.0),
+                    out=audio[start:start + block], dtype=np.float32)
+    return audio
+
+def decode_audio(file_path, status_callback=None):
+    """
+    Декодирование аудиофайла в массив float32 16 кГц моно без временных WAV-файлов
+    
+    Канонический WAV отображается в память напрямую, остальные форматы
+    декодируются ffmpeg в поток s16le. Длинные записи сбрасываются в
+    memory-mapped буфер в MMAP_DIR вместо оперативной памяти.
+    """
+    if status_callback:
+        status_callback(5, "Декодирование аудиофайла...")
+    
+    try:
+        if is_canonical_wav(file_path):
+            offset, size = _wav_data_offset(file_path)
+            size = min(size, os.path.getsize(file_path) - offset)
+            samples = np.memmap(file_path, dtype='<i2', mode='r', offset=offset, shape=(size // 2,))
+            logger.info(f"Файл {file_path} уже в формате WAV 16 кГц моно, отображен в память")
+        else:
+            logger.info(f"Декодирование файла {file_path} через ffmpeg в массив NumPy...")
+            cmd = [
+                'ffmpeg', '-nostdin',
+                '-i', file_path,
+                '-vn',
+                '-f', 's16le',
+                '-acodec', 'pcm_s16le',
+                '-ac', '1',
+                '-ar', str(SAMPLE_RATE),
+                '-hide_banner',
+                '-loglevel', 'error',
+                'pipe:1'
+            ]
+            samples = _read_ffmpeg_pcm(cmd)
+        
+        if len(samples) == 0:
+            raise Exception("Ошибка: декодированное аудио не содержит данных")
+        
+        audio = _pcm_to_float32(samples)
+        
+        if status_callback:
+            status_callback(10, "Аудиофайл успешно подготовлен")
+        
+        logger.info(f"Аудио декодировано: {len(audio) / SAMPLE_RATE:.1f} с")
+        return audio
+    
+    except Exception as e:
+        error_msg = f"Ошибка при подготовке аудио: {str(e)}"
+        logger.error(error_msg)
+        if status_callback:
+            status_callback(10, error_msg)
+        raise Exception(error_msg)
+
+def _read_ffmpeg_pcm(cmd, read_size=1024 * 1024):
+    """Чтение s16le-потока ffmpeg в массив int16, с выгрузкой длинных записей на диск"""
+    spill_limit = int(MMAP_THRESHOLD_SECONDS * SAMPLE_RATE * 2)
+    blocks = []
+    total = 0
+    spill_file = None
+    
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(read_size)
+            if not data:
+                break
+            total += len(data)
+            if spill_file is None and total > spill_limit:
+                # Запись длинная - переносим уже прочитанное в файл на диске
+                os.makedirs(MMAP_DIR, exist_ok=True)
+                spill_file = tempfile.TemporaryFile(dir=MMAP_DIR)
+                for block in blocks:
+                    spill_file.write(block)
+                blocks = []
+            if spill_file is not None:
+                spill_file.write(data)
+            else:
+                blocks.append(data)
+        
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise Exception(f"Ошибка при конвертации аудио: {stderr.decode(errors='ignore')}")
+        
+        if spill_file is None:
+            return np.frombuffer(b''.join(blocks), dtype='<i2')
         
+        spill_file.flush()
+        return np.memmap(spill_file, dtype='<i2', mode='r', shape=(total // 2,))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        if spill_file is not None:
+            spill_file.close()
+
+def export_shared_weights():
+    """
+    Однократное сохранение весов модели в safetensors с рабочим типом данных
+    
+    Процессы-обработчики отображают этот файл в память, поэтому страницы с
+    весами делятся между ними через страничный кэш, а не копируются в каждый процесс.
+    
+    Для бэкенда onnx вместо этого один раз выполняется экспорт в ONNX.
+    
+    Returns:
+        Путь к каталогу с весами и процессором (None для бэкенда onnx)
+    """
+    if BACKEND == 'onnx':
+        export_onnx_model()
+        return None
+    
+    target_dir = os.path.join(CACHE_DIR, 'shared', f"{MODEL_NAME.replace('/', '--')}-{COMPUTE_TYPE}")
+    if os.path.isdir(target_dir) and any(name.endswith('.safetensors') for name in os.listdir(target_dir)):
+        return target_dir
+    
+    logger.info(f"Экспорт весов {MODEL_NAME} в {target_dir} для общего доступа процессов...")
+    export_model = AutoModelForSpeechSeq2Seq.from_pretrained(
+        MODEL_NAME,
+        torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+        low_cpu_mem_usage=True,
+        use_safetensors=True,
+        cache_dir=CACHE_DIR
+    )
+    export_processor = AutoProcessor.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
+    
+    # Сохраняем во временный каталог и переименовываем, чтобы не оставить половину файлов
+    tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+    export_model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size="100GB")
+    export_processor.save_pretrained(tmp_dir)
+    os.replace(tmp_dir, target_dir)
+    del export_model
+    
+    return target_dir
+
+def _assign_state_dict(target, state_dict):
+    """
+    Подстановка тензоров в модель без копирования для torch < 2.1
+    
+    В этих версиях у load_state_dict нет параметра assign (базовый образ
+    Dockerfile_whisper собран на torch 2.0), поэтому параметры и буферы
+    заменяются в модулях напрямую. Ключи, которых нет в модели, пропускаются,
+    как при strict=False.
+    """
+    for name, tensor in state_dict.items():
+        module_name, _, attr = name.rpartition('.')
         try:
-            # Загружаем модель и процессор
-            model = AutoModelForSpeechSeq2Seq.from_pretrained(
-                MODEL_NAME,
-                torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
-                low_cpu_mem_usage=True,
-                use_safetensors=True,
-                cache_dir=CACHE_DIR
-            )
-            model.to(DEVICE)
-            
-            processor = AutoProcessor.from_pretrained(
-                MODEL_NAME,
-                cache_dir=CACHE_DIR
-            )
+            module = target.get_submodule(module_name)
+        except AttributeError:
+            continue
+        if attr in module._parameters:
+            module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        elif attr in module._buffers:
+            module._buffers[attr] = tensor
+
+def _load_shared_model(weights_dir):
+    """Сборка модели поверх memory-mapped тензоров safetensors без копирования весов"""
+    from safetensors.torch import load_file
+    
+    config = AutoConfig.from_pretrained(weights_dir)
+    with torch.device("meta"):
+        shared_model = AutoModelForSpeechSeq2Seq.from_config(
+            config,
+            torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32
+        )
+    
+    state_dict = {}
+    for name in sorted(os.listdir(weights_dir)):
+        if name.endswith('.safetensors'):
+            state_dict.update(load_file(os.path.join(weights_dir, name)))
+    
+    # assign=True подставляет отображенные в память тензоры вместо копирования
+    if 'assign' in inspect.signature(torch.nn.Module.load_state_dict).parameters:
+        shared_model.load_state_dict(state_dict, strict=False, assign=True)
+    else:
+        _assign_state_dict(shared_model, state_dict)
+    shared_model.tie_weights()
+    
+    if any(t.is_meta for t in list(shared_model.parameters()) + list(shared_model.buffers())):
+        raise RuntimeError("Не все веса модели найдены в общем файле safetensors")
+    
+    shared_model.eval()
+    return shared_model
+
+def _quantize_int8(float_model):
+    """Динамическое квантование: веса линейных слоев в int8, активации квантуются на лету"""
+    quantized = torch.quantization.quantize_dynamic(float_model, {torch.nn.Linear}, dtype=torch.qint8)
+    quantized.eval()
+    return quantized
+
+def _ort_model_class():
+    try:
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+    except ImportError:
+        raise RuntimeError("Для WHISPER_BACKEND=onnx нужен пакет optimum[onnxruntime]")
+    return ORTModelForSpeechSeq2Seq
+
+def export_onnx_model():
+    """Однократный экспорт модели в ONNX (кодировщик и декодер) в CACHE_DIR/onnx"""
+    onnx_dir = os.path.join(CACHE_DIR, 'onnx', MODEL_NAME.replace('/', '--'))
+    if os.path.isdir(onnx_dir) and any(name.endswith('.onnx') for name in os.listdir(onnx_dir)):
+        return onnx_dir
+    
+    logger.info(f"Экспорт {MODEL_NAME} в ONNX ({onnx_dir})...")
+    exported = _ort_model_class().from_pretrained(MODEL_NAME, export=True, cache_dir=CACHE_DIR)
+    
+    # Сохраняем во временный каталог и переименовываем, чтобы не оставить половину файлов
+    os.makedirs(os.path.dirname(onnx_dir), exist_ok=True)
+    tmp_dir = f"{onnx_dir}.tmp-{os.getpid()}"
+    exported.save_pretrained(tmp_dir)
+    os.replace(tmp_dir, onnx_dir)
+    del exported
+    
+    return onnx_dir
+
+def _load_onnx_model():
+    """Загрузка модели в ONNX Runtime (при первом запуске с экспортом)"""
+    return _ort_model_class().from_pretrained(export_onnx_model(), provider="CPUExecutionProvider")
+
+def _load_assistant_model(main_model):
+    """
+    Черновая модель для спекулятивного декодирования
+    
+    Загружается только декодер (WhisperForCausalLM): вместо собственного
+    кодировщика он получает выходы кодировщика основной модели, поэтому
+    аудио кодируется один раз и для черновика, и для проверки.
+    """
+    from transformers import WhisperForCausalLM
+    
+    draft = WhisperForCausalLM.from_pretrained(
+        ASSISTANT_MODEL_NAME,
+        torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+        low_cpu_mem_usage=True,
+        cache_dir=CACHE_DIR
+    )
+    if draft.config.d_model != main_model.config.d_model:
+        raise RuntimeError(f"Размерность {ASSISTANT_MODEL_NAME} ({draft.config.d_model}) не совпадает "
+                           f"с основной моделью ({main_model.config.d_model})")
+    draft.to(DEVICE)
+    draft.eval()
+    return draft
+
+def load_model():
+    """Ленивая загрузка модели при первом использовании"""
+    global model, processor, assistant_model, pipe
+    
+    with _model_lock:
+        if pipe is None:
+            logger.info(f"Загрузка модели {MODEL_NAME}...")
+            load_started = time.time()
             
-            # Создаем pipeline
-            pipe = pipeline(
-                "automatic-speech-recognition",
-                model=model,
-                tokenizer=processor.tokenizer,
-                feature_extractor=processor.feature_extractor,
-                chunk_length_s=30,
-                batch_size=16,
-                torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
-                device=DEVICE,
-                generate_kwargs={
-                    "max_new_tokens": 128,
+            try:
+                # Загружаем модель и процессор
+                if BACKEND == "onnx":
+                    model = _load_onnx_model()
+                    processor = AutoProcessor.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
+                elif shared_weights_dir and DEVICE == "cpu":
+                    model = _load_shared_model(shared_weights_dir)
+                    processor = AutoProcessor.from_pretrained(shared_weights_dir)
+                else:
+                    model = AutoModelForSpeechSeq2Seq.from_pretrained(
+                        MODEL_NAME,
+                        torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+                        low_cpu_mem_usage=True,
+                        use_safetensors=True,
+                        cache_dir=CACHE_DIR
+                    )
+                    model.to(DEVICE)
+                    
+                    processor = AutoProcessor.from_pretrained(
+                        MODEL_NAME,
+                        cache_dir=CACHE_DIR
+                    )
+                
+                if BACKEND == "int8":
+                    model = _quantize_int8(model)
+                
+                generate_kwargs = {
+                    "max_new_tokens": MAX_NEW_TOKENS,
                     "language": "ru",
                     "task": "transcribe",
                     "return_timestamps": True
                 }
+                if ASSISTANT_MODEL_NAME:
+                    assistant_model = _load_assistant_model(model)
+                    generate_kwargs["assistant_model"] = assistant_model
+                
+                # Создаем pipeline
+                pipe = pipeline(
+                    "automatic-speech-recognition",
+                    model=model,
+                    tokenizer=processor.tokenizer,
+                    feature_extractor=processor.feature_extractor,
+                    chunk_length_s=30,
+                    # Спекулятивное декодирование в transformers работает только с батчем из одного фрагмента
+                    batch_size=1 if assistant_model is not None else 16,
+                    torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+                    device=DEVICE,
+                    generate_kwargs=generate_kwargs
+                )
+                
+                MODEL_STATE["loaded"] = True
+                MODEL_STATE["load_seconds"] = round(time.time() - load_started, 2)
+                MODEL_STATE["error"] = None
+                logger.info(f"Модель {MODEL_NAME} успешно загружена на устройство {DEVICE} с типом {COMPUTE_TYPE}, "
+                            f"бэкенд {BACKEND}, черновая модель {ASSISTANT_MODEL_NAME or 'нет'}, "
+                            f"за {MODEL_STATE['load_seconds']} с")
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке модели: {e}")
+                MODEL_STATE["error"] = str(e)
+                raise RuntimeError(f"Не удалось загрузить модель: {str(e)}")
+    
+    return pipe
+
+def get_scheduler():
+    """Ленивое создание общего пакетного планировщика поверх загруженной модели"""
+    global scheduler
+    
+    load_model()
+    with _model_lock:
+        if scheduler is None:
+            scheduler = BatchScheduler(
+                model,
+                processor,
+                device=DEVICE,
+                torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+                max_batch_size=BATCH_SIZE,
+                max_wait=BATCH_MAX_WAIT,
+                max_new_tokens=MAX_NEW_TOKENS,
+                assistant_model=assistant_model
+            )
+            logger.info(f"Пакетный планировщик запущен: батч {BATCH_SIZE}, ожидание {BATCH_MAX_WAIT} с")
+    
+    return scheduler
+
+def get_fast_scheduler():
+    """
+    Ленивая загрузка быстрой модели и ее планировщика
+    
+    Быстрая модель всегда работает через планировщик, который оценивает
+    уверенность распознавания. Бэкенд onnx к ней не применяется.
+    """
+    global fast_scheduler
+    
+    with _model_lock:
+        if fast_scheduler is None:
+            logger.info(f"Загрузка быстрой модели {FAST_MODEL_NAME}...")
+            fast_model = AutoModelForSpeechSeq2Seq.from_pretrained(
+                FAST_MODEL_NAME,
+                torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+                low_cpu_mem_usage=True,
+                cache_dir=CACHE_DIR
             )
+            fast_model.to(DEVICE)
+            fast_model.eval()
+            if BACKEND == "int8":
+                fast_model = _quantize_int8(fast_model)
+            fast_processor = AutoProcessor.from_pretrained(FAST_MODEL_NAME, cache_dir=CACHE_DIR)
             
-            logger.info(f"Модель {MODEL_NAME} успешно загружена на устройство {DEVICE} с типом {COMPUTE_TYPE}")
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке модели: {e}")
-            raise RuntimeError(f"Не удалось загрузить модель: {str(e)}")
+            fast_scheduler = BatchScheduler(
+                fast_model,
+                fast_processor,
+                device=DEVICE,
+                torch_dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32,
+                max_batch_size=BATCH_SIZE,
+                max_wait=BATCH_MAX_WAIT,
+                max_new_tokens=MAX_NEW_TOKENS,
+                confidence=True
+            )
+            MODEL_STATE["fast_loaded"] = True
+            logger.info(f"Быстрая модель {FAST_MODEL_NAME} загружена")
     
-    return pipe
+    return fast_scheduler
+
+def choose_model_tier(duration, quality="auto", queue_depth=0):
+    """
+    Выбор модели для задачи
+    
+    Args:
+        duration: длительность записи в секундах (None - неизвестна)
+        quality: 'auto' - по правилам ниже, 'fast' - быстрая модель, 'high' - основная
+        queue_depth: число задач, ожидающих в очереди сервиса
+        
+    Returns:
+        'fast' или 'large'
+    """
+    # Быстрая модель работает только с декодированным в память аудио
+    if not FAST_MODEL_NAME or DECODE_MODE != 'array' or quality == "high":
+        return "large"
+    if quality == "fast":
+        return "fast"
+    if duration is None:
+        return "large"
+    if duration <= FAST_MAX_DURATION:
+        return "fast"
+    # Под нагрузкой основную модель оставляем для длинных записей
+    if queue_depth >= FAST_BUSY_QUEUE_DEPTH and duration <= FAST_BUSY_MAX_DURATION:
+        return "fast"
+    return "large"
+
+def model_for_tier(tier):
+    """Имя модели для уровня, выбранного choose_model_tier"""
+    return FAST_MODEL_NAME if tier == "fast" else MODEL_NAME
+
+def warmup_model(seconds=WARMUP_SECONDS):
+    """
+    Загрузка модели и пробное распознавание нескольких секунд тишины
+    
+    Первый вызов generate включает разовые затраты (инициализация ядер,
+    выделение памяти), поэтому прогрев идет тем же путем, что и реальные задачи.
+    """
+    try:
+        load_model()
+        silence = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+        
+        warmup_started = time.time()
+        if BATCH_SCHEDULER and DECODE_MODE == 'array':
+            get_scheduler().submit(silence, language="ru", task="transcribe").result()
+        else:
+            pipe({"raw": silence, "sampling_rate": SAMPLE_RATE}, return_timestamps=True)
+        if FAST_MODEL_NAME:
+            get_fast_scheduler().submit(silence, language="ru", task="transcribe").result()
+        
+        MODEL_STATE["warmed_up"] = True
+        MODEL_STATE["warmup_seconds"] = round(time.time() - warmup_started, 2)
+        logger.info(f"Прогрев модели завершен за {MODEL_STATE['warmup_seconds']} с")
+    except Exception as e:
+        logger.error(f"Ошибка при прогреве модели: {e}")
+        MODEL_STATE["error"] = str(e)
+    
+    return dict(MODEL_STATE)
+
+def transcribe_array(audio, language="ru", urgent=False, fast=False):
+    """
+    Распознавание короткого фрагмента (до 30 с) из массива float32 16 кГц
+    
+    Используется потоковым распознаванием; urgent ставит фрагмент в начало
+    очереди планировщика, впереди фрагментов файловых задач; fast отдает
+    фрагмент быстрой модели, если она настроена.
+    """
+    if fast and FAST_MODEL_NAME:
+        result = get_fast_scheduler().submit(audio, language=language, task="transcribe", urgent=urgent).result()
+        return result.get('text', '').strip()
+    
+    asr_pipeline = load_model()
+    if BATCH_SCHEDULER:
+        result = get_scheduler().submit(audio, language=language, task="transcribe", urgent=urgent).result()
+    else:
+        result = asr_pipeline(
+            {"raw": audio, "sampling_rate": SAMPLE_RATE},
+            generate_kwargs={"language": language, "task": "transcribe"}
+        )
+    return result.get('text', '').strip()
+
+def is_ready():
+    """Готовность к приему трафика: модель загружена и, если включен прогрев, прогрета"""
+    if not WARMUP:
+        # Ленивая загрузка: сервис принимает задачи сразу, модель загрузится при первой
+        return True
+    return MODEL_STATE["loaded"] and MODEL_STATE["warmed_up"]
 
 def detect_speakers(segments, min_pause=1.0):
     """
@@ -157,26 +730,200 @@ def detect_speakers(segments, min_pause=1.0):
     
     return speakers
 
-def transcribe_with_whisper(file_path, language_code=None, enable_timestamps=False, status_callback=None):
-    """Транскрибирование с использованием модели whisper-large-v3-russian"""
+def _read_audio_head(file_path, seconds=30):
+    """Первые seconds секунд файла в виде массива float32 16 кГц"""
+    cmd = [
+        'ffmpeg', '-nostdin',
+        '-i', file_path,
+        '-t', str(seconds),
+        '-vn',
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ac', '1',
+        '-ar', str(SAMPLE_RATE),
+        '-hide_banner',
+        '-loglevel', 'error',
+        'pipe:1'
+    ]
+    return _pcm_to_float32(_read_ffmpeg_pcm(cmd))
+
+def detect_language(audio, asr_model, asr_processor):
+    """
+    Определение языка встроенным классификатором Whisper по первым 30 с записи
+    
+    Кодировщик запускается один раз; вероятность языка берется из первого
+    шага декодера (распределение по токенам языков).
+    
+    Returns:
+        (код языка Whisper, вероятность, выход кодировщика первого фрагмента или None для onnx)
+    """
+    lang_to_id = getattr(asr_model.generation_config, 'lang_to_id', None)
+    if not lang_to_id:
+        raise RuntimeError("Модель не поддерживает определение языка")
+    
+    head = np.asarray(audio[:30 * SAMPLE_RATE], dtype=np.float32)
+    features = asr_processor.feature_extractor(head, sampling_rate=SAMPLE_RATE, return_tensors="pt").input_features
+    decoder_input_ids = torch.tensor([[asr_model.generation_config.decoder_start_token_id]])
+    
+    encoder_state = None
+    with torch.inference_mode():
+        if isinstance(asr_model, torch.nn.Module):
+            features = features.to(DEVICE, dtype=torch.float16 if COMPUTE_TYPE == "float16" else torch.float32)
+            encoder_state = asr_model.get_encoder()(features).last_hidden_state
+            logits = asr_model(encoder_outputs=(encoder_state,),
+                               decoder_input_ids=decoder_input_ids.to(DEVICE)).logits
+        else:
+            # ONNX Runtime: кодировщик внутри модели, его выход не переиспользуется
+            logits = asr_model(input_features=features, decoder_input_ids=decoder_input_ids).logits
+    
+    language_tokens = list(lang_to_id)
+    scores = logits[0, -1, [lang_to_id[token] for token in language_tokens]].float()
+    probs = torch.softmax(scores, dim=-1)
+    best = int(probs.argmax())
+    language = language_tokens[best].strip('<|>')
+    return language, round(float(probs[best]), 4), encoder_state[0] if encoder_state is not None else None
+
+def _detect_language_for_tier(tier, audio):
+    """
+    Определение языка моделью выбранного уровня
+    
+    Выход кодировщика возвращается только если распознавание пойдет через
+    планировщик, который умеет его принять (иначе None).
+    """
+    if tier == "fast":
+        fast = get_fast_scheduler()
+        return detect_language(audio, fast.model, fast.processor)
+    
+    load_model()
+    language, probability, encoder_state = detect_language(audio, model, processor)
+    if not (BATCH_SCHEDULER and DECODE_MODE == 'array'):
+        encoder_state = None
+    return language, probability, encoder_state
+
+def _transcribe_large(audio, pipeline_input, language, on_chunk, encoder_state=None):
+    """Распознавание основной моделью: через пакетный планировщик или pipeline"""
+    if BATCH_SCHEDULER and DECODE_MODE == 'array':
+        # Фрагменты задачи объединяются в общие батчи с фрагментами других запросов
+        return get_scheduler().submit(
+            audio,
+            language=language,
+            task="transcribe",
+            on_chunk=on_chunk,
+            encoder_state=encoder_state
+        ).result()
+    
+    return load_model()(
+        pipeline_input,
+        return_timestamps=True,
+        generate_kwargs={
+            "language": language,
+            "task": "transcribe"
+        }
+    )
+
+def transcribe_with_whisper(file_path, language_code=None, enable_timestamps=False, status_callback=None,
+                            segment_callback=None, quality="auto", queue_depth=0, result_info=None):
+    """
+    Транскрибирование с использованием модели whisper-large-v3-russian
+    
+    segment_callback(segments, done, total) получает сегменты каждого 30-секундного
+    фрагмента сразу после его распознавания (сегмент: text, start, end, start_time);
+    работает при включенном пакетном планировщике.
+    
+    Модель выбирается по длительности записи, quality и глубине очереди
+    (см. choose_model_tier). В словарь result_info, если он передан,
+    записываются использованная модель, ее уровень, уверенность быстрой
+    модели, признак перераспознавания основной моделью и язык записи.
+    
+    language_code='auto' включает определение языка по первым 30 с записи;
+    язык и его вероятность возвращаются в result_info.
+    """
     try:
         if status_callback:
             status_callback(15, f"Запуск транскрипции с {MODEL_NAME}")
         
-        # Подготовка аудиофайла
-        prepared_file = prepare_audio(file_path, status_callback)
+        # Подготовка аудио: поток ffmpeg в массив NumPy либо временный WAV-файл
+        if DECODE_MODE == 'array':
+            audio = decode_audio(file_path, status_callback)
+        else:
+            prepared_file = prepare_audio(file_path, status_callback)
+        
+        # При 'auto' язык определяется ниже, а в ключе кэша остается 'auto'
+        auto_language = bool(language_code) and language_code.lower() == "auto"
+        if auto_language:
+            whisper_language = "auto"
+        else:
+            whisper_language = language_code[:2].lower() if language_code else "ru"
+        language_probability = None
+        
+        # Выбор модели по длительности всей записи (до пропуска тишины), чтобы ключ кэша не зависел от VAD
+        duration = len(audio) / SAMPLE_RATE if DECODE_MODE == 'array' else None
+        tier = choose_model_tier(duration, quality, queue_depth)
+        tier_model_name = model_for_tier(tier)
+        # Короткую запись быстрая модель распознает за доли секунды; при низкой уверенности
+        # она перераспознается основной, поэтому промежуточные сегменты не отправляются
+        may_escalate = tier == "fast" and quality == "auto" and duration <= FAST_MAX_DURATION
+        logger.info(f"Модель для {file_path}: {tier_model_name} ({tier})")
+        
+        # Поиск готового результата по хэшу декодированного аудио, модели и языку.
+        # Кэшируется сырой результат модели, поэтому запись подходит для вывода
+        # как с таймкодами, так и без них
+        cached_result = None
+        if result_cache is not None:
+            content_hash = hash_bytes(audio) if DECODE_MODE == 'array' else hash_file(prepared_file)
+            cache_key = TranscriptCache.make_key(content_hash, model=tier_model_name, language=whisper_language,
+                                                 vad=VAD_ENABLED, backend=BACKEND)
+            cached_result = result_cache.get(cache_key)
+            if cached_result is not None:
+                logger.info(f"Результат для {file_path} найден в кэше")
+                if status_callback:
+                    status_callback(90, "Результат найден в кэше")
+        
+        # Пропуск тишины: склеиваем области речи, таймкоды потом возвращаем на исходную шкалу
+        timeline = None
+        if cached_result is None and VAD_ENABLED and DECODE_MODE == 'array':
+            regions = detect_speech_regions(audio, SAMPLE_RATE)
+            speech_samples = sum(end - start for start, end in regions)
+            logger.info(f"Речь: {len(regions)} областей, {speech_samples / SAMPLE_RATE:.1f} с "
+                        f"из {len(audio) / SAMPLE_RATE:.1f} с")
+            if status_callback:
+                status_callback(18, f"Речь занимает {speech_samples / max(len(audio), 1):.0%} записи")
+            
+            buffer = None
+            if speech_samples > MMAP_THRESHOLD_SECONDS * SAMPLE_RATE:
+                buffer = _mmap_buffer(np.float32, speech_samples)
+            audio, timeline = compact_regions(audio, regions, SAMPLE_RATE, out=buffer)
         
         # Загрузка модели (ленивая загрузка)
-        if status_callback:
-            status_callback(20, "Загрузка модели...")
+        if cached_result is None and (timeline is None or len(audio) > 0):
+            if status_callback:
+                status_callback(20, "Загрузка модели...")
+            
+            try:
+                if tier == "fast":
+                    get_fast_scheduler()
+                else:
+                    load_model()
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке модели: {e}")
+                if status_callback:
+                    status_callback(25, f"Ошибка при загрузке модели: {str(e)}")
+                return f"Ошибка при загрузке модели: {str(e)}"
         
-        try:
-            asr_pipeline = load_model()
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке модели: {e}")
+        # Определение языка по первым 30 с речи; выход кодировщика первого фрагмента
+        # передается в распознавание, чтобы не кодировать его повторно
+        encoder_state = None
+        if auto_language and cached_result is None and (timeline is None or len(audio) > 0):
             if status_callback:
-                status_callback(25, f"Ошибка при загрузке модели: {str(e)}")
-            return f"Ошибка при загрузке модели: {str(e)}"
+                status_callback(28, "Определение языка...")
+            try:
+                head = audio if DECODE_MODE == 'array' else _read_audio_head(prepared_file)
+                whisper_language, language_probability, encoder_state = _detect_language_for_tier(tier, head)
+                logger.info(f"Определен язык: {whisper_language} (вероятность {language_probability})")
+            except Exception as e:
+                # Whisper определит язык сам для каждого фрагмента
+                logger.warning(f"Не удалось определить язык: {e}")
+                whisper_language = None
         
         # Запуск транскрипции
         if status_callback:
@@ -190,7 +937,7 @@ def transcribe_with_whisper(file_path, language_code=None, enable_timestamps=Fal
         }
         
         # Если указан язык и это не русский, явно задаем языковой код
-        if language_code and language_code.lower() not in ["ru", "ru-ru"]:
+        if language_code and not auto_language and language_code.lower() not in ["ru", "ru-ru"]:
             # Конвертируем коды языков из формата Google в формат Whisper
             lang_map = {
                 'en-US': 'en', 
@@ -208,46 +955,104 @@ def transcribe_with_whisper(file_path, language_code=None, enable_timestamps=Fal
             transcribe_params["language"] = whisper_lang
             logger.info(f"Используем язык: {whisper_lang}")
         
-        # Функция обратного вызова для отслеживания прогресса
-        def progress_callback(step, total_steps):
-            if status_callback:
-                progress = 30 + int((step / total_steps) * 60)
-                status_callback(progress, f"Распознавание: {int((step / total_steps) * 100)}%")
-        
-        # Добавляем обратный вызов для отслеживания прогресса
-        transcribe_params["callback_function"] = progress_callback
-        
-        # Проверка существования файла
-        if not os.path.exists(prepared_file):
-            error_msg = f"Ошибка: файл не существует: {prepared_file}"
-            logger.error(error_msg)
+        # Прогресс по числу распознанных фрагментов и передача их сегментов по мере готовности
+        def on_chunk(done, total, chunk_segments):
             if status_callback:
-                status_callback(30, error_msg)
-            return error_msg
+                status_callback(30 + int(done / total * 60), f"Распознано фрагментов: {done} из {total}")
+            if timeline is not None:
+                chunk_segments = timeline.remap_chunks(chunk_segments)
+            if segment_callback and not may_escalate:
+                segment_callback([{
+                    'text': segment['text'].strip(),
+                    'start': segment['timestamp'][0],
+                    'end': segment['timestamp'][1],
+                    'start_time': format_time(segment['timestamp'][0])
+                } for segment in chunk_segments], done, total)
         
-        # Проверка размера файла
-        try:
-            file_size = os.path.getsize(prepared_file)
-            if file_size == 0:
-                error_msg = "Ошибка: файл имеет нулевой размер"
+        if DECODE_MODE == 'array':
+            # Массив передается в pipeline напрямую, без повторного декодирования
+            pipeline_input = {"raw": audio, "sampling_rate": SAMPLE_RATE}
+            logger.info(f"Длительность аудио для транскрипции: {len(audio) / SAMPLE_RATE:.1f} с")
+        else:
+            # Проверка существования файла
+            if not os.path.exists(prepared_file):
+                error_msg = f"Ошибка: файл не существует: {prepared_file}"
                 logger.error(error_msg)
                 if status_callback:
                     status_callback(30, error_msg)
                 return error_msg
-            logger.info(f"Размер файла для транскрипции: {file_size} байт")
-        except Exception as e:
-            logger.warning(f"Ошибка при проверке размера файла: {e}")
+            
+            # Проверка размера файла
+            try:
+                file_size = os.path.getsize(prepared_file)
+                if file_size == 0:
+                    error_msg = "Ошибка: файл имеет нулевой размер"
+                    logger.error(error_msg)
+                    if status_callback:
+                        status_callback(30, error_msg)
+                    return error_msg
+                logger.info(f"Размер файла для транскрипции: {file_size} байт")
+            except Exception as e:
+                logger.warning(f"Ошибка при проверке размера файла: {e}")
+            
+            pipeline_input = prepared_file
         
         # Выполняем распознавание
         try:
-            result = asr_pipeline(
-                prepared_file,
-                return_timestamps=True,
-                generate_kwargs={
-                    "language": language_code[:2].lower() if language_code else "ru",
-                    "task": "transcribe"
-                }
-            )
+            if cached_result is not None:
+                result = cached_result
+            elif timeline is not None and len(audio) == 0:
+                logger.info(f"В файле {file_path} не найдена речь, распознавание пропущено")
+                result = {'text': '', 'chunks': []}
+            elif tier == "fast":
+                result = get_fast_scheduler().submit(
+                    audio,
+                    language=whisper_language,
+                    task="transcribe",
+                    on_chunk=on_chunk,
+                    encoder_state=encoder_state
+                ).result()
+                result['model'] = FAST_MODEL_NAME
+                
+                if may_escalate and result.get('confidence', 1.0) < FAST_MIN_CONFIDENCE:
+                    logger.info(f"Уверенность быстрой модели {result.get('confidence')} ниже "
+                                f"{FAST_MIN_CONFIDENCE}, перераспознавание моделью {MODEL_NAME}")
+                    if status_callback:
+                        status_callback(60, "Уточнение распознавания основной моделью...")
+                    confidence = result.get('confidence')
+                    # Язык уточняется основной моделью: низкая уверенность бывает из-за неверного языка
+                    encoder_state = None
+                    if auto_language and language_probability is not None:
+                        whisper_language, language_probability, encoder_state = \
+                            _detect_language_for_tier("large", audio)
+                    result = dict(_transcribe_large(audio, pipeline_input, whisper_language, on_chunk,
+                                                    encoder_state),
+                                  model=MODEL_NAME, fast_confidence=confidence)
+            else:
+                result = dict(_transcribe_large(audio, pipeline_input, whisper_language, on_chunk, encoder_state),
+                              model=MODEL_NAME)
+            
+            if cached_result is None and isinstance(result, dict) and whisper_language != "auto":
+                result['language'] = whisper_language
+                if language_probability is not None:
+                    result['language_probability'] = language_probability
+            
+            if timeline is not None and isinstance(result, dict) and result.get('chunks'):
+                result = dict(result, chunks=timeline.remap_chunks(result['chunks']))
+            
+            if result_cache is not None and cached_result is None:
+                result_cache.put(cache_key, result)
+            
+            if result_info is not None and isinstance(result, dict):
+                used_model = result.get('model', tier_model_name)
+                result_info.update({
+                    'model': used_model,
+                    'tier': "fast" if used_model == FAST_MODEL_NAME else "large",
+                    'confidence': result.get('fast_confidence', result.get('confidence')),
+                    'escalated': 'fast_confidence' in result,
+                    'language': result.get('language'),
+                    'language_probability': result.get('language_probability')
+                })
             
             # Отладочный вывод
             logger.info(f"Тип результата: {type(result)}")
@@ -0,0 +1,247 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+import whisper_service
+from whisper_service import format_time, SAMPLE_RATE
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Энергетический детектор речи: кадры громче порога (дБ относительно полной шкалы) считаются речью
+VAD_THRESHOLD_DB = float(os.environ.get('WHISPER_STREAM_VAD_DB', -40))
+FRAME_SECONDS = 0.03
+# Пауза, после которой фраза считается законченной (секунды)
+ENDPOINT_SILENCE = float(os.environ.get('WHISPER_STREAM_ENDPOINT_SILENCE', 0.6))
+# Как часто пересчитывать предварительный текст незаконченной фразы (секунды аудио)
+PARTIAL_INTERVAL = float(os.environ.get('WHISPER_STREAM_PARTIAL_INTERVAL', 1.0))
+# Максимальная длина фразы: должна помещаться в одно 30-секундное окно модели
+MAX_UTTERANCE = float(os.environ.get('WHISPER_STREAM_MAX_UTTERANCE', 25))
+# Аудио перед началом речи, добавляемое к фразе, чтобы не срезать первый слог
+PREROLL_SECONDS = 0.3
+# Пауза между фразами, после которой считаем, что говорит другой человек (как в detect_speakers)
+SPEAKER_PAUSE = 1.0
+
+FRAME_SAMPLES = int(FRAME_SECONDS * SAMPLE_RATE)
+READ_SIZE = 3200  # 0.1 с PCM s16le
+
+
+class StreamingSession:
+    """
+    Потоковое распознавание одной записи с микрофона
+
+    Фрагменты webm/opus от MediaRecorder передаются в постоянный процесс
+    ffmpeg, который декодирует их в PCM 16 кГц. Поток PCM проходит через
+    энергетический детектор речи: пока фраза продолжается, ее текст
+    периодически пересчитывается и отдается как предварительный; после паузы
+    (или при достижении MAX_UTTERANCE) фраза распознается окончательно и
+    буфер очищается.
+
+    События (словари):
+        {'type': 'provisional', 'text', 'start', 'start_time'}
+        {'type': 'final', 'text', 'start', 'end', 'start_time', 'speaker'}
+    """
+
+    def __init__(self, language: Optional[str] = None):
+        # 'auto': язык каждой фразы определяет сама модель
+        if language and language.lower() == "auto":
+            self.language = None
+        else:
+            self.language = language[:2].lower() if language else "ru"
+        self._process = None
+        self._pcm = None  # asyncio.Queue с массивами float32; None - конец потока
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._position = 0  # номер текущего кадра от начала записи
+
+        self._preroll = deque(maxlen=max(1, int(PREROLL_SECONDS / FRAME_SECONDS)))
+        self._utterance = []
+        self._utterance_start = 0.0
+        self._in_speech = False
+        self._silence = 0.0
+        self._since_partial = 0.0
+
+        self._speaker = 1
+        self._last_end = 0.0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запуск ffmpeg и потока чтения PCM"""
+        self._pcm = asyncio.Queue()
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg", "-loglevel", "error",
+                "-fflags", "nobuffer", "-probesize", "4096", "-analyzeduration", "0",
+                "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                "pipe:1"
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        threading.Thread(target=self._read_pcm, args=(loop,), name="stream-pcm", daemon=True).start()
+
+    def feed(self, data: bytes):
+        """Передача очередного фрагмента webm/opus в ffmpeg (блокирующий вызов)"""
+        try:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            logger.warning(f"ffmpeg не принимает данные потока: {e}")
+
+    def finish(self):
+        """Конец записи: ffmpeg дочитывает остаток и завершается"""
+        try:
+            self._process.stdin.close()
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        """Принудительная остановка ffmpeg (обрыв соединения)"""
+        if self._process and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    def _read_pcm(self, loop):
+        stdout = self._process.stdout
+        tail = b""
+        try:
+            while True:
+                data = stdout.read1(READ_SIZE)
+                if not data:
+                    break
+                data = tail + data
+                usable = len(data) - len(data) % 2
+                tail = data[usable:]
+                samples = np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+                loop.call_soon_threadsafe(self._pcm.put_nowait, samples)
+        finally:
+            try:
+                loop.call_soon_threadsafe(self._pcm.put_nowait, None)
+            except RuntimeError:
+                # Цикл событий уже остановлен - соединение закрыто
+                pass
+
+    async def events(self):
+        """Асинхронный генератор событий распознавания до конца потока"""
+        loop = asyncio.get_running_loop()
+        while True:
+            samples = await self._pcm.get()
+            if samples is None:
+                break
+
+            actions = self._consume(samples)
+            for index, (kind, audio, start) in enumerate(actions):
+                if kind == "final":
+                    event = await self._decode_final(loop, audio, start)
+                elif index == len(actions) - 1 and self._pcm.empty():
+                    # Предварительный текст считаем, только если не отстаем от потока
+                    event = await self._decode_provisional(loop, audio, start)
+                else:
+                    event = None
+                if event:
+                    yield event
+
+        # Фраза, не закончившаяся паузой до остановки записи
+        if self._in_speech:
+            event = await self._decode_final(loop, *self._cut_utterance())
+            if event:
+                yield event
+
+    def _consume(self, samples):
+        """
+        Разбиение PCM на кадры и обновление состояния детектора речи
+
+        Возвращает список действий (вид, аудио фразы, начало фразы в секундах).
+        """
+        samples = np.concatenate([self._remainder, samples])
+        count = len(samples) // FRAME_SAMPLES
+        self._remainder = samples[count * FRAME_SAMPLES:]
+        if count == 0:
+            return []
+
+        frames = samples[:count * FRAME_SAMPLES].reshape(count, FRAME_SAMPLES)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        is_speech = 20 * np.log10(rms + 1e-10) > VAD_THRESHOLD_DB
+
+        actions = []
+        for frame, speech in zip(frames, is_speech):
+            self._position += 1
+            if not self._in_speech:
+                if speech:
+                    self._in_speech = True
+                    self._utterance = list(self._preroll) + [frame]
+                    self._utterance_start = (self._position - len(self._utterance)) * FRAME_SECONDS
+                    self._silence = 0.0
+                    self._since_partial = 0.0
+                else:
+                    self._preroll.append(frame)
+                continue
+
+            self._utterance.append(frame)
+            self._silence = 0.0 if speech else self._silence + FRAME_SECONDS
+            self._since_partial += FRAME_SECONDS
+
+            if self._silence >= ENDPOINT_SILENCE or len(self._utterance) * FRAME_SECONDS >= MAX_UTTERANCE:
+                actions.append(("final", *self._cut_utterance()))
+            elif self._since_partial >= PARTIAL_INTERVAL:
+                self._since_partial = 0.0
+                actions.append(("provisional", np.concatenate(self._utterance), self._utterance_start))
+
+        return actions
+
+    def _cut_utterance(self):
+        """Завершение текущей фразы: аудио без хвоста тишины и время начала"""
+        speech_frames = len(self._utterance) - int(round(self._silence / FRAME_SECONDS))
+        audio = np.concatenate(self._utterance[:max(speech_frames, 1)])
+        start = self._utterance_start
+
+        self._in_speech = False
+        self._utterance = []
+        self._preroll.clear()
+        self._silence = 0.0
+        return audio, start
+
+    async def _decode_provisional(self, loop, audio, start):
+        # Предварительный текст все равно будет заменен, поэтому его считает быстрая модель
+        text = await loop.run_in_executor(None, self._transcribe, audio, True)
+        if not text:
+            return None
+        return {
+            'type': 'provisional',
+            'text': text,
+            'start': round(start, 2),
+            'start_time': format_time(start)
+        }
+
+    async def _decode_final(self, loop, audio, start):
+        end = start + len(audio) / SAMPLE_RATE
+        text = await loop.run_in_executor(None, self._transcribe, audio)
+        if not text:
+            return None
+
+        # Смена говорящего после длинной паузы, как в detect_speakers
+        if self._last_end > 0 and start - self._last_end > SPEAKER_PAUSE:
+            self._speaker = 2 if self._speaker == 1 else 1
+        self._last_end = end
+        return {
+            'type': 'final',
+            'text': text,
+            'start': round(start, 2),
+            'end': round(end, 2),
+            'start_time': format_time(start),
+            'speaker': f"Говорящий {self._speaker}"
+        }
+
+    def _transcribe(self, audio, fast=False):
+        started = time.time()
+        text = whisper_service.transcribe_array(audio, self.language, urgent=True, fast=fast)
+        logger.info(f"Фраза {len(audio) / SAMPLE_RATE:.1f} с распознана за {time.time() - started:.2f} с")
+        return text
@@ -0,0 +1,265 @@
+import os
+import time
+import threading
+import logging
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Callable
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Очередь событий прогресса в процессе-обработчике (задается в _init_worker)
+_events = None
+
+# Повторы перезапуска пула после сбоя: первая задержка и наибольшая (секунды)
+RESTART_RETRY_DELAY = 5.0
+RESTART_RETRY_MAX_DELAY = 60.0
+
+
+def split_cores(workers: int) -> list:
+    """Разбиение доступных ядер CPU на непересекающиеся группы по числу обработчиков"""
+    try:
+        cores = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = list(range(os.cpu_count() or 1))
+
+    workers = max(1, min(workers, len(cores)))
+    size, extra = divmod(len(cores), workers)
+    slices, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(cores[start:end])
+        start = end
+    return slices
+
+
+def _init_worker(core_slices, events, weights_dir):
+    """Инициализация процесса: привязка к ядрам, число потоков torch и предзагрузка модели"""
+    global _events
+    _events = events
+
+    cores = core_slices.get()
+    try:
+        os.sched_setaffinity(0, cores)
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Не удалось закрепить процесс за ядрами {cores}: {e}")
+
+    import torch
+    torch.set_num_threads(len(cores))
+
+    import whisper_service
+    whisper_service.shared_weights_dir = weights_dir
+    if whisper_service.WARMUP:
+        whisper_service.warmup_model()
+    else:
+        whisper_service.load_model()
+    logger.info(f"Обработчик {os.getpid()} готов: ядра {cores[0]}-{cores[-1]}, потоков torch {len(cores)}")
+
+
+def _worker_state(hold=0.0):
+    """
+    Состояние модели в процессе; заодно заставляет пул запустить и инициализировать процесс
+
+    hold задерживает ответ, чтобы уже готовый процесс не забрал все опросы
+    прогрева, пока остальные еще загружают модель.
+    """
+    import whisper_service
+    time.sleep(hold)
+    return dict(whisper_service.MODEL_STATE, pid=os.getpid())
+
+
+def _run_transcription(task_id, file_path, language, timestamps, quality, queue_depth):
+    """Выполнение транскрипции внутри процесса-обработчика; возвращает (результат, сведения о модели)"""
+    import whisper_service
+
+    def report(percent, message):
+        _events.put((task_id, 'status', (percent, message)))
+
+    def report_segments(segments, done, total):
+        _events.put((task_id, 'segments', (segments, done, total)))
+
+    result_info = {}
+    result = whisper_service.transcribe_with_whisper(
+        file_path=file_path,
+        language_code=language,
+        enable_timestamps=timestamps,
+        status_callback=report,
+        segment_callback=report_segments,
+        quality=quality,
+        queue_depth=queue_depth,
+        result_info=result_info
+    )
+    return result, result_info
+
+
+class InferencePool:
+    """
+    Пул процессов-обработчиков с общей предзагруженной моделью
+
+    Каждый процесс закреплен за своей группой ядер и использует столько же
+    потоков torch. Веса один раз экспортируются в safetensors и отображаются
+    в память всеми процессами, поэтому занимают память один раз. API-процесс
+    только распределяет задачи и пересылает события прогресса и готовые сегменты.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._warming = False
+        self._executor = None
+        self._error = None
+        self._weights_dir = None
+        self._process_count = 0
+        self.worker_states = []
+        self.restarts = 0
+
+        ctx = mp.get_context("spawn")
+        self._ctx = ctx
+        self._events = ctx.Queue()
+        threading.Thread(target=self._forward_events, name="inference-events", daemon=True).start()
+
+    def start(self):
+        """Экспорт общих весов и запуск процессов (выполняется в фоне при старте сервиса)"""
+        try:
+            import whisper_service
+            self._weights_dir = whisper_service.export_shared_weights()
+            # Потоковое распознавание выполняется в процессе API и отображает те же веса
+            whisper_service.shared_weights_dir = self._weights_dir
+
+            executor = self._create_executor()
+            self._warm_up(executor)
+        except Exception as e:
+            logger.error(f"Не удалось запустить пул обработчиков: {e}")
+            self._error = e
+        finally:
+            self._ready.set()
+
+    def _create_executor(self):
+        core_slices = self._ctx.Queue()
+        slices = split_cores(self.workers)
+        for cores in slices:
+            core_slices.put(cores)
+
+        with self._lock:
+            self._process_count = len(slices)
+            self._executor = ProcessPoolExecutor(
+                max_workers=len(slices),
+                mp_context=self._ctx,
+                initializer=_init_worker,
+                initargs=(core_slices, self._events, self._weights_dir)
+            )
+            self._warming = True
+            return self._executor
+
+    def _warm_up(self, executor):
+        """
+        Запуск всех процессов пула и ожидание, пока каждый загрузит модель
+
+        Процессы создаются по требованию, а на опрос может ответить любой
+        свободный процесс, поэтому опросы повторяются, пока не ответят
+        max_workers разных процессов (по PID).
+        """
+        expected = self._process_count
+        states = {}
+        while len(states) < expected:
+            futures = [executor.submit(_worker_state, 0.1) for _ in range(expected)]
+            for future in futures:
+                state = future.result()
+                states[state['pid']] = state
+        with self._lock:
+            if self._executor is executor:
+                self.worker_states = list(states.values())
+                self._warming = False
+                self._error = None
+        logger.info(f"Пул обработчиков запущен: {len(states)} процессов")
+
+    def _restart(self, broken_executor):
+        """Замена пула, в котором упал процесс: без этого все следующие задачи завершались бы ошибкой"""
+        with self._lock:
+            if self._executor is not broken_executor:
+                # Пул уже пересоздан другим потоком
+                return
+            self._executor = None
+            self.worker_states = []
+            self.restarts += 1
+            self._warming = True
+        logger.error("Процесс-обработчик аварийно завершился, пул обработчиков пересоздается")
+        broken_executor.shutdown(wait=False, cancel_futures=True)
+        threading.Thread(target=self._rebuild, name="inference-pool-restart", daemon=True).start()
+
+    def _rebuild(self):
+        """
+        Создание нового пула взамен упавшего; при неудаче - повторы с растущей задержкой
+
+        Пока пул не запущен, ошибка последней попытки хранится в _error:
+        is_ready() ложно, а задачи сразу завершаются ошибкой, а не уходят
+        в неработающий пул.
+        """
+        delay = RESTART_RETRY_DELAY
+        while True:
+            executor = None
+            try:
+                executor = self._create_executor()
+                self._warm_up(executor)
+                return
+            except Exception as e:
+                logger.error(f"Не удалось перезапустить пул обработчиков: {e}; повтор через {delay:.0f} с")
+                with self._lock:
+                    self._error = e
+                    if self._executor is executor:
+                        self._executor = None
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+            time.sleep(delay)
+            delay = min(delay * 2, RESTART_RETRY_MAX_DELAY)
+
+    def is_ready(self) -> bool:
+        """Все процессы запущены и модель в них загружена"""
+        return self._ready.is_set() and self._error is None and not self._warming
+
+    def transcribe(self, task_id: str, file_path: str, language: Optional[str], timestamps: bool,
+                   status_callback: Optional[Callable[[int, str], None]] = None,
+                   segment_callback: Optional[Callable[[list, int, int], None]] = None,
+                   quality: str = "auto", queue_depth: int = 0, result_info: Optional[dict] = None):
+        """Отправка задачи в свободный процесс и ожидание результата"""
+        self._ready.wait()
+        if self._error is not None:
+            raise RuntimeError(f"Пул обработчиков недоступен: {self._error}")
+
+        with self._lock:
+            executor = self._executor
+            if executor is None:
+                raise RuntimeError("Пул обработчиков перезапускается после сбоя, повторите запрос позже")
+            self._callbacks[task_id] = {'status': status_callback, 'segments': segment_callback}
+        try:
+            future = executor.submit(_run_transcription, task_id, file_path, language, timestamps,
+                                     quality, queue_depth)
+            result, info = future.result()
+            if result_info is not None:
+                result_info.update(info)
+            return result
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise RuntimeError("Процесс-обработчик аварийно завершился во время распознавания")
+        finally:
+            with self._lock:
+                self._callbacks.pop(task_id, None)
+
+    def _forward_events(self):
+        while True:
+            try:
+                task_id, kind, args = self._events.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                callback = self._callbacks.get(task_id, {}).get(kind)
+            if callback:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении статуса {task_id}: {e}")